@@ -3,7 +3,7 @@ ACE-Step Standalone App Configuration
 """
 from pathlib import Path
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Optional
+from typing import Optional, List, Dict, Any
 import argparse
 
 
@@ -48,6 +48,7 @@ def parse_args():
     
     # その他
     parser.add_argument("--no-reload", action="store_true", help="自動リロードを無効化")
+    parser.add_argument("--workers", type=int, default=None, help="ワーカープロセス数 (default: 1)")
     
     # uvicorn等から起動された場合、未知の引数が混ざることがあるため無視する
     args, _unknown = parser.parse_known_args()
@@ -65,21 +66,136 @@ class Settings(BaseSettings):
     # ACE-Step API設定
     ace_step_api_url: str = "http://localhost:8001"
     ace_step_api_key: Optional[str] = None
+    ace_step_cancel_path: str = ""  # 上流のキャンセルAPI（対応している場合のみ指定。例: /cancel_task）
     
     # LLM設定（作詞/タグ生成用）
     openai_base_url: str = "http://localhost:11434/v1"
     openai_api_key: str = "YOUR_OPENAI_API_KEY"
     openai_chat_model: str = "gemma3:latest"
+    openai_tags_model: str = ""  # タグ生成用の小さいモデル（空の場合は openai_chat_model）
+    # 複数のLLMバックエンド（JSON配列。指定時は上記の単一バックエンド設定より優先）
+    # 例: [{"base_url": "http://gpu1:11434/v1", "model": "gemma3:latest", "weight": 2},
+    #      {"base_url": "http://cpu1:11434/v1", "model": "gemma3:1b", "roles": ["tags"]}]
+    # 各要素: base_url, model, api_key, weight, roles(["lyrics", "tags"]), max_concurrency, max_queue, name
+    llm_backends: List[Dict[str, Any]] = []
+    llm_candidate_concurrency: int = 4  # 複数候補生成時の同時LLMリクエスト数
+    llm_supports_n: bool = False  # バックエンドが`n`パラメータ（複数choice）に対応しているか
+    llm_speculative_refine: bool = True  # 先行生成したタグを歌詞完成後に軽く見直すか
+    llm_max_concurrency: int = 2  # バックエンドあたりの同時completion数
+    llm_queue_size: int = 20  # 待機できるLLMリクエスト数（超過分は429）
+    llm_keep_alive: str = ""  # Ollamaのkeep_alive（例: "30m"）。空の場合は送信しない
     
     # サーバー設定
     host: str = "0.0.0.0"
     port: int = 8888
     debug: bool = True
     
+    # レスポンス設定
+    fast_json: bool = True  # orjsonがインストールされていればJSONのエンコード/デコードに使う
+    compress_min_size: int = 1024  # これ以上のAPIレスポンスをgzip/brotli圧縮（0で無効）
+    compress_gzip_level: int = 6  # gzip圧縮レベル（1〜9）
+    compress_brotli_quality: int = 4  # brotli品質（0〜11、brotliパッケージが必要）
+    
     # ポーリング設定
     poll_interval: float = 1.0  # 秒
     poll_timeout: float = 300.0  # 5分
     
+    # 上流呼び出しの耐障害設定
+    upstream_timeout: float = 10.0  # 冪等な呼び出し（query_result/health/stats/models）のデッドライン（秒）
+    upstream_audio_timeout: float = 60.0  # /v1/audio のデッドライン（秒）
+    upstream_retries: int = 2  # 冪等な呼び出しの再試行回数
+    llm_timeout: float = 120.0  # LLM呼び出しのデッドライン（秒）
+    llm_retries: int = 0  # LLM呼び出しの再試行回数
+    retry_backoff_base: float = 0.2  # 再試行の初回待機（秒）。以降は2倍ずつ（ジッター付き）
+    hedge_enabled: bool = True  # p95を超えた冪等な呼び出しに重複リクエストを送る
+    hedge_min_delay: float = 0.5  # ヘッジ送信までの最小待機（秒）
+    breaker_failure_threshold: int = 5  # 連続失敗でサーキットを開く回数
+    breaker_reset_timeout: float = 30.0  # サーキットを開いてから再試行するまでの時間（秒）
+    
+    upstream_max_connections: int = 20  # ACE-Step APIへの接続プールサイズ
+    models_cache_ttl: float = 60.0  # /v1/models の結果を再利用する時間（秒）
+    
+    # ウォームアップ設定
+    warmup_enabled: bool = True  # 起動時にLLM・ACE-Step APIをウォームアップする
+    warmup_interval: float = 240.0  # 定期ウォームアップの間隔（秒）。0で初回のみ
+    warmup_retry_interval: float = 10.0  # 初回ウォームアップ失敗時の再試行間隔（秒）
+    warmup_timeout: float = 120.0  # 1回のウォームアップのタイムアウト（秒）
+    
+    # ランダムサンプルの先行取得（/api/random_sample）
+    sample_pool_size: int = 0  # sample_type ごとに保持するサンプル数（0で無効。有効にするなら5程度）
+    sample_pool_types: List[str] = ["simple_mode"]  # 先行取得する sample_type
+    sample_pool_interval: float = 30.0  # 補充を試みる間隔（秒）
+    sample_pool_max_running: int = 0  # 上流の実行中ジョブがこれ以下のときだけ補充する
+    
+    # マイクロバッチング設定（シードのみ異なるリクエストを上流の1タスクにまとめる）
+    batch_window: float = 0.0  # 待機時間（秒）。0で無効
+    batch_max_size: int = 4  # thinking=true 時の最大 batch_size
+    batch_max_size_no_lm: int = 8  # thinking=false 時の最大 batch_size
+    
+    # プレビュー生成設定（/api/preview: 低コストで試聴してから本番生成）
+    preview_model: str = ""  # プレビューに使うモデル（turbo等。空ならサーバーデフォルト）
+    preview_duration: int = 20  # プレビューの最大長（秒）
+    preview_inference_steps: int = 8  # プレビューの推論ステップ数
+    preview_ttl: float = 86400.0  # プレビューから本番生成できる期間（秒）
+    
+    # LM強化caption/lyricsのキャッシュ設定（同じプロンプトでの再生成時にLMの書き換えを省略）
+    caption_cache_enabled: bool = False  # (prompt, lyrics, model) ごとに /format_input の結果を再利用
+    caption_cache_ttl: float = 86400.0  # 強化結果を保持する時間（秒）
+    caption_cache_temperature: float = 0.85  # /format_input の温度
+    
+    # Webhook設定
+    webhook_max_pending: int = 1000  # 完了待ちで監視できるタスク数の上限
+    webhook_queue_size: int = 1000  # 配信キューの上限
+    webhook_workers: int = 4  # 同時配信数
+    webhook_max_attempts: int = 5  # 最大配信試行回数
+    webhook_backoff_base: float = 1.0  # 再試行の初回待機（秒）。以降は2倍ずつ
+    webhook_timeout: float = 10.0  # 配信リクエストのタイムアウト（秒）
+    
+    # 生成履歴設定
+    history_enabled: bool = True  # 完了した生成結果を履歴DBに保存する
+    history_db_path: str = "data/history.db"  # 履歴DBのパス（相対パスはアプリディレクトリ基準）
+    history_queue_size: int = 10000  # インデックス待ちキューの上限
+    
+    # 音声アップロード設定（cover / repaint のソース音声）
+    upload_dir: str = "data/uploads"  # 保存先（相対パスはアプリディレクトリ基準）
+    upload_max_bytes: int = 500 * 1024 * 1024  # 1ファイルの上限
+    upload_upstream_dir: str = ""  # ACE-Step APIサーバーから見た保存先（別ホスト・コンテナの場合に指定）
+    
+    # 長尺生成設定（/api/longform: セクション並列生成と連結）
+    longform_chunk_seconds: float = 90.0  # 1チャンクにまとめるセクションの見積もり秒数の上限
+    longform_max_duration: float = 600.0  # 長尺曲の見積もり秒数の上限
+    longform_crossfade: float = 2.0  # つなぎ目のクロスフェード秒数（デフォルト）
+    longform_timeout: float = 900.0  # チャンク生成の完了待ちタイムアウト（秒）
+    longform_stitch_workers: int = 1  # 連結処理のプロセス数
+    longform_ttl: float = 86400.0  # ジョブ状態を保持する時間（秒）
+    
+    # 一括エクスポート設定（/api/export のZIPストリーミング）
+    export_max_tasks: int = 100  # 1回でエクスポートできるタスク数
+    export_concurrency: int = 4  # 先行して取得する音声ファイル数
+    export_buffer_chunks: int = 16  # 先行取得1件あたりにためるチャンク数（64KB単位）
+    
+    # トラフィックキャプチャ設定（負荷試験のリプレイ用）
+    capture_enabled: bool = False  # /api へのリクエストをJSONLに記録する
+    capture_path: str = "data/traces/traffic.jsonl"  # 記録先（相対パスはアプリディレクトリ基準）
+    capture_max_bytes: int = 50 * 1024 * 1024  # 1ファイルの上限（超えたらローテーション）
+    capture_backup_count: int = 10  # 保持するローテーション済みファイル数
+    capture_sample_rate: float = 1.0  # 記録するリクエストの割合（0〜1）
+    capture_max_field_length: int = 4000  # 記録する文字列パラメータの最大長
+    
+    # 管理者用プロファイリング設定（/api/admin）
+    admin_token: Optional[str] = None  # 未設定なら /api/admin は無効
+    profile_max_seconds: float = 60.0  # 1回のプロファイル・メモリ計測の上限（秒）
+    profile_interval: float = 0.005  # サンプリング間隔（秒）
+    profile_memory_frames: int = 10  # group_by=traceback で保存するスタックの深さ
+    
+    # マルチワーカー設定
+    workers: int = 1  # uvicornワーカープロセス数（2以上の場合は自動リロード無効）
+    shared_state_url: str = "memory://"  # 共有状態ストア（memory:// / sqlite:///data/state.db / redis://host:6379/0）
+    task_cache_ttl: float = 3600.0  # 完了済みタスク状態を共有ストアに保持する時間（秒）
+    idempotency_ttl: float = 86400.0  # Idempotency-Key とタスクIDの対応を保持する時間（秒）
+    idempotency_lock_ttl: float = 60.0  # 作成中の目印の有効期間（秒）。作成中は延長し続ける
+    idempotency_max_keys: int = 10000  # memory:// で保持するキーの上限（超えたら古い順に削除）
+    
     # 音声設定
     default_audio_duration: int = 60
     default_bpm: int = 120
@@ -129,6 +245,10 @@ class Settings(BaseSettings):
         # デバッグモード
         if args.no_reload:
             self.debug = False
+        
+        # ワーカー数
+        if args.workers:
+            self.workers = args.workers
 
 
 # 設定インスタンス
@@ -4,15 +4,27 @@ ACE-Step 1.5 Standalone Web Application
 FastAPIベースの音楽生成Webアプリ
 """
 from fastapi import FastAPI, Request
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from pathlib import Path
 import uvicorn
 import logging
 
 from config import settings, apply_cli_args
-from routers import generate, lyrics
+from routers import generate, lyrics, history, uploads, edit, export, longform, admin
+from services.webhook import webhook_dispatcher
+from services.history import generation_history
+from services.song_versions import song_versions
+from services.shared_state import shared_state
+from services.warmup import warmup_service
+from services.sample_pool import sample_pool
+from services.longform import longform_renderer
+from services.ace_step_client import ace_step_client
+from services.static_assets import StaticAssets, CachedPage
+from services.traffic_capture import TrafficCaptureMiddleware, trace_writer
+from services.compression import CompressionMiddleware
+from services.fast_json import FastJSONResponse
 
 # =============================================================================
 # Application Setup
@@ -21,7 +33,8 @@ from routers import generate, lyrics
 app = FastAPI(
     title="ACE-Step 1.5 Music Generator",
     description="AI音楽生成Webアプリケーション",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # CORS設定
@@ -33,11 +46,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 静的ファイル
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# トラフィックキャプチャ（負荷試験のリプレイ用）
+if settings.capture_enabled:
+    app.add_middleware(TrafficCaptureMiddleware)
+
+# レスポンス圧縮（gzip / brotli）
+# 後から追加したミドルウェアほど外側になるため最後に追加し、
+# キャプチャなど内側のミドルウェアには圧縮前のボディを見せる
+if settings.compress_min_size > 0:
+    app.add_middleware(CompressionMiddleware)
+
+_BASE_DIR = Path(__file__).resolve().parent
+
+# 静的ファイル（フィンガープリント付きURL・事前圧縮）
+static_assets = StaticAssets(_BASE_DIR / "static", auto_reload=settings.debug)
+static_assets.build()
 
 # テンプレート
-templates = Jinja2Templates(directory="templates")
+templates = Jinja2Templates(directory=str(_BASE_DIR / "templates"))
+templates.env.globals["asset_url"] = static_assets.url
+
+# メインページ（変数は定数のみのため一度だけレンダリング）
+index_page = CachedPage(lambda: templates.get_template("index.html").render(
+    title="ACE-Step 1.5 Music Generator"
+))
 
 
 # =============================================================================
@@ -60,12 +92,39 @@ async def log_base_urls_on_startup():
     logger.info("LLM Model: %s", settings.openai_chat_model)
 
 
+@app.on_event("startup")
+async def start_warmup():
+    # LLMモデルのロードと上流接続の確立をバックグラウンドで行う
+    warmup_service.start()
+    # ランダムサンプルの先行取得（上流がアイドルのときだけ補充）
+    sample_pool.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await warmup_service.stop()
+    await sample_pool.stop()
+    await longform_renderer.stop()
+    await webhook_dispatcher.stop()
+    await generation_history.stop()
+    await song_versions.close()
+    await shared_state.close()
+    await ace_step_client.aclose()
+    trace_writer.stop()
+
+
 # =============================================================================
 # Routers
 # =============================================================================
 
 app.include_router(generate.router)
 app.include_router(lyrics.router)
+app.include_router(history.router)
+app.include_router(uploads.router)
+app.include_router(edit.router)
+app.include_router(export.router)
+app.include_router(longform.router)
+app.include_router(admin.router)
 
 
 # =============================================================================
@@ -75,10 +134,22 @@ app.include_router(lyrics.router)
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     """メインページ"""
-    return templates.TemplateResponse("index.html", {
-        "request": request,
-        "title": "ACE-Step 1.5 Music Generator"
-    })
+    if static_assets.refresh():
+        index_page.invalidate()
+    return index_page.response(request.headers)
+
+
+@app.get("/static/{path:path}", include_in_schema=False)
+async def static_file(path: str, request: Request):
+    """静的ファイル（フィンガープリント付きURLは immutable でキャッシュ）"""
+    return static_assets.response(path, request.headers)
+
+
+@app.get("/api/ready")
+async def readiness():
+    """readiness（ウォームアップ完了後のみ200）"""
+    status = warmup_service.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
 
 
 @app.get("/api")
@@ -91,17 +162,48 @@ async def api_info():
             "generate": {
                 "POST /api/generate": "音楽生成タスク作成",
                 "GET /api/status/{task_id}": "タスクステータス確認",
+                "DELETE /api/tasks/{task_id}": "タスクのキャンセル（放棄）",
                 "POST /api/generate_and_wait": "音楽生成（完了待ち）",
+                "POST /api/preview": "低コストのプレビュー生成",
+                "POST /api/preview/{task_id}/render": "プレビューを採用して本番生成",
+                "GET /api/preview/{task_id}": "プレビューと本番生成の対応",
             },
             "lyrics": {
                 "POST /api/lyrics": "AI作詞",
                 "POST /api/tags": "タグ生成",
+                "POST /api/lyrics/analyze": "歌詞構造解析（秒数見積もり）",
                 "POST /api/full_generate": "歌詞+タグ一括生成",
+                "GET /api/llm/queue": "LLMキュー状態",
+            },
+            "history": {
+                "GET /api/search": "生成履歴の全文検索",
+            },
+            "uploads": {
+                "POST /api/uploads": "ソース音声アップロード（SHA-256で重複排除）",
+                "GET /api/uploads/{audio_id}": "アップロード済み確認",
+            },
+            "edit": {
+                "POST /api/edit/repaint": "生成済みの曲の区間リペイント",
+                "GET /api/songs/{song_id}/versions": "曲のバージョン一覧",
+            },
+            "longform": {
+                "POST /api/longform": "長尺曲の生成（セクション並列生成と連結）",
+                "GET /api/longform/{job_id}": "長尺生成ジョブの状態",
+                "GET /api/longform/{job_id}/audio": "完成した長尺曲（WAV）",
+            },
+            "export": {
+                "GET /api/export?task_ids=": "生成結果のZIP一括ダウンロード（マニフェスト付き）",
+            },
+            "admin": {
+                "GET /api/admin/profile": "サンプリングプロファイル（collapsed形式、要ADMIN_TOKEN）",
+                "GET /api/admin/memory": "メモリ確保の差分（tracemalloc、要ADMIN_TOKEN）",
             },
             "utility": {
                 "GET /api/languages": "サポート言語一覧",
                 "GET /api/key_scales": "サポートキースケール一覧",
+                "GET /api/random_sample": "ランダムなサンプルパラメータ（先行取得プールから即時）",
                 "GET /api/health": "ヘルスチェック",
+                "GET /api/ready": "readiness（ウォームアップ完了後のみ200）",
             }
         }
     }
@@ -121,11 +223,15 @@ if __name__ == "__main__":
     print(f"   ACE-Step API: {settings.ace_step_api_url}")
     print(f"   LLM API: {settings.openai_base_url}")
     print(f"   LLM Model: {settings.openai_chat_model}")
+    if settings.workers > 1:
+        print(f"   Workers: {settings.workers} (shared state: {settings.shared_state_url})")
     print()
     
     uvicorn.run(
         "main:app",
         host=settings.host,
         port=settings.port,
-        reload=settings.debug
+        # 複数ワーカーと自動リロードは併用できない
+        reload=settings.debug and settings.workers <= 1,
+        workers=settings.workers
     )
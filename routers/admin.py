@@ -0,0 +1,92 @@
+"""
+管理者用エンドポイント（稼働中プロセスのプロファイリング）
+
+ADMIN_TOKEN を設定した場合のみ有効。X-Admin-Token ヘッダーか
+Authorization: Bearer でトークンを渡す（未設定時は 404）
+"""
+import secrets
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from typing import Optional, Literal
+
+from config import settings
+from services.profiler import profiler, ProfilerBusy
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+
+# =============================================================================
+# Helpers
+# =============================================================================
+
+async def require_admin(
+    x_admin_token: Optional[str] = Header(default=None),
+    authorization: Optional[str] = Header(default=None),
+) -> None:
+    """管理者トークンの確認"""
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = x_admin_token
+    if token is None and authorization and authorization.lower().startswith("bearer "):
+        token = authorization[7:].strip()
+    if not token or not secrets.compare_digest(token.encode(), settings.admin_token.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+# =============================================================================
+# Endpoints
+# =============================================================================
+
+@router.get("/profile", dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(default=10.0, gt=0, description="サンプリング時間（秒）"),
+    mode: Literal["wall", "cpu"] = Query(default="wall", description="wall: 待機中も含む / cpu: 実行中のみ"),
+    interval: Optional[float] = Query(default=None, ge=0.001, le=1.0, description="サンプリング間隔（秒）"),
+):
+    """
+    サンプリングプロファイル
+
+    flamegraph.pl / speedscope で読める collapsed 形式（1行1スタック + サンプル数）で返す。
+    スタックの根はスレッド名、イベントループのスレッドでは続けて実行中のタスク
+    """
+    if seconds > settings.profile_max_seconds:
+        raise HTTPException(
+            status_code=400, detail=f"seconds must be <= {settings.profile_max_seconds}"
+        )
+    try:
+        result = await profiler.profile(seconds, interval or settings.profile_interval, mode)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return PlainTextResponse(
+        result["collapsed"] + "\n",
+        headers={
+            "X-Profile-Samples": str(result["samples"]),
+            "X-Profile-Idle-Samples": str(result["idle_samples"]),
+            "X-Profile-Seconds": str(result["seconds"]),
+        },
+    )
+
+
+@router.get("/memory", dependencies=[Depends(require_admin)])
+async def memory(
+    seconds: float = Query(default=10.0, gt=0, description="計測時間（秒）"),
+    limit: int = Query(default=20, ge=1, le=200, description="返す確保箇所の数"),
+    group_by: Literal["lineno", "filename", "traceback"] = Query(default="lineno", description="集計単位"),
+):
+    """
+    メモリ確保の差分（tracemalloc）
+
+    計測開始時と終了時のスナップショットを比較し、増加量の大きい確保箇所を返す
+    """
+    if seconds > settings.profile_max_seconds:
+        raise HTTPException(
+            status_code=400, detail=f"seconds must be <= {settings.profile_max_seconds}"
+        )
+    frames = settings.profile_memory_frames if group_by == "traceback" else 1
+    try:
+        return await profiler.memory_diff(seconds, limit, group_by, frames)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
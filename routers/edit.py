@@ -0,0 +1,139 @@
+"""
+部分再生成（リペイント）エンドポイント
+"""
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Any
+
+from services.ace_step_client import ace_step_client, parse_task_id, upstream_audio_path, TaskStatus
+from services.resilience import CircuitOpenError
+from services.song_versions import song_versions
+
+router = APIRouter(prefix="/api", tags=["edit"])
+
+
+# =============================================================================
+# Request/Response Models
+# =============================================================================
+
+class RepaintRequest(BaseModel):
+    """区間リペイントリクエスト"""
+    task_id: str = Field(..., description="編集元の生成タスクID")
+    result_index: int = Field(default=0, ge=0, description="編集元タスク内の結果インデックス")
+    repainting_start: float = Field(..., ge=0.0, description="リペイント開始時間（秒）")
+    repainting_end: float = Field(..., description="リペイント終了時間（秒、-1で終端まで）")
+    prompt: Optional[str] = Field(default=None, description="音楽の説明（省略時は編集元と同じ）")
+    lyrics: Optional[str] = Field(default=None, description="歌詞（省略時は編集元と同じ）")
+    thinking: bool = Field(default=True, description="LMで高品質生成")
+    model: Optional[str] = Field(default=None, description="モデル名（省略時はサーバーデフォルト）")
+    seed: Optional[int] = Field(default=None, description="シード値")
+    inference_steps: int = Field(default=60, ge=1, le=200, description="推論ステップ数")
+    guidance_scale: float = Field(default=3.0, ge=0.0, le=20.0, description="CFGスケール")
+    audio_format: str = Field(default="mp3", description="出力形式")
+
+
+class RepaintResponse(BaseModel):
+    """区間リペイントレスポンス"""
+    task_id: str  # /api/status で結果を取得
+    song_id: str
+    version: int
+    parent_version: int
+
+
+class SongVersionsResponse(BaseModel):
+    """曲のバージョン一覧"""
+    song_id: str
+    versions: List[Dict[str, Any]] = []
+
+
+# =============================================================================
+# Endpoints
+# =============================================================================
+
+@router.post("/edit/repaint", response_model=RepaintResponse)
+async def repaint_segment(request: RepaintRequest):
+    """
+    生成済みの曲の一部区間だけを作り直す
+
+    編集元の音声は上流サーバー上のファイルパスをそのまま src_audio_path に渡すため、
+    音声データの転送は発生しない。結果は同じ曲の新しいバージョンとして記録される
+    """
+    try:
+        upstream_task_id, result_slice = parse_task_id(request.task_id)
+        task_data = await ace_step_client.query_task(upstream_task_id)
+        if task_data is None or task_data.get("status") != TaskStatus.SUCCEEDED.value:
+            raise HTTPException(status_code=409, detail="Source task has not succeeded")
+
+        results = ace_step_client.parse_results(task_data, result_slice)
+        if request.result_index >= len(results):
+            raise HTTPException(status_code=404, detail="Result index out of range")
+        source = results[request.result_index]
+        if not source.get("file"):
+            raise HTTPException(status_code=404, detail="Source result has no audio file")
+
+        metas = source.get("metas") or {}
+        duration = metas.get("duration")
+        end = request.repainting_end
+        if end != -1 and end <= request.repainting_start:
+            raise HTTPException(status_code=400, detail="repainting_end must be greater than repainting_start")
+        if duration and end > duration:
+            raise HTTPException(status_code=400, detail=f"repainting_end exceeds song duration ({duration}s)")
+
+        prompt = request.prompt if request.prompt is not None else source.get("prompt") or ""
+        lyrics = request.lyrics if request.lyrics is not None else source.get("lyrics") or ""
+        params: Dict[str, Any] = {
+            "task_type": "repaint",
+            "src_audio_path": upstream_audio_path(source["file"]),
+            "repainting_start": request.repainting_start,
+            "repainting_end": end,
+            "prompt": prompt,
+            "lyrics": lyrics,
+            "thinking": request.thinking,
+            "audio_duration": int(round(duration)) if duration else 60,
+            "bpm": metas.get("bpm") if isinstance(metas.get("bpm"), int) else None,
+            "seed": request.seed,
+            "inference_steps": request.inference_steps,
+            "guidance_scale": request.guidance_scale,
+            "audio_format": request.audio_format,
+        }
+        if request.model:
+            params["model"] = request.model
+
+        result = await ace_step_client.release_task(**params)
+        task_id = result.get("data", {}).get("task_id", "")
+        if not task_id:
+            raise HTTPException(status_code=500, detail="Failed to create task")
+
+        edit = {
+            "type": "repaint",
+            "repainting_start": request.repainting_start,
+            "repainting_end": end,
+        }
+        if prompt != (source.get("prompt") or ""):
+            edit["prompt"] = prompt
+        if lyrics != (source.get("lyrics") or ""):
+            edit["lyrics"] = lyrics
+        version = await song_versions.add_edit(request.task_id, request.result_index, task_id, edit)
+
+        return RepaintResponse(
+            task_id=task_id,
+            song_id=version["song_id"],
+            version=version["version"],
+            parent_version=version["parent_version"]
+        )
+
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/songs/{song_id}/versions", response_model=SongVersionsResponse)
+async def get_song_versions(song_id: str):
+    """曲のバージョン一覧（古い順）"""
+    versions = await song_versions.list(song_id)
+    if not versions:
+        raise HTTPException(status_code=404, detail="Song not found")
+    return SongVersionsResponse(song_id=song_id, versions=versions)
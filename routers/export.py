@@ -0,0 +1,105 @@
+"""
+一括エクスポートエンドポイント
+"""
+import time
+from pathlib import PurePosixPath
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Any
+
+from config import settings
+from services.ace_step_client import ace_step_client, parse_task_id, upstream_audio_path, TaskStatus
+from services.resilience import CircuitOpenError
+from services.zip_export import ExportEntry, stream_zip
+
+router = APIRouter(prefix="/api", tags=["export"])
+
+
+# =============================================================================
+# Helpers
+# =============================================================================
+
+def _safe_name(task_id: str) -> str:
+    """アーカイブ内のファイル名に使えるタスクID"""
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in task_id)
+
+
+async def _collect_entries(task_ids: List[str]) -> tuple:
+    """
+    タスクIDから格納するファイルとスキップしたタスクを集める
+
+    Returns:
+        (entries, skipped)
+    """
+    entries: List[ExportEntry] = []
+    skipped: List[Dict[str, Any]] = []
+    for task_id in task_ids:
+        upstream_task_id, result_slice = parse_task_id(task_id)
+        task_data = await ace_step_client.query_task(upstream_task_id)
+        if task_data is None or task_data.get("status") != TaskStatus.SUCCEEDED.value:
+            status = "processing" if task_data is None or task_data.get("status") == 0 else "failed"
+            skipped.append({"task_id": task_id, "reason": status})
+            continue
+
+        for index, result in enumerate(ace_step_client.parse_results(task_data, result_slice)):
+            if not result.get("file"):
+                continue
+            path = upstream_audio_path(result["file"])
+            suffix = PurePosixPath(path).suffix or ".mp3"
+            entries.append(ExportEntry(
+                name=f"{_safe_name(task_id)}_{index + 1}{suffix}",
+                path=path,
+                metadata={
+                    "task_id": task_id,
+                    "index": index,
+                    "prompt": result.get("prompt"),
+                    "lyrics": result.get("lyrics"),
+                    "metas": result.get("metas"),
+                    "seed": result.get("seed_value"),
+                }
+            ))
+    return entries, skipped
+
+
+# =============================================================================
+# Endpoints
+# =============================================================================
+
+@router.get("/export")
+async def export_results(
+    task_ids: str = Query(..., description="エクスポートするタスクID（カンマ区切り）")
+):
+    """
+    生成結果をZIPでまとめてダウンロード
+
+    音声ファイル（無圧縮で格納）と、プロンプト・歌詞・メタ情報を記載した
+    manifest.json を1つのアーカイブとしてストリーミングで返す。
+    未完了・失敗したタスクは manifest.json の skipped に記録される
+    """
+    ids = list(dict.fromkeys(t.strip() for t in task_ids.split(",") if t.strip()))
+    if not ids:
+        raise HTTPException(status_code=400, detail="task_ids is required")
+    if len(ids) > settings.export_max_tasks:
+        raise HTTPException(status_code=400, detail=f"Too many tasks (max {settings.export_max_tasks})")
+
+    try:
+        entries, skipped = await _collect_entries(ids)
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    if not entries:
+        raise HTTPException(status_code=404, detail="No completed results to export")
+
+    manifest = {
+        "exported_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "task_ids": ids,
+        "skipped": skipped,
+    }
+    filename = time.strftime("ace_step_export_%Y%m%d_%H%M%S.zip")
+    return StreamingResponse(
+        stream_zip(entries, manifest),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
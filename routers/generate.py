@@ -1,14 +1,30 @@
 """
 音楽生成エンドポイント
 """
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Request, Response
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Set
 import asyncio
+import random
+import time
+import uuid
 import httpx
 
-from services.ace_step_client import ace_step_client, TaskResult, SUPPORTED_LANGUAGES, SUPPORTED_KEY_SCALES
+from services.ace_step_client import (
+    ace_step_client, TaskResult, TaskStatus, TaskCancelledError,
+    SUPPORTED_LANGUAGES, SUPPORTED_KEY_SCALES, parse_task_id
+)
+from services.batcher import generation_batcher
+from services.webhook import webhook_dispatcher
+from services.resilience import CircuitOpenError
+from services.history import generation_history
+from services.upload_store import upload_store
+from services.lyrics_analyzer import estimate_duration
+from services.caption_cache import caption_cache
+from services.sample_pool import sample_pool
+from services.shared_state import shared_state
+from services.idempotency import idempotency_store, IdempotencyConflict, IdempotencyInProgress
 from config import settings
 
 router = APIRouter(prefix="/api", tags=["generate"])
@@ -25,7 +41,7 @@ class GenerateRequest(BaseModel):
     thinking: bool = Field(default=True, description="LMで高品質生成")
     model: Optional[str] = Field(default=None, description="モデル名（省略時はサーバーデフォルト）")
     vocal_language: str = Field(default="ja", description="歌詞言語")
-    audio_duration: int = Field(default=60, ge=10, le=300, description="生成時間（秒）")
+    audio_duration: Optional[int] = Field(default=None, ge=10, le=300, description="生成時間（秒、省略時は歌詞構造から見積もり）")
     bpm: Optional[int] = Field(default=None, ge=30, le=300, description="テンポ")
     key_scale: Optional[str] = Field(default=None, description="調")
     time_signature: str = Field(default="4", description="拍子")
@@ -34,6 +50,13 @@ class GenerateRequest(BaseModel):
     seed: Optional[int] = Field(default=None, description="シード値")
     inference_steps: int = Field(default=60, ge=1, le=200, description="推論ステップ数")
     guidance_scale: float = Field(default=3.0, ge=0.0, le=20.0, description="CFGスケール")
+    task_type: Optional[str] = Field(default=None, pattern=r"^(text2music|cover|repaint|lego|extract|complete)$", description="タスクタイプ")
+    src_audio_id: Optional[str] = Field(default=None, description="ソース音声のID（/api/uploads の audio_id）")
+    reference_audio_id: Optional[str] = Field(default=None, description="参照音声のID（/api/uploads の audio_id）")
+    repainting_start: Optional[float] = Field(default=None, ge=0.0, description="リペイント開始時間（秒）")
+    repainting_end: Optional[float] = Field(default=None, description="リペイント終了時間（秒、-1で終端まで）")
+    callback_url: Optional[str] = Field(default=None, pattern=r"^https?://", description="完了時に結果をPOSTするURL")
+    callback_secret: Optional[str] = Field(default=None, description="コールバック署名用HMACシークレット")
 
 
 class GenerateResponse(BaseModel):
@@ -43,6 +66,37 @@ class GenerateResponse(BaseModel):
     message: str = ""
 
 
+class PreviewResponse(BaseModel):
+    """プレビュー生成レスポンス"""
+    task_id: str  # プレビューのタスクID（/api/status で結果を取得）
+    seed: int  # 本番生成でも同じシードを使う
+    status: str
+    message: str = ""
+
+
+class RenderResponse(BaseModel):
+    """本番生成レスポンス"""
+    task_id: str  # 本番生成のタスクID
+    preview_task_id: str
+    seed: int
+    status: str
+
+
+class PreviewInfoResponse(BaseModel):
+    """プレビューと本番生成の対応"""
+    preview_task_id: str
+    seed: int
+    render_task_id: Optional[str] = None
+    render_params: Dict[str, Any] = {}
+
+
+class CancelResponse(BaseModel):
+    """タスクキャンセルレスポンス"""
+    task_id: str
+    status: str  # cancelled=上流でキャンセル済み / abandoned=結果を取得しない（上流では処理され得る）
+    upstream_cancelled: bool = False
+
+
 class TaskStatusResponse(BaseModel):
     """タスクステータスレスポンス"""
     task_id: str
@@ -64,75 +118,403 @@ class GenerateAndWaitResponse(BaseModel):
     error: Optional[str] = None
 
 
+# =============================================================================
+# Helpers
+# =============================================================================
+
+def _audio_duration(request: GenerateRequest) -> int:
+    """生成時間（未指定なら歌詞構造とBPMから見積もり、歌詞がなければ60秒）"""
+    if request.audio_duration is not None:
+        return request.audio_duration
+    if request.lyrics.strip():
+        return estimate_duration(request.lyrics, request.bpm)
+    return 60
+
+
+def _release_params(request: GenerateRequest) -> Dict[str, Any]:
+    """GenerateRequestからrelease_task()のパラメータを構築"""
+    params: Dict[str, Any] = {
+        "prompt": request.prompt,
+        "lyrics": request.lyrics,
+        "thinking": request.thinking,
+        "vocal_language": request.vocal_language,
+        "audio_duration": _audio_duration(request),
+        "bpm": request.bpm,
+        "key_scale": request.key_scale,
+        "time_signature": request.time_signature,
+        "batch_size": request.batch_size,
+        "audio_format": request.audio_format,
+        "seed": request.seed,
+        "inference_steps": request.inference_steps,
+        "guidance_scale": request.guidance_scale,
+    }
+    if request.model:
+        params["model"] = request.model
+    if request.task_type:
+        params["task_type"] = request.task_type
+    for field, key in (("src_audio_id", "src_audio_path"), ("reference_audio_id", "reference_audio_path")):
+        audio_id = getattr(request, field)
+        if audio_id:
+            path = upload_store.upstream_path(audio_id.lower())
+            if path is None:
+                raise HTTPException(status_code=404, detail=f"Uploaded audio not found: {audio_id}")
+            params[key] = path
+    if request.repainting_start is not None:
+        params["repainting_start"] = request.repainting_start
+    if request.repainting_end is not None:
+        params["repainting_end"] = request.repainting_end
+    return params
+
+
+async def _create_task(params: Dict[str, Any], deadline: Optional[float] = None) -> str:
+    """
+    上流タスクを作成しタスクIDを返す
+
+    バッチングが有効な場合は互換リクエストとまとめて投入する。
+    captionキャッシュが有効な場合はLM強化済みの入力に置き換えてから投入する
+    """
+    params = await caption_cache.apply(params)
+    if generation_batcher.enabled:
+        return await generation_batcher.submit(params)
+
+    result = await ace_step_client.release_task(**params, deadline=deadline)
+    data = result.get("data", {})
+    return data.get("task_id", "")
+
+
+class ClientDisconnected(Exception):
+    """クライアントが切断した"""
+
+
+# 期限切れタスクを放棄するバックグラウンドタスク（GC防止のため保持）
+_deadline_watchers: Set[asyncio.Task] = set()
+
+
+def _request_deadline(http_request: Request) -> Optional[float]:
+    """X-Request-Deadline（UNIX時刻）または X-Request-Timeout（秒）から期限を求める"""
+    deadline = http_request.headers.get("x-request-deadline")
+    timeout = http_request.headers.get("x-request-timeout")
+    try:
+        if deadline:
+            return float(deadline)
+        if timeout:
+            return time.time() + float(timeout)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid deadline header")
+    return None
+
+
+async def _check_deadline(deadline: Optional[float]) -> None:
+    """期限に間に合わないリクエストをGPUに届く前に拒否する"""
+    if deadline is None:
+        return
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise HTTPException(status_code=504, detail="Deadline exceeded before submission")
+    try:
+        stats = (await ace_step_client.get_stats()).get("data") or {}
+    except Exception:
+        return
+    average = stats.get("avg_job_seconds") or 0
+    running = max(1, (stats.get("jobs") or {}).get("running") or 1)
+    estimated = (stats.get("queue_size") or 0) * average / running + average
+    if estimated > remaining:
+        raise HTTPException(
+            status_code=504,
+            detail=f"Deadline cannot be met (estimated {estimated:.0f}s, remaining {remaining:.0f}s)"
+        )
+
+
+async def _cancel_task(task_id: str) -> bool:
+    """
+    上流にキャンセルを転送（対応時）し、タスクを放棄済みにする
+
+    Returns:
+        上流でキャンセルされた場合True
+    """
+    upstream_task_id, result_slice = parse_task_id(task_id)
+    upstream_cancelled = False
+    if result_slice is None:
+        # バッチにまとめたタスクは他のリクエストの結果も含むため上流には転送しない
+        try:
+            upstream_cancelled = await ace_step_client.cancel_task(upstream_task_id)
+        except Exception:
+            pass
+    await ace_step_client.abandon(task_id)
+    return upstream_cancelled
+
+
+def _watch_deadline(task_id: str, deadline: float) -> None:
+    """期限を過ぎても完了していないタスクを放棄する"""
+    async def expire():
+        await asyncio.sleep(max(0.0, deadline - time.time()))
+        try:
+            upstream_task_id, _ = parse_task_id(task_id)
+            task_data = await ace_step_client.query_task(upstream_task_id)
+            if task_data is None or task_data.get("status") == TaskStatus.PROCESSING.value:
+                await _cancel_task(task_id)
+        except Exception:
+            pass
+
+    task = asyncio.create_task(expire())
+    _deadline_watchers.add(task)
+    task.add_done_callback(_deadline_watchers.discard)
+
+
+async def _wait_unless_disconnected(http_request: Request, awaitable):
+    """
+    クライアントが切断したら待機を中止する
+
+    Raises:
+        ClientDisconnected: クライアントが切断した
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=0.5)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def _idempotent(
+    scope: str,
+    http_request: Request,
+    request: BaseModel,
+    create,
+) -> tuple:
+    """
+    Idempotency-Key ヘッダーがあれば、同じキーの再送に元のタスクIDを返す
+
+    Returns:
+        (タスクID, 既存のタスクを返した場合True)
+    """
+    try:
+        return await idempotency_store.run(
+            scope, http_request.headers.get("idempotency-key"), request.model_dump(), create
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except IdempotencyInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+# 本番生成の投入ロックの有効期間（秒）。投入中は延長し続ける
+_RENDER_LOCK_TTL = 30.0
+
+
+def _preview_key(task_id: str) -> str:
+    return f"preview:{task_id}"
+
+
 # =============================================================================
 # Endpoints
 # =============================================================================
 
 @router.post("/generate", response_model=GenerateResponse)
-async def generate_music(request: GenerateRequest):
+async def generate_music(request: GenerateRequest, http_request: Request, response: Response):
     """
     音楽生成タスクを作成
     
-    タスクIDを返し、完了を待たない非同期処理
+    タスクIDを返し、完了を待たない非同期処理。
+    callback_url を指定すると完了時に /api/status と同じ形式の結果がPOSTされる。
+    X-Request-Deadline / X-Request-Timeout ヘッダーで期限を指定すると、
+    間に合わない場合は投入せずに504を返し、期限を過ぎたタスクは放棄される。
+    Idempotency-Key ヘッダーを付けた再送には、新しく投入せずに元のタスクを返す
     """
+    if request.callback_url and webhook_dispatcher.is_full:
+        raise HTTPException(status_code=429, detail="Too many pending webhook tasks")
+    deadline = _request_deadline(http_request)
+    
+    async def create() -> str:
+        await _check_deadline(deadline)
+        task_id = await _create_task(_release_params(request), deadline)
+        
+        if not task_id:
+            raise HTTPException(status_code=500, detail="Failed to create task")
+        
+        if deadline is not None:
+            _watch_deadline(task_id, deadline)
+        
+        if request.callback_url:
+            webhook_dispatcher.watch(task_id, request.callback_url, request.callback_secret)
+        return task_id
+    
     try:
-        extra_params: Dict[str, Any] = {}
-        if request.model:
-            extra_params["model"] = request.model
-
-        result = await ace_step_client.release_task(
-            prompt=request.prompt,
-            lyrics=request.lyrics,
-            thinking=request.thinking,
-            vocal_language=request.vocal_language,
-            audio_duration=request.audio_duration,
-            bpm=request.bpm,
-            key_scale=request.key_scale,
-            time_signature=request.time_signature,
-            batch_size=request.batch_size,
-            audio_format=request.audio_format,
-            seed=request.seed,
-            inference_steps=request.inference_steps,
-            guidance_scale=request.guidance_scale,
-            **extra_params
-        )
+        task_id, replayed = await _idempotent("generate", http_request, request, create)
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
         
-        data = result.get("data", {})
-        task_id = data.get("task_id", "")
+        return GenerateResponse(
+            task_id=task_id,
+            status="queued",
+            message="Existing task returned" if replayed else "Task created successfully"
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/preview", response_model=PreviewResponse)
+async def generate_preview(request: GenerateRequest, http_request: Request, response: Response):
+    """
+    低コストのプレビューを生成
+    
+    thinking=false・短い長さ・少ない推論ステップ（PREVIEW_MODEL指定時はそのモデル）で
+    すぐに試聴できる音声を作る。気に入った場合は /api/preview/{task_id}/render で
+    同じシード・元のパラメータの本番生成を行う。callback_url は本番生成に適用される
+    """
+    seed = request.seed if request.seed is not None else random.randint(0, 2**31 - 1)
+    
+    async def create() -> str:
+        render_params = {**_release_params(request), "seed": seed, "use_random_seed": False}
+        preview_params = {
+            **render_params,
+            "thinking": False,
+            "audio_duration": min(render_params["audio_duration"], settings.preview_duration),
+            "inference_steps": min(request.inference_steps, settings.preview_inference_steps),
+            "batch_size": 1,
+        }
+        if settings.preview_model:
+            preview_params["model"] = settings.preview_model
         
+        task_id = await _create_task(preview_params)
         if not task_id:
             raise HTTPException(status_code=500, detail="Failed to create task")
         
-        return GenerateResponse(
+        await shared_state.set(
+            _preview_key(task_id),
+            {
+                "seed": seed,
+                "render_params": render_params,
+                "callback_url": request.callback_url,
+                "callback_secret": request.callback_secret,
+            },
+            ttl=settings.preview_ttl
+        )
+        return task_id
+    
+    try:
+        task_id, replayed = await _idempotent("preview", http_request, request, create)
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+            entry = await shared_state.get(_preview_key(task_id))
+            if entry is not None:
+                seed = entry["seed"]
+        return PreviewResponse(
             task_id=task_id,
+            seed=seed,
             status="queued",
-            message="Task created successfully"
+            message="Existing preview task returned" if replayed else "Preview task created successfully"
         )
     
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/preview/{task_id}/render", response_model=RenderResponse)
+async def render_preview(task_id: str):
+    """
+    プレビューを採用して本番品質で生成
+    
+    同じプレビューに対して複数回呼んでも本番生成は1回だけ投入される
+    """
+    key = _preview_key(task_id)
+    entry = await shared_state.get(key)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Preview not found or expired")
+    
+    if not entry.get("render_task_id"):
+        lock_key = f"{key}:lock"
+        owner = uuid.uuid4().hex
+        if not await shared_state.set_if_absent(lock_key, owner, ttl=_RENDER_LOCK_TTL):
+            raise HTTPException(status_code=409, detail="Render is already being submitted")
+        submitted = False
+        try:
+            # 投入中はロックを延長し続ける（caption_cache や上流の待ちで長引いても失効しない）
+            async with shared_state.keep_alive(lock_key, owner, _RENDER_LOCK_TTL):
+                # ロック取得前に読んだ entry は、先に投入した呼び出しの保存前の可能性がある
+                entry = await shared_state.get(key)
+                if entry is None:
+                    raise HTTPException(status_code=404, detail="Preview not found or expired")
+                if not entry.get("render_task_id"):
+                    render_task_id = await _create_task(entry["render_params"])
+                    if not render_task_id:
+                        raise HTTPException(status_code=500, detail="Failed to create task")
+                    entry["render_task_id"] = render_task_id
+                    await shared_state.set(key, entry, ttl=settings.preview_ttl)
+                    submitted = True
+        except HTTPException:
+            raise
+        except CircuitOpenError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            if await shared_state.get(lock_key) == owner:
+                await shared_state.delete(lock_key)
+        
+        if submitted and entry.get("callback_url") and not webhook_dispatcher.is_full:
+            webhook_dispatcher.watch(render_task_id, entry["callback_url"], entry.get("callback_secret"))
+    
+    return RenderResponse(
+        task_id=entry["render_task_id"],
+        preview_task_id=task_id,
+        seed=entry["seed"],
+        status="queued"
+    )
+
+
+@router.get("/preview/{task_id}", response_model=PreviewInfoResponse)
+async def get_preview(task_id: str):
+    """プレビューのシード・本番パラメータ・本番生成のタスクIDを取得"""
+    entry = await shared_state.get(_preview_key(task_id))
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Preview not found or expired")
+    return PreviewInfoResponse(
+        preview_task_id=task_id,
+        seed=entry["seed"],
+        render_task_id=entry.get("render_task_id"),
+        render_params=entry["render_params"]
+    )
+
+
 @router.get("/status/{task_id}", response_model=TaskStatusResponse)
 async def get_task_status(task_id: str):
     """
     タスクステータスを取得
     """
     try:
-        result = await ace_step_client.query_result([task_id])
+        if await ace_step_client.is_abandoned(task_id):
+            return TaskStatusResponse(
+                task_id=task_id,
+                status=TaskStatus.FAILED.value,
+                status_text="cancelled",
+                error="Task was cancelled"
+            )
         
-        if result.get("code") != 200:
-            raise HTTPException(status_code=500, detail=result.get("error", "API error"))
+        upstream_task_id, result_slice = parse_task_id(task_id)
+        task_data = await ace_step_client.query_task(upstream_task_id)
         
-        data_list = result.get("data", [])
-        if not data_list:
+        if task_data is None:
             return TaskStatusResponse(
                 task_id=task_id,
                 status=0,
                 status_text="processing"
             )
         
-        task_data = data_list[0]
         status = task_data.get("status", 0)
         
         status_map = {0: "processing", 1: "succeeded", 2: "failed"}
@@ -142,18 +524,9 @@ async def get_task_status(task_id: str):
         error = None
         
         if status == 1:
-            # 成功
-            import json
-            result_json = task_data.get("result", "[]")
-            if isinstance(result_json, str):
-                results = json.loads(result_json)
-            else:
-                results = result_json
-            
-            # URLを追加
-            for r in results:
-                if r.get("file"):
-                    r["url"] = ace_step_client.get_audio_url(r["file"])
+            # 成功（URLを付与）
+            results = ace_step_client.parse_results(task_data, result_slice)
+            generation_history.record(task_id, results)
         
         elif status == 2:
             # 失敗
@@ -169,40 +542,42 @@ async def get_task_status(task_id: str):
     
     except HTTPException:
         raise
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/generate_and_wait", response_model=GenerateAndWaitResponse)
-async def generate_and_wait(request: GenerateAndWaitRequest):
+async def generate_and_wait(request: GenerateAndWaitRequest, http_request: Request):
     """
     音楽を生成し、完了まで待機
     
-    同期的に結果を返す
+    同期的に結果を返す。クライアントが切断した場合やタイムアウト・期限切れの場合は
+    ポーリングを止めてタスクを放棄する。
+    callback_url を指定すると /api/generate と同様に完了時に結果がPOSTされる。
+    Idempotency-Key ヘッダーを付けた再送は元のタスクの完了を待つ（切断してもタスクは
+    放棄せず、再送で引き継げる）
     """
+    if request.callback_url and webhook_dispatcher.is_full:
+        raise HTTPException(status_code=429, detail="Too many pending webhook tasks")
+    deadline = _request_deadline(http_request)
+    timeout = request.timeout
+    if deadline is not None:
+        timeout = min(timeout, deadline - time.time())
+    idempotency_key = http_request.headers.get("idempotency-key")
+    task_id = None
+    
+    async def create() -> str:
+        await _check_deadline(deadline)
+        task_id = await _create_task(_release_params(request), deadline)
+        if task_id and request.callback_url:
+            webhook_dispatcher.watch(task_id, request.callback_url, request.callback_secret)
+        return task_id
+    
     try:
-        extra_params: Dict[str, Any] = {}
-        if request.model:
-            extra_params["model"] = request.model
-
-        # タスク作成
-        result = await ace_step_client.release_task(
-            prompt=request.prompt,
-            lyrics=request.lyrics,
-            thinking=request.thinking,
-            vocal_language=request.vocal_language,
-            audio_duration=request.audio_duration,
-            bpm=request.bpm,
-            key_scale=request.key_scale,
-            time_signature=request.time_signature,
-            batch_size=request.batch_size,
-            audio_format=request.audio_format,
-            seed=request.seed,
-            **extra_params
-        )
-        
-        data = result.get("data", {})
-        task_id = data.get("task_id", "")
+        # タスク作成（同じキーの再送なら既存のタスク）
+        task_id, _ = await _idempotent("generate_and_wait", http_request, request, create)
         
         if not task_id:
             return GenerateAndWaitResponse(
@@ -211,9 +586,9 @@ async def generate_and_wait(request: GenerateAndWaitRequest):
             )
         
         # 完了を待機
-        task_results = await ace_step_client.wait_for_completion(
-            task_id=task_id,
-            timeout=request.timeout
+        task_results = await _wait_unless_disconnected(
+            http_request,
+            ace_step_client.wait_for_completion(task_id=task_id, timeout=timeout)
         )
         
         # 結果を整形
@@ -231,13 +606,30 @@ async def generate_and_wait(request: GenerateAndWaitRequest):
                 },
                 "seed": tr.seed_value
             })
+        # 履歴には整形前の結果（作成時刻・モデル・ジャンルを含む）を記録する
+        upstream_task_id, result_slice = parse_task_id(task_id)
+        task_data = await ace_step_client.query_task(upstream_task_id)
+        if task_data is not None and task_data.get("status") == TaskStatus.SUCCEEDED.value:
+            generation_history.record(task_id, ace_step_client.parse_results(task_data, result_slice))
         
         return GenerateAndWaitResponse(
             success=True,
             results=results
         )
     
+    except HTTPException:
+        raise
+    except ClientDisconnected:
+        if not idempotency_key:
+            await _cancel_task(task_id)
+        return GenerateAndWaitResponse(
+            success=False,
+            error="Client disconnected"
+        )
     except TimeoutError as e:
+        if task_id:
+            await _cancel_task(task_id)
+            await idempotency_store.forget("generate_and_wait", idempotency_key)
         return GenerateAndWaitResponse(
             success=False,
             error=str(e)
@@ -249,6 +641,22 @@ async def generate_and_wait(request: GenerateAndWaitRequest):
         )
 
 
+@router.delete("/tasks/{task_id}", response_model=CancelResponse)
+async def cancel_task(task_id: str):
+    """
+    タスクをキャンセル
+    
+    上流がキャンセルに対応していれば転送し（ACE_STEP_CANCEL_PATH）、
+    いずれの場合もタスクを放棄済みにして以降の結果取得・キャッシュ・Webhook通知を止める
+    """
+    upstream_cancelled = await _cancel_task(task_id)
+    return CancelResponse(
+        task_id=task_id,
+        status="cancelled" if upstream_cancelled else "abandoned",
+        upstream_cancelled=upstream_cancelled
+    )
+
+
 @router.get("/languages")
 async def get_languages():
     """サポート言語一覧を取得"""
@@ -302,6 +710,25 @@ async def get_stats():
         return {"success": False, "error": str(e)}
 
 
+@router.get("/random_sample")
+async def get_random_sample(sample_type: str = "simple_mode"):
+    """
+    ランダムなサンプルパラメータ（caption/lyrics/bpm等）を取得
+    
+    先行取得プール（SAMPLE_POOL_SIZE 設定時）に在庫があれば即座に返し、なければ上流に問い合わせる
+    """
+    sample = sample_pool.pop(sample_type)
+    if sample is not None:
+        return {"success": True, "pooled": True, "sample": sample}
+    try:
+        result = await ace_step_client.get_random_sample(sample_type)
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+    return {"success": True, "pooled": False, "sample": result.get("data", {})}
+
+
 @router.get("/audio")
 async def proxy_audio(path: str):
     """
@@ -309,25 +736,22 @@ async def proxy_audio(path: str):
     CORSの問題を回避するため
     """
     try:
-        # ACE-Step APIのURLを構築
-        audio_url = f"{settings.ace_step_api_url}/v1/audio?path={path}"
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.get(audio_url, timeout=60.0)
-            
-            if response.status_code != 200:
-                raise HTTPException(status_code=response.status_code, detail="Audio not found")
-            
-            # Content-Typeを取得
-            content_type = response.headers.get("content-type", "audio/mpeg")
-            
-            return StreamingResponse(
-                iter([response.content]),
-                media_type=content_type,
-                headers={
-                    "Accept-Ranges": "bytes",
-                    "Content-Length": str(len(response.content))
-                }
-            )
-    except httpx.RequestError as e:
+        response = await ace_step_client.fetch_audio(path)
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail="Audio not found")
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except (httpx.RequestError, TimeoutError) as e:
         raise HTTPException(status_code=502, detail=f"Failed to fetch audio: {str(e)}")
+    
+    # Content-Typeを取得
+    content_type = response.headers.get("content-type", "audio/mpeg")
+    
+    return StreamingResponse(
+        iter([response.content]),
+        media_type=content_type,
+        headers={
+            "Accept-Ranges": "bytes",
+            "Content-Length": str(len(response.content))
+        }
+    )
@@ -0,0 +1,54 @@
+"""
+生成履歴検索エンドポイント
+"""
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
+from typing import Optional, List, Dict, Any
+
+from services.history import generation_history
+
+router = APIRouter(prefix="/api", tags=["history"])
+
+
+# =============================================================================
+# Request/Response Models
+# =============================================================================
+
+class SearchResponse(BaseModel):
+    """履歴検索レスポンス"""
+    items: List[Dict[str, Any]] = []
+    next_cursor: Optional[str] = None
+
+
+# =============================================================================
+# Endpoints
+# =============================================================================
+
+@router.get("/search", response_model=SearchResponse)
+async def search_history(
+    q: str = Query(default="", description="検索語（prompt・歌詞・ジャンル、空白区切りでAND）"),
+    model: Optional[str] = Query(default=None, description="DiTモデル名"),
+    keyscale: Optional[str] = Query(default=None, description="キー"),
+    bpm_min: Optional[int] = Query(default=None, ge=30, le=300, description="BPM下限"),
+    bpm_max: Optional[int] = Query(default=None, ge=30, le=300, description="BPM上限"),
+    limit: int = Query(default=20, ge=1, le=100, description="件数"),
+    cursor: Optional[str] = Query(default=None, description="前回結果の next_cursor"),
+):
+    """
+    生成履歴を検索
+    
+    q を指定した場合は関連度順、省略した場合は新しい順
+    """
+    try:
+        result = await generation_history.search(
+            query=q,
+            model=model,
+            keyscale=keyscale,
+            bpm_min=bpm_min,
+            bpm_max=bpm_max,
+            limit=limit,
+            cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return SearchResponse(**result)
@@ -0,0 +1,140 @@
+"""
+長尺生成エンドポイント（セクション並列生成と連結）
+"""
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import FileResponse
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Any
+
+from config import settings
+from services.idempotency import idempotency_store, IdempotencyConflict, IdempotencyInProgress
+from services.longform import longform_renderer
+from services.resilience import CircuitOpenError
+from services.upload_store import upload_store
+
+router = APIRouter(prefix="/api", tags=["longform"])
+
+
+# =============================================================================
+# Request/Response Models
+# =============================================================================
+
+class LongformRequest(BaseModel):
+    """長尺生成リクエスト"""
+    prompt: str = Field(default="", description="音楽の説明（全セクション共通）")
+    lyrics: str = Field(..., description="歌詞（構造タグ付き。タグ単位で分割して並列生成）")
+    thinking: bool = Field(default=True, description="LMで高品質生成")
+    model: Optional[str] = Field(default=None, description="モデル名（省略時はサーバーデフォルト）")
+    vocal_language: str = Field(default="ja", description="歌詞言語")
+    bpm: Optional[int] = Field(default=None, ge=30, le=300, description="テンポ（省略時はLMで決定し全セクションで共有）")
+    key_scale: Optional[str] = Field(default=None, description="調（省略時はLMで決定し全セクションで共有）")
+    time_signature: str = Field(default="4", description="拍子")
+    seed: Optional[int] = Field(default=None, description="シード値（全セクション共通）")
+    inference_steps: int = Field(default=60, ge=1, le=200, description="推論ステップ数")
+    guidance_scale: float = Field(default=3.0, ge=0.0, le=20.0, description="CFGスケール")
+    crossfade: Optional[float] = Field(default=None, ge=0.0, le=10.0, description="つなぎ目のクロスフェード秒数")
+
+
+class LongformChunk(BaseModel):
+    """並列生成するチャンク"""
+    task_id: str
+    sections: List[str]
+    seconds: float
+
+
+class LongformResponse(BaseModel):
+    """長尺生成ジョブの状態"""
+    job_id: str
+    status: str  # rendering / stitching / succeeded / failed
+    seed: int
+    bpm: int
+    key_scale: str
+    chunks: List[LongformChunk] = []
+    audio_id: Optional[str] = None  # 完成した音声（/api/generate の src_audio_id に使える）
+    url: Optional[str] = None
+    duration: Optional[float] = None
+    seams: List[float] = []  # つなぎ目の開始秒（repaint で整える場合の目安）
+    error: Optional[str] = None
+
+
+def _response(job: Dict[str, Any]) -> LongformResponse:
+    url = f"/api/longform/{job['job_id']}/audio" if job.get("audio_id") else None
+    return LongformResponse(**job, url=url)
+
+
+# =============================================================================
+# Endpoints
+# =============================================================================
+
+@router.post("/longform", response_model=LongformResponse)
+async def create_longform(request: LongformRequest, http_request: Request, response: Response):
+    """
+    長尺曲を生成
+
+    歌詞をセクション単位のチャンクに分け、同じシード・タグ・BPM・調で全チャンクを
+    同時に投入する。完了後にクロスフェードで1つのWAVに連結する。
+    進捗は GET /api/longform/{job_id} で確認する。
+    Idempotency-Key ヘッダーを付けた再送には、新しく投入せずに元のジョブを返す
+    """
+    params: Dict[str, Any] = {
+        "prompt": request.prompt,
+        "lyrics": request.lyrics,
+        "thinking": request.thinking,
+        "vocal_language": request.vocal_language,
+        "bpm": request.bpm,
+        "key_scale": request.key_scale,
+        "time_signature": request.time_signature,
+        "seed": request.seed,
+        "inference_steps": request.inference_steps,
+        "guidance_scale": request.guidance_scale,
+    }
+    if request.model:
+        params["model"] = request.model
+    crossfade = request.crossfade if request.crossfade is not None else settings.longform_crossfade
+
+    async def create() -> str:
+        job = await longform_renderer.start(params, crossfade)
+        return job["job_id"]
+
+    try:
+        job_id, replayed = await idempotency_store.run(
+            "longform", http_request.headers.get("idempotency-key"), request.model_dump(), create
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except IdempotencyInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    job = await longform_renderer.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return _response(job)
+
+
+@router.get("/longform/{job_id}", response_model=LongformResponse)
+async def get_longform(job_id: str):
+    """長尺生成ジョブの状態"""
+    job = await longform_renderer.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _response(job)
+
+
+@router.get("/longform/{job_id}/audio")
+async def get_longform_audio(job_id: str):
+    """完成した長尺曲（WAV）"""
+    job = await longform_renderer.get(job_id)
+    if job is None or not job.get("audio_id"):
+        raise HTTPException(status_code=404, detail="Audio not ready")
+    path = upload_store.find(job["audio_id"])
+    if path is None:
+        raise HTTPException(status_code=404, detail="Audio not found")
+    return FileResponse(path, media_type="audio/wav", filename=f"longform_{job_id}.wav")
@@ -2,10 +2,13 @@
 作詞・タグ生成エンドポイント
 """
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, AsyncIterator
 
 from services.llm_service import llm_service
+from services.llm_scheduler import LLMQueueFull, Priority
+from services.lyrics_analyzer import analyze_lyrics
 
 router = APIRouter(prefix="/api", tags=["lyrics"])
 
@@ -20,6 +23,17 @@ class LyricsGenerateRequest(BaseModel):
     genre: str = Field(default="", description="ジャンル")
     language: str = Field(default="Japanese", description="言語")
     mood: str = Field(default="", description="ムード")
+    n: int = Field(default=1, ge=1, le=8, description="生成する候補数")
+    stream: bool = Field(default=False, description="候補を完了順にNDJSONでストリーミング")
+
+
+class LyricsCandidate(BaseModel):
+    """作詞候補"""
+    success: bool
+    lyrics: str = ""
+    recommended_duration: int = 90
+    parts: Dict[str, int] = {}
+    error: Optional[str] = None
 
 
 class LyricsGenerateResponse(BaseModel):
@@ -28,6 +42,7 @@ class LyricsGenerateResponse(BaseModel):
     lyrics: str = ""
     recommended_duration: int = 90
     parts: Dict[str, int] = {}
+    candidates: List[LyricsCandidate] = []
     error: Optional[str] = None
 
 
@@ -48,12 +63,54 @@ class TagsGenerateResponse(BaseModel):
     error: Optional[str] = None
 
 
+class LyricsAnalyzeRequest(BaseModel):
+    """歌詞構造解析リクエスト"""
+    lyrics: str = Field(..., description="歌詞（構造タグ付き）")
+    bpm: Optional[int] = Field(default=None, ge=30, le=300, description="テンポ（省略時は120）")
+
+
+class LyricsSection(BaseModel):
+    """歌詞セクションの見積もり"""
+    name: str
+    tag: str
+    lines: int
+    syllables: int
+    bars: int
+    seconds: float
+
+
+class LyricsAnalyzeResponse(BaseModel):
+    """歌詞構造解析レスポンス"""
+    bpm: int
+    recommended_duration: int
+    total_seconds: float
+    parts: Dict[str, int] = {}
+    sections: List[LyricsSection] = []
+
+
 class FullGenerateRequest(BaseModel):
     """歌詞+タグ一括生成リクエスト"""
     theme: str = Field(..., description="曲のテーマ/シナリオ")
     genre: str = Field(default="", description="ジャンル")
     language: str = Field(default="Japanese", description="言語")
     mood: str = Field(default="", description="ムード")
+    n: int = Field(default=1, ge=1, le=8, description="生成する候補数")
+    stream: bool = Field(default=False, description="候補を完了順にNDJSONでストリーミング")
+    speculative: bool = Field(default=False, description="歌詞生成と並行してタグを先行生成")
+
+
+class FullCandidate(BaseModel):
+    """歌詞+タグ候補"""
+    success: bool
+    lyrics: str = ""
+    recommended_duration: int = 90
+    parts: Dict[str, int] = {}
+    genre: str = ""
+    tags: str = ""
+    bpm: int = 120
+    key_scale: str = "C major"
+    tag_path: str = "sequential"
+    error: Optional[str] = None
 
 
 class FullGenerateResponse(BaseModel):
@@ -66,9 +123,52 @@ class FullGenerateResponse(BaseModel):
     tags: str = ""
     bpm: int = 120
     key_scale: str = "C major"
+    tag_path: str = "sequential"  # sequential / speculative / refined
+    candidates: List[FullCandidate] = []
     error: Optional[str] = None
 
 
+# =============================================================================
+# Helpers
+# =============================================================================
+
+def _to_candidate(model: type, result: Dict[str, Any]) -> BaseModel:
+    """LLMServiceの結果を候補モデルに変換"""
+    if "error" in result:
+        return model(success=False, error=result["error"])
+    return model(success=True, **result)
+
+
+async def _ndjson_stream(model: type, results: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """候補を1行1JSONで完了順に送出"""
+    async for result in results:
+        yield (_to_candidate(model, result).model_dump_json() + "\n").encode("utf-8")
+
+
+async def _collect(model: type, results: AsyncIterator[Dict[str, Any]]) -> List[BaseModel]:
+    """候補を全件集める"""
+    return [_to_candidate(model, result) async for result in results]
+
+
+def _queue_full(e: LLMQueueFull) -> HTTPException:
+    """LLMキュー満杯を429に変換"""
+    return HTTPException(
+        status_code=429,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+def _check_capacity(count: int) -> None:
+    """LLMキューに空きがなければ429で拒否（バックプレッシャー）"""
+    pool = llm_service.pool
+    if not pool.can_accept(count):
+        raise _queue_full(LLMQueueFull(
+            f"LLM queue is full ({pool.stats()['queued']} waiting)",
+            retry_after=max(1, int(pool.estimated_wait(Priority.BULK)))
+        ))
+
+
 # =============================================================================
 # Endpoints
 # =============================================================================
@@ -78,8 +178,38 @@ async def generate_lyrics(request: LyricsGenerateRequest):
     """
     AI作詞
     
-    テーマから歌詞を生成
+    テーマから歌詞を生成。n > 1 の場合は候補を並列生成し candidates に格納、
+    stream=true の場合は完了した候補から順にNDJSONで返す
     """
+    _check_capacity(request.n)
+    
+    if request.n > 1 or request.stream:
+        results = llm_service.iter_lyrics_candidates(
+            theme=request.theme,
+            genre=request.genre,
+            language=request.language,
+            mood=request.mood,
+            n=request.n
+        )
+        if request.stream:
+            return StreamingResponse(
+                _ndjson_stream(LyricsCandidate, results),
+                media_type="application/x-ndjson"
+            )
+        
+        candidates = await _collect(LyricsCandidate, results)
+        best = next((c for c in candidates if c.success), None)
+        if best is None:
+            return LyricsGenerateResponse(
+                success=False,
+                candidates=candidates,
+                error=candidates[0].error if candidates else "No candidates"
+            )
+        return LyricsGenerateResponse(
+            **best.model_dump(exclude={"error"}),
+            candidates=candidates
+        )
+    
     try:
         result = await llm_service.generate_lyrics(
             theme=request.theme,
@@ -95,6 +225,8 @@ async def generate_lyrics(request: LyricsGenerateRequest):
             parts=result["parts"]
         )
     
+    except LLMQueueFull as e:
+        raise _queue_full(e)
     except Exception as e:
         return LyricsGenerateResponse(
             success=False,
@@ -109,6 +241,8 @@ async def generate_tags(request: TagsGenerateRequest):
     
     歌詞/テーマからジャンル・タグを推奨
     """
+    _check_capacity(1)
+    
     try:
         result = await llm_service.generate_tags(
             lyrics=request.lyrics,
@@ -124,6 +258,8 @@ async def generate_tags(request: TagsGenerateRequest):
             key_scale=result["key_scale"]
         )
     
+    except LLMQueueFull as e:
+        raise _queue_full(e)
     except Exception as e:
         return TagsGenerateResponse(
             success=False,
@@ -136,14 +272,46 @@ async def full_generate(request: FullGenerateRequest):
     """
     歌詞+タグ一括生成
     
-    テーマから歌詞とタグを一括生成
+    テーマから歌詞とタグを一括生成（n / stream は /api/lyrics と同様）。
+    speculative=true の場合はタグを歌詞と並行生成し、tag_path で経路を返す
     """
+    _check_capacity(request.n)
+    
+    if request.n > 1 or request.stream:
+        results = llm_service.iter_full_candidates(
+            theme=request.theme,
+            genre=request.genre,
+            language=request.language,
+            mood=request.mood,
+            n=request.n,
+            speculative=request.speculative
+        )
+        if request.stream:
+            return StreamingResponse(
+                _ndjson_stream(FullCandidate, results),
+                media_type="application/x-ndjson"
+            )
+        
+        candidates = await _collect(FullCandidate, results)
+        best = next((c for c in candidates if c.success), None)
+        if best is None:
+            return FullGenerateResponse(
+                success=False,
+                candidates=candidates,
+                error=candidates[0].error if candidates else "No candidates"
+            )
+        return FullGenerateResponse(
+            **best.model_dump(exclude={"error"}),
+            candidates=candidates
+        )
+    
     try:
         result = await llm_service.generate_full(
             theme=request.theme,
             genre=request.genre,
             language=request.language,
-            mood=request.mood
+            mood=request.mood,
+            speculative=request.speculative
         )
         
         return FullGenerateResponse(
@@ -154,11 +322,36 @@ async def full_generate(request: FullGenerateRequest):
             genre=result["genre"],
             tags=result["tags"],
             bpm=result["bpm"],
-            key_scale=result["key_scale"]
+            key_scale=result["key_scale"],
+            tag_path=result["tag_path"]
         )
     
+    except LLMQueueFull as e:
+        raise _queue_full(e)
     except Exception as e:
         return FullGenerateResponse(
             success=False,
             error=str(e)
         )
+
+
+@router.post("/lyrics/analyze", response_model=LyricsAnalyzeResponse)
+async def analyze(request: LyricsAnalyzeRequest):
+    """
+    歌詞構造解析
+    
+    構造タグと各行の音節数（日本語はモーラ）から、BPMに応じたセクション別の秒数と
+    推奨生成時間を見積もる。LLMを使わないため即座に返る
+    """
+    return LyricsAnalyzeResponse(**analyze_lyrics(request.lyrics, request.bpm))
+
+
+@router.get("/llm/queue")
+async def get_llm_queue():
+    """
+    LLMキューの状態
+    
+    全バックエンド合計の実行中/待機中の件数、優先度別の待ち順（今投入した場合の順番、
+    0=即時実行）と待ち時間の概算、バックエンド別の内訳・レイテンシ・サーキット状態を返す
+    """
+    return llm_service.pool.stats()
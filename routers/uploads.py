@@ -0,0 +1,72 @@
+"""
+音声アップロードエンドポイント（cover / repaint のソース音声）
+"""
+from fastapi import APIRouter, HTTPException, Query, Request
+from pydantic import BaseModel
+from typing import Optional
+
+from config import settings
+from services.upload_store import upload_store, UploadTooLarge
+
+router = APIRouter(prefix="/api", tags=["uploads"])
+
+
+# =============================================================================
+# Request/Response Models
+# =============================================================================
+
+class UploadResponse(BaseModel):
+    """アップロードレスポンス"""
+    audio_id: str  # SHA-256（/api/generate の src_audio_id / reference_audio_id に指定）
+    size: int
+    format: str
+    deduplicated: bool = False
+
+
+# =============================================================================
+# Endpoints
+# =============================================================================
+
+@router.get("/uploads/{audio_id}", response_model=UploadResponse)
+async def get_upload(audio_id: str):
+    """
+    アップロード済みか確認（プリフライト）
+
+    クライアントはファイルのSHA-256を計算して問い合わせ、200ならアップロードを省略できる
+    """
+    path = upload_store.find(audio_id.lower())
+    if path is None:
+        raise HTTPException(status_code=404, detail="Audio not found")
+    return UploadResponse(**upload_store.info(path))
+
+
+@router.post("/uploads", response_model=UploadResponse)
+async def upload_audio(
+    request: Request,
+    filename: str = Query(..., description="元のファイル名（拡張子で形式を判定）"),
+    sha256: Optional[str] = Query(default=None, description="ファイルのSHA-256（指定時は検証し、保存済みなら受信を省略）"),
+):
+    """
+    音声ファイルをアップロード
+
+    リクエストボディにファイルの生データを送る（チャンク転送可）。
+    受信しながらディスクへ書き込むため、大きなWAVでもメモリを消費しない。
+    sha256 が保存済みのファイルと一致する場合はボディを読まずに返すので、
+    `Expect: 100-continue` を付けて送ればデータ自体が送信されない。
+    """
+    if sha256:
+        existing = upload_store.find(sha256.lower())
+        if existing is not None:
+            return UploadResponse(**upload_store.info(existing), deduplicated=True)
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > settings.upload_max_bytes:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {settings.upload_max_bytes} bytes")
+
+    try:
+        result = await upload_store.save(request.stream(), filename, expected_sha256=sha256)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return UploadResponse(**result)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+JSONマイクロベンチマーク - ステータスポーリングのホットパスを比較する
+
+実際の /query_result レスポンスに近いペイロード（歌詞・プロンプト・メタ情報付きの
+結果×batch_size）を使い、次の処理の1回あたりの時間を表示する。
+
+    - 上流の result 文字列のデコード（json / orjson）
+    - TaskStatusResponse 相当のレスポンスのエンコード（json / orjson）
+    - レスポンスの圧縮（gzip / brotli）とサイズ
+
+使い方:
+    python scripts/bench_json.py
+    python scripts/bench_json.py --batch-size 4 --lyrics-lines 60 --number 2000
+"""
+import argparse
+import gzip
+import json
+import sys
+import timeit
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import settings
+from services.compression import brotli
+from services.fast_json import orjson
+
+
+_LYRIC_LINES = [
+    "夏の海に響く声 君と歩いた砂浜で",
+    "Love is all we need tonight, shining like the stars",
+    "きらめく波の向こうに まだ見ぬ明日が待ってる",
+]
+
+
+def make_results(batch_size: int, lyrics_lines: int) -> List[Dict[str, Any]]:
+    """query_result の result に相当する結果リスト"""
+    lyrics = "[verse]\n" + "\n".join(_LYRIC_LINES[i % len(_LYRIC_LINES)] for i in range(lyrics_lines))
+    return [
+        {
+            "file": f"/v1/audio?path=/outputs/20260101/{'0' * 31}{i}.mp3",
+            "status": 1,
+            "create_time": 1767225600,
+            "prompt": "J-pop, upbeat, bright synth, electric guitar, female vocal, summer, 128 BPM",
+            "lyrics": lyrics,
+            "metas": {
+                "bpm": 128,
+                "duration": 180.0,
+                "genres": "pop",
+                "keyscale": "C major",
+                "timesignature": "4",
+            },
+            "generation_info": "steps=60, cfg=3.0, scheduler=euler, lm=5Hz-1.7B",
+            "seed_value": str(1234567 + i),
+        }
+        for i in range(batch_size)
+    ]
+
+
+def bench(label: str, fn: Callable[[], Any], number: int) -> None:
+    seconds = min(timeit.repeat(fn, number=number, repeat=3)) / number
+    print(f"  {label:<24} {seconds * 1e6:9.1f} us")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="JSONエンコード/デコードと圧縮のベンチマーク")
+    parser.add_argument("--batch-size", type=int, default=2, help="1タスクあたりの結果数")
+    parser.add_argument("--lyrics-lines", type=int, default=40, help="歌詞の行数")
+    parser.add_argument("--number", type=int, default=1000, help="1計測あたりの実行回数")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    results = make_results(args.batch_size, args.lyrics_lines)
+    result_json = json.dumps(results, ensure_ascii=False)
+    response = {
+        "task_id": "abc123",
+        "status": 1,
+        "status_text": "succeeded",
+        "results": [{**r, "url": f"http://localhost:8001{r['file']}"} for r in results],
+        "error": None,
+    }
+    body = json.dumps(response, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    print(f"result: {len(result_json.encode('utf-8'))} bytes, response: {len(body)} bytes")
+
+    print("decode upstream result")
+    bench("json.loads", lambda: json.loads(result_json), args.number)
+    if orjson is not None:
+        bench("orjson.loads", lambda: orjson.loads(result_json), args.number)
+
+    print("encode response")
+    bench(
+        "json.dumps",
+        lambda: json.dumps(response, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+        args.number
+    )
+    if orjson is not None:
+        bench("orjson.dumps", lambda: orjson.dumps(response), args.number)
+
+    print("compress response")
+    level = settings.compress_gzip_level
+    bench(f"gzip (level {level})", lambda: gzip.compress(body, compresslevel=level, mtime=0), args.number)
+    print(f"  {'':<24} {len(gzip.compress(body, compresslevel=level, mtime=0)):9d} bytes")
+    if brotli is not None:
+        quality = settings.compress_brotli_quality
+        bench(f"brotli (quality {quality})", lambda: brotli.compress(body, quality=quality), args.number)
+        print(f"  {'':<24} {len(brotli.compress(body, quality=quality)):9d} bytes")
+
+    if orjson is None:
+        print("\norjson is not installed (pip install orjson)")
+    if brotli is None:
+        print("brotli is not installed (pip install brotli)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+一括生成CLI - JSONL/CSVのジョブ一覧から楽曲をまとめて生成する
+
+各ジョブは「作詞・タグ生成（LLM）→ 音楽生成（ACE-Step）→ ダウンロード」の
+ステージを順に通る。ステージごとに並列数を指定でき、音楽生成は上流キューの
+空き（/v1/stats）と同時投入数の上限の範囲で投入し続ける。
+
+進捗は出力ディレクトリの checkpoint.jsonl に追記され、中断後に同じコマンドを
+再実行すると、完了済みジョブはスキップし、投入済みタスクは再投入せずに
+完了を待つ。
+
+使い方:
+    python scripts/bulk_generate.py jobs.jsonl -o output/
+    python scripts/bulk_generate.py jobs.csv -o output/ --max-inflight 8 --llm-concurrency 2
+
+ジョブの項目（JSONLのキー / CSVの列名）:
+    id              ジョブID（省略時は行番号）
+    theme           テーマ（lyrics が空の場合はLLMで作詞）
+    genre, mood     作詞・タグ生成のヒント
+    language        作詞言語（default: Japanese）
+    prompt          タグ（空の場合はLLMで生成）
+    lyrics          歌詞
+    その他          audio_duration, bpm, key_scale, seed, thinking, model などは
+                    そのまま release_task に渡す
+"""
+import argparse
+import asyncio
+import csv
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Optional, List, Dict, Any
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import settings
+from services.ace_step_client import ace_step_client
+from services.llm_service import llm_service
+from services.llm_scheduler import Priority
+
+
+# LLMステージだけで使う項目（release_task には渡さない）
+LLM_FIELDS = ("id", "theme", "genre", "mood", "language")
+
+# CSVの文字列を変換する項目
+INT_FIELDS = ("audio_duration", "bpm", "seed", "batch_size", "inference_steps")
+FLOAT_FIELDS = ("guidance_scale",)
+BOOL_FIELDS = ("thinking",)
+
+
+# =============================================================================
+# Jobs / Checkpoint
+# =============================================================================
+
+def _coerce(job: Dict[str, Any]) -> Dict[str, Any]:
+    """CSV由来の文字列を型変換し、空欄を除く"""
+    result = {}
+    for key, value in job.items():
+        if value is None or value == "":
+            continue
+        if isinstance(value, str):
+            if key in INT_FIELDS:
+                value = int(value)
+            elif key in FLOAT_FIELDS:
+                value = float(value)
+            elif key in BOOL_FIELDS:
+                value = value.strip().lower() in ("1", "true", "yes", "on")
+        result[key] = value
+    return result
+
+
+def load_jobs(path: Path) -> List[Dict[str, Any]]:
+    """JSONL/CSVからジョブを読み込む"""
+    if path.suffix.lower() == ".csv":
+        with path.open(encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with path.open(encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    jobs = []
+    seen = set()
+    for index, row in enumerate(rows, start=1):
+        job = _coerce(row)
+        job["id"] = str(job.get("id", index))
+        if job["id"] in seen:
+            raise ValueError(f"Duplicate job id: {job['id']}")
+        seen.add(job["id"])
+        jobs.append(job)
+    return jobs
+
+
+class Checkpoint:
+    """ジョブごとの進捗を追記型JSONLに保存"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.states: Dict[str, Dict[str, Any]] = {}
+        if path.exists():
+            with path.open(encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # 書き込み途中で落ちた最終行
+                    self.states.setdefault(record["id"], {}).update(record["state"])
+        self._file = path.open("a", encoding="utf-8")
+
+    def get(self, job_id: str) -> Dict[str, Any]:
+        return self.states.get(job_id, {})
+
+    def update(self, job_id: str, **state) -> None:
+        self.states.setdefault(job_id, {}).update(state)
+        self._file.write(json.dumps({"id": job_id, "state": state}, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+# =============================================================================
+# Stats
+# =============================================================================
+
+class StageStats:
+    """ステージ別のレイテンシ集計"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.failures: Dict[str, int] = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.latencies.setdefault(stage, []).append(seconds)
+
+    def fail(self, stage: str) -> None:
+        self.failures[stage] = self.failures.get(stage, 0) + 1
+
+    def report(self, elapsed: float, completed: int, skipped: int) -> str:
+        lines = [
+            f"elapsed: {elapsed:.1f}s  completed: {completed}  skipped: {skipped}  "
+            f"failed: {sum(self.failures.values())}",
+            f"throughput: {completed / elapsed * 60:.2f} jobs/min" if elapsed > 0 else "",
+            f"{'stage':<10}{'count':>7}{'mean':>9}{'p50':>9}{'p95':>9}{'max':>9}{'failed':>8}",
+        ]
+        for stage in ("llm", "generate", "download"):
+            samples = sorted(self.latencies.get(stage, []))
+            if not samples and not self.failures.get(stage):
+                continue
+            if samples:
+                mean = sum(samples) / len(samples)
+                p50 = samples[len(samples) // 2]
+                p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+                values = f"{mean:>8.1f}s{p50:>8.1f}s{p95:>8.1f}s{samples[-1]:>8.1f}s"
+            else:
+                values = f"{'-':>9}" * 4
+            lines.append(f"{stage:<10}{len(samples):>7}{values}{self.failures.get(stage, 0):>8}")
+        return "\n".join(line for line in lines if line)
+
+
+# =============================================================================
+# Pipeline
+# =============================================================================
+
+class BulkRunner:
+    """ステージ間をキューでつないだ一括生成パイプライン"""
+
+    def __init__(self, args: argparse.Namespace, checkpoint: Checkpoint):
+        self.args = args
+        self.checkpoint = checkpoint
+        self.stats = StageStats()
+        self.out_dir: Path = args.output
+        self._capacity_lock = asyncio.Lock()
+        self.completed = 0
+
+    def log(self, job_id: str, message: str) -> None:
+        print(f"[{time.strftime('%H:%M:%S')}] {job_id}: {message}", flush=True)
+
+    async def run(self, jobs: List[Dict[str, Any]]) -> None:
+        llm_queue: asyncio.Queue = asyncio.Queue()
+        generate_queue: asyncio.Queue = asyncio.Queue()
+        download_queue: asyncio.Queue = asyncio.Queue()
+
+        for job in jobs:
+            state = self.checkpoint.get(job["id"])
+            if state.get("status") == "failed" and self.args.retry_failed:
+                # 作詞結果は残し、投入からやり直す
+                self.checkpoint.update(job["id"], status="pending", task_id=None, error=None)
+            if state.get("status") == "downloaded":
+                continue
+            if state.get("status") == "completed":
+                download_queue.put_nowait(job)
+            elif state.get("task_id"):
+                generate_queue.put_nowait(job)
+            elif state.get("status") != "failed":
+                llm_queue.put_nowait(job)
+
+        stages = [
+            (llm_queue, self._llm_stage, self.args.llm_concurrency, generate_queue),
+            (generate_queue, self._generate_stage, self.args.max_inflight, download_queue),
+            (download_queue, self._download_stage, self.args.download_concurrency, None),
+        ]
+        workers = [
+            asyncio.create_task(self._worker(queue, handler, next_queue))
+            for queue, handler, concurrency, next_queue in stages
+            for _ in range(max(1, concurrency))
+        ]
+        try:
+            # 前段が空になってから後段を待つ（前段から後段へ追加され得るため）
+            for queue, _, _, _ in stages:
+                await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _worker(self, queue: asyncio.Queue, handler, next_queue: Optional[asyncio.Queue]) -> None:
+        while True:
+            job = await queue.get()
+            try:
+                if await handler(job) and next_queue is not None:
+                    next_queue.put_nowait(job)
+            finally:
+                queue.task_done()
+
+    def _fail(self, job: Dict[str, Any], stage: str, error: Exception) -> bool:
+        self.stats.fail(stage)
+        self.checkpoint.update(job["id"], status="failed", error=f"{stage}: {error}")
+        self.log(job["id"], f"{stage} failed: {error}")
+        return False
+
+    async def _llm_stage(self, job: Dict[str, Any]) -> bool:
+        """歌詞・タグが揃っていなければLLMで補完"""
+        state = self.checkpoint.get(job["id"])
+        lyrics = state.get("lyrics") or job.get("lyrics", "")
+        prompt = state.get("prompt") or job.get("prompt", "")
+        if lyrics and prompt:
+            self.checkpoint.update(job["id"], status="ready", lyrics=lyrics, prompt=prompt)
+            return True
+        if not lyrics and not job.get("theme"):
+            return self._fail(job, "llm", ValueError("theme or lyrics is required"))
+
+        start = time.monotonic()
+        hints = {
+            "genre": job.get("genre", ""),
+            "language": job.get("language", "Japanese"),
+            "mood": job.get("mood", ""),
+        }
+        try:
+            if not lyrics:
+                result = await llm_service.generate_full(
+                    theme=job["theme"],
+                    speculative=self.args.speculative,
+                    priority=Priority.BULK,
+                    **hints
+                )
+                lyrics = result.get("lyrics", "")
+            else:
+                result = await llm_service.generate_tags(
+                    lyrics=lyrics,
+                    theme=job.get("theme", ""),
+                    priority=Priority.BULK,
+                    **hints
+                )
+        except Exception as e:
+            return self._fail(job, "llm", e)
+
+        self.stats.record("llm", time.monotonic() - start)
+        # ジョブで指定がなければLLMの推奨値を使う
+        suggested = {
+            "audio_duration": result.get("recommended_duration"),
+            "bpm": result.get("bpm"),
+            "key_scale": result.get("key_scale"),
+        }
+        self.checkpoint.update(
+            job["id"],
+            status="ready",
+            lyrics=lyrics,
+            prompt=prompt or result.get("tags", ""),
+            suggested={k: v for k, v in suggested.items() if v}
+        )
+        self.log(job["id"], "lyrics/tags ready")
+        return True
+
+    async def _wait_for_capacity(self) -> None:
+        """上流キューに空きができるまで待つ（/v1/stats が取れない場合は待たない）"""
+        while True:
+            try:
+                stats = (await ace_step_client.get_stats()).get("data") or {}
+            except Exception:
+                return
+            size = stats.get("queue_size")
+            maxsize = stats.get("queue_maxsize")
+            if size is None or not maxsize or size < maxsize - self.args.queue_headroom:
+                return
+            await asyncio.sleep(settings.poll_interval)
+
+    async def _submit(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        上流キューの空きを確認して投入する
+
+        投入が終わるまでロックを保持し、複数のワーカーが同じ /v1/stats の値を見て
+        キューの上限を超えて投入しないようにする
+        """
+        async with self._capacity_lock:
+            await self._wait_for_capacity()
+            return await ace_step_client.release_task(**params)
+
+    async def _generate_stage(self, job: Dict[str, Any]) -> bool:
+        """タスクを投入（投入済みなら再利用）して完了を待つ"""
+        state = self.checkpoint.get(job["id"])
+        task_id = state.get("task_id")
+        start = time.monotonic()
+        try:
+            if not task_id:
+                params = {k: v for k, v in job.items() if k not in LLM_FIELDS}
+                params["prompt"] = state.get("prompt") or job.get("prompt", "")
+                params["lyrics"] = state.get("lyrics") or job.get("lyrics", "")
+                for key, value in state.get("suggested", {}).items():
+                    params.setdefault(key, value)
+                response = await self._submit(params)
+                if response.get("code") != 200:
+                    raise Exception(response.get("error") or "release_task failed")
+                task_id = response["data"]["task_id"]
+                self.checkpoint.update(job["id"], status="submitted", task_id=task_id)
+                self.log(job["id"], f"submitted {task_id}")
+            else:
+                self.log(job["id"], f"resuming {task_id}")
+
+            results = await ace_step_client.wait_for_completion(
+                task_id, timeout=self.args.task_timeout
+            )
+        except Exception as e:
+            return self._fail(job, "generate", e)
+
+        self.stats.record("generate", time.monotonic() - start)
+        self.checkpoint.update(
+            job["id"],
+            status="completed",
+            results=[{"file": r.file, "seed": r.seed_value} for r in results]
+        )
+        return True
+
+    async def _download_stage(self, job: Dict[str, Any]) -> bool:
+        """結果の音声ファイルを保存"""
+        state = self.checkpoint.get(job["id"])
+        start = time.monotonic()
+        files = []
+        try:
+            for index, result in enumerate(state.get("results", []), start=1):
+                query = parse_qs(urlparse(result["file"]).query)
+                path = query.get("path", [result["file"]])[0]
+                suffix = Path(path).suffix or ".mp3"
+                target = self.out_dir / f"{job['id']}_{index}{suffix}"
+                response = await ace_step_client.fetch_audio(path)
+                target.write_bytes(response.content)
+                files.append(target.name)
+        except Exception as e:
+            return self._fail(job, "download", e)
+
+        self.stats.record("download", time.monotonic() - start)
+        self.checkpoint.update(job["id"], status="downloaded", files=files)
+        self.completed += 1
+        self.log(job["id"], f"saved {', '.join(files)}")
+        return True
+
+
+# =============================================================================
+# Main
+# =============================================================================
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="ACE-Step 一括生成")
+    parser.add_argument("jobs", type=Path, help="ジョブ一覧（.jsonl / .csv）")
+    parser.add_argument("-o", "--output", type=Path, default=Path("bulk_output"), help="出力ディレクトリ")
+    parser.add_argument("--llm-concurrency", type=int, default=settings.llm_max_concurrency,
+                        help="作詞・タグ生成の並列数")
+    parser.add_argument("--max-inflight", type=int, default=4,
+                        help="上流に同時投入するタスク数の上限（音楽生成ステージの並列数）")
+    parser.add_argument("--queue-headroom", type=int, default=0,
+                        help="上流キューに残しておく空き枠（他の利用者向け）")
+    parser.add_argument("--download-concurrency", type=int, default=4, help="ダウンロードの並列数")
+    parser.add_argument("--task-timeout", type=float, default=settings.poll_timeout,
+                        help="1タスクの完了待ちタイムアウト（秒）")
+    parser.add_argument("--speculative", action="store_true",
+                        help="作詞と並行してテーマからタグを先行生成する（LLM_SPECULATIVE_REFINE で見直しの有無を指定）")
+    parser.add_argument("--retry-failed", action="store_true", help="失敗済みジョブを再実行")
+    parser.add_argument("--api-url", type=str, default=None, help="ACE-Step API URL")
+    return parser.parse_args()
+
+
+async def main() -> int:
+    args = parse_args()
+    if args.api_url:
+        ace_step_client.base_url = args.api_url.rstrip("/")
+
+    jobs = load_jobs(args.jobs)
+    args.output.mkdir(parents=True, exist_ok=True)
+    checkpoint = Checkpoint(args.output / "checkpoint.jsonl")
+    skipped = sum(1 for job in jobs if checkpoint.get(job["id"]).get("status") == "downloaded")
+    failed = sum(1 for job in jobs if checkpoint.get(job["id"]).get("status") == "failed")
+    print(f"{len(jobs)} jobs ({skipped} already done) -> {args.output}", flush=True)
+    if failed and not args.retry_failed:
+        print(f"{failed} jobs failed in a previous run (use --retry-failed to rerun)", flush=True)
+
+    runner = BulkRunner(args, checkpoint)
+    start = time.monotonic()
+    try:
+        await runner.run(jobs)
+    finally:
+        checkpoint.close()
+        await ace_step_client.aclose()
+
+    print()
+    print(runner.stats.report(time.monotonic() - start, runner.completed, skipped))
+    return 1 if runner.stats.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
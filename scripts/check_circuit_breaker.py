@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+サーキットブレーカーの動作確認
+
+half-open の試行がキャンセルされても試行枠が返却され、次の呼び出しで
+closed に戻れる（half_open のまま固まらない）ことを確認する。
+
+使い方:
+    python scripts/check_circuit_breaker.py
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.resilience import BackendGuard, CircuitOpenError  # noqa: E402
+
+
+def open_circuit(guard: BackendGuard) -> None:
+    """閾値まで失敗させ、reset_timeout 経過済み（half-open）にする"""
+    for _ in range(guard.breaker.failure_threshold):
+        guard.breaker.record_failure()
+    guard.breaker._opened_at -= guard.breaker.reset_timeout
+
+
+async def cancelled_trial() -> bool:
+    guard = BackendGuard("check")
+    open_circuit(guard)
+    started = asyncio.Event()
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(60)
+
+    trial = asyncio.create_task(guard.call("slow", slow, timeout=120))
+    await started.wait()
+    try:
+        await guard.call("other", slow, timeout=120)
+        return False  # 試行中は2本目を通さない
+    except CircuitOpenError:
+        pass
+    trial.cancel()
+    await asyncio.gather(trial, return_exceptions=True)
+
+    async def ok():
+        return "ok"
+
+    result = await guard.call("ok", ok, timeout=1)
+    return result == "ok" and guard.breaker.state == "closed"
+
+
+async def timed_out_trial() -> bool:
+    guard = BackendGuard("check")
+    open_circuit(guard)
+
+    async def slow():
+        await asyncio.sleep(60)
+
+    try:
+        await asyncio.wait_for(guard.call("slow", slow, timeout=120), 0.05)
+    except asyncio.TimeoutError:
+        pass
+    return guard.breaker.state == "half_open" and not guard.breaker._trial_in_flight
+
+
+CASES = [
+    ("cancelled half-open trial", cancelled_trial),
+    ("outer wait_for timeout on trial", timed_out_trial),
+]
+
+
+async def main() -> int:
+    failures = 0
+    for name, case in CASES:
+        ok = await case()
+        failures += not ok
+        print(f"{'OK ' if ok else 'NG '} {name}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
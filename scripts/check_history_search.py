@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+生成履歴検索の動作確認
+
+一時DBにサンプルの曲を記録し、trigram FTS では検索できない短い語（1〜2文字）を含めて
+期待どおりにヒットするかを確認する。
+
+使い方:
+    python scripts/check_history_search.py
+"""
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.history import GenerationHistory  # noqa: E402
+
+
+SONGS = [
+    {
+        "file": "/v1/audio?path=/o/a.mp3",
+        "prompt": "J-POP, 爽やか, piano",
+        "lyrics": "[Verse]\n夏空に溶けていく\n恋のうた",
+        "metas": {"genres": "pop", "bpm": 120, "keyscale": "C major"},
+        "dit_model": "turbo",
+        "create_time": 200,
+    },
+    {
+        "file": "/v1/audio?path=/o/b.mp3",
+        "prompt": "rock, guitar, 100% energy",
+        "lyrics": "[Chorus]\n走り出せ",
+        "metas": {"genres": "rock", "bpm": 150, "keyscale": "E minor"},
+        "dit_model": "base",
+        "create_time": 100,
+    },
+]
+
+CASES = [
+    ("恋", ["a"]),
+    ("夏空", ["a"]),
+    ("夏空に", ["a"]),
+    ("夏空 恋", ["a"]),
+    ("夏空に 走り", []),
+    ("ro", ["b"]),
+    ("%", ["b"]),
+    ("guitar", ["b"]),
+    ("", ["a", "b"]),
+]
+
+
+async def main() -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        history = GenerationHistory(Path(tmp) / "history.db")
+        await asyncio.to_thread(
+            history._write, [history._to_row(f"task-{i}", song) for i, song in enumerate(SONGS)]
+        )
+
+        failures = 0
+        for query, expected in CASES:
+            result = await history.search(query)
+            found = [Path(item["file"]).stem[-1] for item in result["items"]]
+            ok = sorted(found) == sorted(expected)
+            failures += not ok
+            print(f"{'OK ' if ok else 'NG '} {query!r}: {found} (expected {expected})")
+        await history.stop()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
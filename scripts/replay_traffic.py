@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+トラフィックリプレイ - キャプチャしたトレースを別インスタンスに対して再生する
+
+CAPTURE_ENABLED=true で記録した JSONL（ローテーション済みファイルを含む）を
+時刻順に読み込み、元の間隔（--speed で倍速）でリクエストを再送する。
+/api/generate などが返したタスクIDは再生先で発行された新しいIDに置き換えるため、
+ステータスのポーリングも元の挙動どおりに再現される。
+
+終了時にルート別のレイテンシ（p50/p95/p99）とエラー率を表示する。
+
+使い方:
+    python scripts/replay_traffic.py data/traces/traffic.jsonl* --target http://localhost:8889
+    python scripts/replay_traffic.py data/traces/*.jsonl* --target http://staging:8888 --speed 4
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+import httpx
+
+
+# 再生時に取り除くパラメータ
+REPLAY_DROP_FIELDS = ("callback_url", "callback_secret")
+
+# タスクIDを置き換えるパスパラメータ・クエリ・ボディの項目（task_ids はカンマ区切り）
+TASK_ID_PATH_PARAM = "{task_id}"
+TASK_ID_FIELDS = ("task_id", "task_ids")
+
+
+def load_traces(paths: List[Path], routes: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """トレースを読み込み、時刻順に並べる"""
+    traces = []
+    for path in paths:
+        with path.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    trace = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if routes and trace.get("route") not in routes:
+                    continue
+                traces.append(trace)
+    traces.sort(key=lambda t: t["ts"])
+    return traces
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class Replayer:
+    """トレースを元のタイミングで再送する"""
+
+    def __init__(self, target: str, speed: float, timeout: float, concurrency: int):
+        self.client = httpx.AsyncClient(
+            base_url=target.rstrip("/"),
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=concurrency)
+        )
+        self.speed = speed
+        self.task_ids: Dict[str, str] = {}  # 元のタスクID -> 再生先のタスクID
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.lag: List[float] = []
+
+    def _map_ids(self, value: str) -> str:
+        """タスクID（カンマ区切り可）を再生先のIDに置き換える"""
+        return ",".join(self.task_ids.get(part, part) for part in value.split(","))
+
+    def _rewrite_path(self, route: str, path: str) -> str:
+        """ルートの {task_id} に当たるパスセグメントだけを置き換える"""
+        if TASK_ID_PATH_PARAM not in route:
+            return path
+        segments = path.split("/")
+        for i, template in enumerate(route.split("/")):
+            if template == TASK_ID_PATH_PARAM and i < len(segments):
+                segments[i] = self.task_ids.get(segments[i], segments[i])
+        return "/".join(segments)
+
+    def _rewrite_fields(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        rewritten = dict(values)
+        for key in TASK_ID_FIELDS:
+            value = rewritten.get(key)
+            if isinstance(value, str):
+                rewritten[key] = self._map_ids(value)
+            elif isinstance(value, list):
+                rewritten[key] = [self.task_ids.get(v, v) if isinstance(v, str) else v for v in value]
+        return rewritten
+
+    async def send(self, trace: Dict[str, Any]) -> None:
+        route = f"{trace['method']} {trace['route']}"
+        path = self._rewrite_path(trace["route"], trace["path"])
+        params = self._rewrite_fields(trace.get("query", {}))
+        body = trace.get("body")
+        if isinstance(body, dict):
+            # 本番のWebhook受信先へ通知が飛ばないようにする
+            body = {k: v for k, v in body.items() if k not in REPLAY_DROP_FIELDS}
+            body = self._rewrite_fields(body)
+        start = time.monotonic()
+        try:
+            response = await self.client.request(
+                trace["method"], path, params=params or None, json=body
+            )
+            failed = response.status_code >= 400
+            if trace.get("task_id") and not failed:
+                try:
+                    new_id = response.json().get("task_id")
+                except ValueError:
+                    new_id = None
+                if new_id:
+                    self.task_ids[trace["task_id"]] = new_id
+        except httpx.HTTPError:
+            failed = True
+        self.latencies.setdefault(route, []).append(time.monotonic() - start)
+        if failed:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    async def run(self, traces: List[Dict[str, Any]]) -> float:
+        if not traces:
+            return 0.0
+        origin = traces[0]["ts"]
+        start = time.monotonic()
+        tasks = []
+        for trace in traces:
+            due = (trace["ts"] - origin) / self.speed
+            delay = due - (time.monotonic() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                self.lag.append(-delay)
+            tasks.append(asyncio.create_task(self.send(trace)))
+        await asyncio.gather(*tasks)
+        await self.client.aclose()
+        return time.monotonic() - start
+
+    def report(self, elapsed: float) -> str:
+        total = sum(len(v) for v in self.latencies.values())
+        errors = sum(self.errors.values())
+        lines = [
+            f"requests: {total}  errors: {errors} ({errors / max(total, 1):.1%})  "
+            f"elapsed: {elapsed:.1f}s  rate: {total / elapsed if elapsed else 0:.2f} req/s",
+        ]
+        if self.lag:
+            lines.append(f"schedule lag p95: {percentile(self.lag, 0.95) * 1000:.0f}ms")
+        lines.append(f"{'route':<40}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'errors':>9}")
+        for route in sorted(self.latencies):
+            samples = self.latencies[route]
+            error_rate = self.errors.get(route, 0) / len(samples)
+            lines.append(
+                f"{route:<40}{len(samples):>7}"
+                f"{percentile(samples, 0.5) * 1000:>7.0f}ms"
+                f"{percentile(samples, 0.95) * 1000:>7.0f}ms"
+                f"{percentile(samples, 0.99) * 1000:>7.0f}ms"
+                f"{error_rate:>9.1%}"
+            )
+        return "\n".join(lines)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="キャプチャしたトラフィックの再生")
+    parser.add_argument("traces", type=Path, nargs="+", help="トレースファイル（JSONL）")
+    parser.add_argument("--target", type=str, default="http://localhost:8888", help="再生先のURL")
+    parser.add_argument("--speed", type=float, default=1.0, help="再生速度の倍率（2=2倍の負荷）")
+    parser.add_argument("--route", action="append", dest="routes", help="再生するルート（複数指定可）")
+    parser.add_argument("--limit", type=int, default=None, help="再生するリクエスト数の上限")
+    parser.add_argument("--timeout", type=float, default=600.0, help="1リクエストのタイムアウト（秒）")
+    parser.add_argument("--concurrency", type=int, default=200, help="同時接続数の上限")
+    return parser.parse_args()
+
+
+async def main() -> int:
+    args = parse_args()
+    traces = load_traces(args.traces, args.routes)[:args.limit]
+    if not traces:
+        print("No traces to replay")
+        return 1
+    span = traces[-1]["ts"] - traces[0]["ts"]
+    print(f"Replaying {len(traces)} requests ({span:.0f}s captured) at {args.speed}x -> {args.target}", flush=True)
+
+    replayer = Replayer(args.target, args.speed, args.timeout, args.concurrency)
+    elapsed = await replayer.run(traces)
+    print(replayer.report(elapsed))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -3,14 +3,19 @@ ACE-Step 1.5 REST API Client Service
 
 ACE-Step APIと通信するためのクライアント
 """
-import json
+import os
 import time
 import httpx
+from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
-from typing import Optional, List, Dict, Any, Callable
+from typing import Optional, List, Dict, Any, Callable, Tuple, AsyncIterator
 from enum import Enum
+from urllib.parse import urlparse, parse_qs
 
 from config import settings
+from services.resilience import BackendGuard
+from services.shared_state import shared_state
+from services import fast_json
 
 
 class TaskStatus(Enum):
@@ -51,6 +56,44 @@ SUPPORTED_KEY_SCALES = [
     "B major", "B minor"
 ]
 
+# 複数リクエストを1つの上流タスクにまとめた場合のタスクID区切り文字
+# 形式: "{上流task_id}~{offset}~{count}"
+BATCHED_TASK_ID_SEPARATOR = "~"
+
+
+def make_batched_task_id(task_id: str, offset: int, count: int) -> str:
+    """上流タスク内の結果範囲を指すタスクIDを生成"""
+    sep = BATCHED_TASK_ID_SEPARATOR
+    return f"{task_id}{sep}{offset}{sep}{count}"
+
+
+def parse_task_id(task_id: str) -> Tuple[str, Optional[slice]]:
+    """
+    タスクIDを上流タスクIDと結果範囲に分解
+    
+    Returns:
+        (上流task_id, 結果のslice。通常のタスクIDの場合はNone)
+    """
+    parts = task_id.rsplit(BATCHED_TASK_ID_SEPARATOR, 2)
+    if len(parts) == 3 and parts[1].isdigit() and parts[2].isdigit():
+        offset, count = int(parts[1]), int(parts[2])
+        return parts[0], slice(offset, offset + count)
+    return task_id, None
+
+
+class TaskCancelledError(Exception):
+    """タスクがキャンセル（放棄）された"""
+
+
+def upstream_audio_path(file: str) -> str:
+    """
+    結果の file（"/v1/audio?path=..."）から上流サーバー上のファイルパスを取り出す
+    
+    src_audio_path に渡せば、音声を転送せずに上流で再利用できる
+    """
+    query = parse_qs(urlparse(file).query)
+    return query.get("path", [file])[0]
+
 
 @dataclass
 class AudioMetadata:
@@ -120,6 +163,9 @@ class AceStepClient:
         self.api_key = api_key or settings.ace_step_api_key
         self.timeout = timeout
         self._client = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._guard = BackendGuard("ACE-Step API")
+        self._models_cache: Optional[Tuple[float, Dict[str, Any]]] = None
     
     def _get_client(self) -> httpx.Client:
         """HTTPクライアントを取得"""
@@ -128,8 +174,22 @@ class AceStepClient:
         return self._client
     
     async def _get_async_client(self) -> httpx.AsyncClient:
-        """非同期HTTPクライアントを取得"""
-        return httpx.AsyncClient(timeout=self.timeout)
+        """非同期HTTPクライアントを取得（接続プールはプロセス内で共有）"""
+        if self._async_client is None or self._async_client.is_closed:
+            self._async_client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=settings.upstream_max_connections,
+                    max_keepalive_connections=settings.upstream_max_connections
+                )
+            )
+        return self._async_client
+    
+    async def aclose(self) -> None:
+        """接続プールを閉じる"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
     
     def _build_headers(self) -> Dict[str, str]:
         """リクエストヘッダーを構築"""
@@ -138,6 +198,58 @@ class AceStepClient:
             headers["Authorization"] = f"Bearer {self.api_key}"
         return headers
     
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        json_body: Optional[Dict[str, Any]] = None,
+        params: Optional[Dict[str, Any]] = None,
+        idempotent: bool = False,
+        timeout: Optional[float] = None,
+        headers: Optional[Dict[str, str]] = None,
+        hedge: Optional[bool] = None
+    ) -> httpx.Response:
+        """
+        耐障害ポリシー（デッドライン・再試行・ヘッジ・サーキットブレーカー）付きでリクエスト
+        
+        Args:
+            method: HTTPメソッド
+            path: エンドポイントパス
+            json_body: JSONボディ
+            params: クエリパラメータ
+            idempotent: True=再試行とヘッジを許可
+            timeout: デッドライン（省略時は冪等な呼び出しなら upstream_timeout）
+            headers: 追加のリクエストヘッダー
+            hedge: ヘッジの有無（省略時は idempotent と同じ。大きなレスポンスでは False）
+        
+        Returns:
+            レスポンス（2xx以外は httpx.HTTPStatusError）
+        """
+        if hedge is None:
+            hedge = idempotent
+        if timeout is None:
+            timeout = settings.upstream_timeout if idempotent else self.timeout
+        
+        async def send() -> httpx.Response:
+            client = await self._get_async_client()
+            response = await client.request(
+                method,
+                f"{self.base_url}{path}",
+                json=json_body,
+                params=params,
+                headers={**self._build_headers(), **(headers or {})}
+            )
+            response.raise_for_status()
+            return response
+        
+        return await self._guard.call(
+            path,
+            send,
+            timeout=timeout,
+            retries=settings.upstream_retries if idempotent else 0,
+            hedge=hedge
+        )
+    
     async def release_task(
         self,
         prompt: str = "",
@@ -153,6 +265,7 @@ class AceStepClient:
         seed: Optional[int] = None,
         inference_steps: int = 60,
         guidance_scale: float = 3.0,
+        deadline: Optional[float] = None,
         **kwargs
     ) -> Dict[str, Any]:
         """
@@ -172,6 +285,7 @@ class AceStepClient:
             seed: シード値
             inference_steps: 推論ステップ数（多いほど高品質・遅い）
             guidance_scale: CFGスケール（高いほどプロンプトに忠実）
+            deadline: クライアントの期限（UNIX時刻）。X-Request-Deadline ヘッダーで上流に伝える
         
         Returns:
             タスク情報（task_id等）
@@ -199,14 +313,9 @@ class AceStepClient:
         # 追加パラメータ
         payload.update(kwargs)
         
-        async with await self._get_async_client() as client:
-            response = await client.post(
-                f"{self.base_url}/release_task",
-                json=payload,
-                headers=self._build_headers()
-            )
-            response.raise_for_status()
-            return response.json()
+        headers = {"X-Request-Deadline": f"{deadline:.3f}"} if deadline else None
+        response = await self._request("POST", "/release_task", json_body=payload, headers=headers)
+        return fast_json.loads(response.content)
     
     async def query_result(self, task_ids: List[str]) -> Dict[str, Any]:
         """
@@ -220,14 +329,81 @@ class AceStepClient:
         """
         payload = {"task_id_list": task_ids}
         
-        async with await self._get_async_client() as client:
-            response = await client.post(
-                f"{self.base_url}/query_result",
-                json=payload,
-                headers=self._build_headers()
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self._request("POST", "/query_result", json_body=payload, idempotent=True)
+        return fast_json.loads(response.content)
+    
+    async def query_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        単一タスクの状態を取得（ワーカープロセス間で共有）
+        
+        完了済みタスクは共有ストアから返す。処理中のタスクはポーリングのリースを
+        取得したワーカーだけが上流へ問い合わせ、他のワーカーは共有された最新状態を読む。
+        
+        Args:
+            task_id: 上流タスクID
+        
+        Returns:
+            query_result の data 要素（まだ状態が得られない場合はNone）
+        """
+        if await self.is_abandoned(task_id):
+            # 放棄済みのタスクは上流に問い合わせず、結果も取得・キャッシュしない
+            return {"task_id": task_id, "status": TaskStatus.FAILED.value, "result": "Task was cancelled"}
+        
+        key = f"task:{task_id}"
+        cached = await shared_state.get(key)
+        if cached is not None and cached.get("status", 0) != TaskStatus.PROCESSING.value:
+            return cached
+        
+        lease = await shared_state.set_if_absent(
+            f"poll:{task_id}", os.getpid(), ttl=settings.poll_interval
+        )
+        if not lease:
+            return cached
+        
+        result = await self.query_result([task_id])
+        if result.get("code") != 200:
+            raise Exception(f"API error: {result.get('error')}")
+        
+        data_list = result.get("data", [])
+        if not data_list:
+            return None
+        
+        task_data = data_list[0]
+        finished = task_data.get("status", 0) != TaskStatus.PROCESSING.value
+        if task_data.get("status") == TaskStatus.SUCCEEDED.value and isinstance(task_data.get("result"), str):
+            # 結果JSONはキャッシュ前に一度だけパースし、以降のポーリングで再パースしない
+            task_data["result"] = fast_json.loads(task_data["result"])
+        await shared_state.set(
+            key,
+            task_data,
+            ttl=settings.task_cache_ttl if finished else settings.poll_timeout
+        )
+        return task_data
+    
+    async def cancel_task(self, task_id: str) -> bool:
+        """
+        上流タスクのキャンセルを要求（ace_step_cancel_path 設定時のみ）
+        
+        Returns:
+            上流がキャンセルを受け付けた場合True（未対応の場合False）
+        """
+        if not settings.ace_step_cancel_path:
+            return False
+        try:
+            await self._request("POST", settings.ace_step_cancel_path, json_body={"task_id": task_id})
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code in (404, 405, 501):
+                return False
+            raise
+        return True
+    
+    async def abandon(self, task_id: str) -> None:
+        """タスクを放棄済みにする（以降のポーリング・結果取得を止める）"""
+        await shared_state.set(f"abandoned:{task_id}", True, ttl=settings.task_cache_ttl)
+        await shared_state.delete(f"task:{task_id}")
+    
+    async def is_abandoned(self, task_id: str) -> bool:
+        return bool(await shared_state.get(f"abandoned:{task_id}"))
     
     async def wait_for_completion(
         self,
@@ -247,9 +423,14 @@ class AceStepClient:
         
         Returns:
             タスク結果リスト
+        
+        Raises:
+            TimeoutError: タイムアウト
+            TaskCancelledError: タスクが放棄された
         """
         poll_interval = poll_interval or settings.poll_interval
         timeout = timeout or settings.poll_timeout
+        upstream_task_id, result_slice = parse_task_id(task_id)
         
         start_time = time.time()
         
@@ -258,26 +439,25 @@ class AceStepClient:
             if elapsed > timeout:
                 raise TimeoutError(f"Task {task_id} timed out after {timeout} seconds")
             
-            result = await self.query_result([task_id])
-            
-            if result.get("code") != 200:
-                raise Exception(f"API error: {result.get('error')}")
+            if result_slice is not None and await self.is_abandoned(task_id):
+                raise TaskCancelledError(f"Task {task_id} was cancelled")
             
-            data_list = result.get("data", [])
-            if not data_list:
+            task_data = await self.query_task(upstream_task_id)
+            if task_data is None:
                 await self._sleep(poll_interval)
                 continue
             
-            task_data = data_list[0]
             status = task_data.get("status", 0)
             
             if status == TaskStatus.SUCCEEDED.value:
                 # 成功
                 result_json = task_data.get("result", "[]")
                 if isinstance(result_json, str):
-                    results = json.loads(result_json)
+                    results = fast_json.loads(result_json)
                 else:
                     results = result_json
+                if result_slice is not None:
+                    results = results[result_slice]
                 
                 return [
                     TaskResult.from_dict(r, self.base_url)
@@ -286,6 +466,8 @@ class AceStepClient:
             
             elif status == TaskStatus.FAILED.value:
                 # 失敗
+                if await self.is_abandoned(upstream_task_id):
+                    raise TaskCancelledError(f"Task {task_id} was cancelled")
                 error_msg = task_data.get("result", "Unknown error")
                 raise Exception(f"Task failed: {error_msg}")
             
@@ -324,14 +506,8 @@ class AceStepClient:
             "temperature": temperature
         }
         
-        async with await self._get_async_client() as client:
-            response = await client.post(
-                f"{self.base_url}/format_input",
-                json=payload,
-                headers=self._build_headers()
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self._request("POST", "/format_input", json_body=payload)
+        return fast_json.loads(response.content)
     
     async def get_random_sample(self, sample_type: str = "simple_mode") -> Dict[str, Any]:
         """
@@ -345,44 +521,123 @@ class AceStepClient:
         """
         payload = {"sample_type": sample_type}
         
-        async with await self._get_async_client() as client:
-            response = await client.post(
-                f"{self.base_url}/create_random_sample",
-                json=payload,
-                headers=self._build_headers()
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self._request("POST", "/create_random_sample", json_body=payload)
+        return fast_json.loads(response.content)
     
     async def health_check(self) -> Dict[str, Any]:
         """ヘルスチェック"""
-        async with await self._get_async_client() as client:
-            response = await client.get(
-                f"{self.base_url}/health",
-                headers=self._build_headers()
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self._request("GET", "/health", idempotent=True)
+        return fast_json.loads(response.content)
     
     async def get_stats(self) -> Dict[str, Any]:
         """サーバー統計情報を取得"""
-        async with await self._get_async_client() as client:
-            response = await client.get(
-                f"{self.base_url}/v1/stats",
-                headers=self._build_headers()
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self._request("GET", "/v1/stats", idempotent=True)
+        return fast_json.loads(response.content)
     
-    async def get_models(self) -> Dict[str, Any]:
-        """利用可能なモデル一覧を取得"""
-        async with await self._get_async_client() as client:
-            response = await client.get(
-                f"{self.base_url}/v1/models",
-                headers=self._build_headers()
-            )
-            response.raise_for_status()
-            return response.json()
+    async def get_models(self, use_cache: bool = True) -> Dict[str, Any]:
+        """
+        利用可能なモデル一覧を取得
+        
+        Args:
+            use_cache: True=settings.models_cache_ttl 秒以内の取得結果を再利用
+        """
+        if use_cache and self._models_cache is not None:
+            fetched_at, cached = self._models_cache
+            if time.monotonic() - fetched_at < settings.models_cache_ttl:
+                return cached
+        
+        response = await self._request("GET", "/v1/models", idempotent=True)
+        result = fast_json.loads(response.content)
+        self._models_cache = (time.monotonic(), result)
+        return result
+    
+    async def fetch_audio(self, path: str) -> httpx.Response:
+        """
+        音声ファイルを取得
+        
+        再試行はするがヘッジはしない（ファイル全体の重複ダウンロードで帯域が倍になるため）
+        
+        Args:
+            path: 上流サーバー上のファイルパス（/v1/audio の path パラメータ）
+        
+        Returns:
+            レスポンス（2xx以外は httpx.HTTPStatusError）
+        """
+        return await self._request(
+            "GET",
+            "/v1/audio",
+            params={"path": path},
+            idempotent=True,
+            timeout=settings.upstream_audio_timeout,
+            hedge=False
+        )
+    
+    @asynccontextmanager
+    async def stream_audio(self, path: str) -> AsyncIterator[httpx.Response]:
+        """
+        音声ファイルをストリーミング取得（ファイル全体をメモリに載せない）
+        
+        再試行・ヘッジは行わず、サーキットブレーカーのみ適用する
+        
+        Args:
+            path: 上流サーバー上のファイルパス（/v1/audio の path パラメータ）
+        
+        Yields:
+            ボディ未読のレスポンス（aiter_bytes() で読む。2xx以外は httpx.HTTPStatusError）
+        """
+        breaker = self._guard.breaker
+        trial = breaker.before_call()
+        client = await self._get_async_client()
+        try:
+            async with client.stream(
+                "GET",
+                f"{self.base_url}/v1/audio",
+                params={"path": path},
+                headers=self._build_headers(),
+                timeout=settings.upstream_audio_timeout
+            ) as response:
+                if response.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                trial = False
+                response.raise_for_status()
+                yield response
+        except httpx.RequestError:
+            breaker.record_failure()
+            raise
+        finally:
+            # 応答前にキャンセルされた場合（ZIPのダウンロード中断など）は試行枠だけ返す
+            if trial:
+                breaker.release_trial()
+    
+    def parse_results(
+        self,
+        task_data: Dict[str, Any],
+        result_slice: Optional[slice] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        query_result のタスクデータから結果リストを取り出す
+        
+        Args:
+            task_data: query_result の data 要素（status=1）
+            result_slice: parse_task_id() で得た結果範囲
+        
+        Returns:
+            結果リスト（各要素に url を付与）
+        """
+        result_json = task_data.get("result", "[]")
+        if isinstance(result_json, str):
+            results = fast_json.loads(result_json)
+        else:
+            results = result_json
+        if result_slice is not None:
+            results = results[result_slice]
+        
+        for r in results:
+            if r.get("file"):
+                r["url"] = self.get_audio_url(r["file"])
+        return results
     
     def get_audio_url(self, file_path: str) -> str:
         """音声ファイルのURLを取得"""
@@ -0,0 +1,183 @@
+"""
+Audio Stitch - WAVファイルのクロスフェード連結
+
+長尺生成（/api/longform）で並列に生成したセクションを1つのWAVにつなぐ。
+プロセスプールで実行する前提の同期関数で、標準ライブラリのみを使う。
+重なり部分以外はブロック単位でコピーし、ファイル全体をメモリに載せない。
+
+対応形式: 16bit PCM / 32bit float（WAVE_FORMAT_EXTENSIBLE を含む）
+"""
+import struct
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import List, Dict, Any, BinaryIO
+
+
+_PCM = 1
+_IEEE_FLOAT = 3
+_EXTENSIBLE = 0xFFFE
+
+_COPY_BLOCK = 1024 * 1024
+
+
+@dataclass
+class WavInfo:
+    """WAVファイルのフォーマットとデータ位置"""
+    fmt_chunk: bytes  # fmt チャンクの本体（出力にそのまま書く）
+    format_tag: int
+    channels: int
+    sample_rate: int
+    bits: int
+    data_offset: int
+    data_size: int
+
+    @property
+    def frame_size(self) -> int:
+        return self.channels * self.bits // 8
+
+    @property
+    def frames(self) -> int:
+        return self.data_size // self.frame_size
+
+    @property
+    def typecode(self) -> str:
+        """array のタイプコード"""
+        return "h" if self.format_tag == _PCM else "f"
+
+
+def read_wav_info(f: BinaryIO) -> WavInfo:
+    """RIFFヘッダーを読み、fmt / data チャンクの位置を返す"""
+    riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+    if riff != b"RIFF" or wave != b"WAVE":
+        raise ValueError("Not a WAV file")
+
+    fmt_chunk = b""
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            raise ValueError("WAV data chunk not found")
+        chunk_id, size = struct.unpack("<4sI", header)
+        if chunk_id == b"fmt ":
+            fmt_chunk = f.read(size + (size & 1))[:size]
+        elif chunk_id == b"data":
+            if not fmt_chunk:
+                raise ValueError("WAV fmt chunk not found")
+            format_tag, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", fmt_chunk[:16])
+            if format_tag == _EXTENSIBLE and len(fmt_chunk) >= 26:
+                # SubFormat GUID の先頭2バイトが実際のフォーマット
+                format_tag = struct.unpack("<H", fmt_chunk[24:26])[0]
+            if (format_tag, bits) not in ((_PCM, 16), (_IEEE_FLOAT, 32)):
+                raise ValueError(f"Unsupported WAV format (tag={format_tag}, bits={bits})")
+            return WavInfo(
+                fmt_chunk=fmt_chunk,
+                format_tag=format_tag,
+                channels=channels,
+                sample_rate=sample_rate,
+                bits=bits,
+                data_offset=f.tell(),
+                data_size=size,
+            )
+        else:
+            f.seek(size + (size & 1), 1)
+
+
+def _read_samples(f: BinaryIO, info: WavInfo, start_frame: int, frames: int) -> array:
+    f.seek(info.data_offset + start_frame * info.frame_size)
+    samples = array(info.typecode)
+    samples.frombytes(f.read(frames * info.frame_size))
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples
+
+
+def _write_samples(out: BinaryIO, samples: array) -> None:
+    if sys.byteorder == "big":
+        samples = array(samples.typecode, samples)
+        samples.byteswap()
+    out.write(samples.tobytes())
+
+
+def _copy_frames(f: BinaryIO, out: BinaryIO, info: WavInfo, start_frame: int, end_frame: int) -> None:
+    f.seek(info.data_offset + start_frame * info.frame_size)
+    remaining = (end_frame - start_frame) * info.frame_size
+    while remaining > 0:
+        block = f.read(min(_COPY_BLOCK, remaining))
+        if not block:
+            break
+        out.write(block)
+        remaining -= len(block)
+
+
+def _crossfade(tail: array, head: array, channels: int) -> array:
+    """tail をフェードアウト、head をフェードインしながら重ねる（線形）"""
+    frames = len(tail) // channels
+    mixed = array(tail.typecode, bytes(len(tail) * tail.itemsize))
+    is_int = tail.typecode == "h"
+    for frame in range(frames):
+        t = frame / frames
+        base = frame * channels
+        for ch in range(channels):
+            i = base + ch
+            value = tail[i] * (1.0 - t) + head[i] * t
+            if is_int:
+                value = max(-32768, min(32767, int(round(value))))
+            mixed[i] = value
+    return mixed
+
+
+def stitch_wav(paths: List[str], out_path: str, crossfade_seconds: float) -> Dict[str, Any]:
+    """
+    WAVファイルを順にクロスフェードでつなぐ
+
+    Args:
+        paths: 入力WAV（全て同じフォーマット）
+        out_path: 出力先
+        crossfade_seconds: 隣り合うファイルを重ねる長さ（秒）
+
+    Returns:
+        {"duration": 全体の秒数, "seams": [つなぎ目の開始秒, ...]}
+    """
+    files = [open(path, "rb") for path in paths]
+    try:
+        infos = [read_wav_info(f) for f in files]
+        first = infos[0]
+        for info in infos[1:]:
+            if (info.format_tag, info.channels, info.sample_rate, info.bits) != (
+                first.format_tag, first.channels, first.sample_rate, first.bits
+            ):
+                raise ValueError("Sections have different audio formats")
+
+        overlap = int(crossfade_seconds * first.sample_rate)
+        if len(infos) > 1:
+            overlap = min([overlap] + [info.frames // 2 for info in infos])
+        total_frames = sum(info.frames for info in infos) - overlap * (len(infos) - 1)
+        data_size = total_frames * first.frame_size
+
+        seams = []
+        with open(out_path, "wb") as out:
+            fmt = first.fmt_chunk + (b"\0" if len(first.fmt_chunk) & 1 else b"")
+            out.write(struct.pack("<4sI4s", b"RIFF", 4 + 8 + len(fmt) + 8 + data_size, b"WAVE"))
+            out.write(struct.pack("<4sI", b"fmt ", len(first.fmt_chunk)) + fmt)
+            out.write(struct.pack("<4sI", b"data", data_size))
+
+            position = 0
+            for index, (f, info) in enumerate(zip(files, infos)):
+                start = overlap if index > 0 else 0
+                end = info.frames - overlap if index < len(infos) - 1 else info.frames
+                _copy_frames(f, out, info, start, end)
+                position += end - start
+                if index < len(infos) - 1 and overlap > 0:
+                    next_f, next_info = files[index + 1], infos[index + 1]
+                    tail = _read_samples(f, info, end, overlap)
+                    head = _read_samples(next_f, next_info, 0, overlap)
+                    seams.append(round(position / first.sample_rate, 3))
+                    _write_samples(out, _crossfade(tail, head, first.channels))
+                    position += overlap
+                elif index < len(infos) - 1:
+                    seams.append(round(position / first.sample_rate, 3))
+
+        return {"duration": round(total_frames / first.sample_rate, 3), "seams": seams}
+    finally:
+        for f in files:
+            f.close()
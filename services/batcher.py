@@ -0,0 +1,147 @@
+"""
+Generation Batcher - リクエスト横断のマイクロバッチング
+
+シードだけが異なる互換リクエストを短時間保持し、上流の batch_size にまとめて
+1つのタスクとして投入する。結果は make_batched_task_id() で発行したタスクIDにより
+各呼び出し元へ振り分けられる。
+"""
+import asyncio
+import json
+import random
+from typing import Optional, List, Dict, Any, Set
+
+from config import settings
+from services.ace_step_client import ace_step_client, AceStepClient, make_batched_task_id
+
+
+class _PendingBatch:
+    """送信待ちのバッチ"""
+
+    def __init__(self, params: Dict[str, Any], limit: int):
+        self.params = params
+        self.limit = limit
+        self.members: List[Dict[str, Any]] = []
+        self.total = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class GenerationBatcher:
+    """互換リクエストを上流の1タスクにまとめるバッチャー"""
+
+    # バッチキーから除外するパラメータ（メンバーごとに異なってよいもの）
+    _PER_MEMBER_KEYS = ("seed", "batch_size")
+
+    def __init__(self, client: AceStepClient = None):
+        self._client = client or ace_step_client
+        self._pending: Dict[str, _PendingBatch] = {}
+        self._sending: Set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        """バッチングが有効か（待機時間が0の場合は無効）"""
+        return settings.batch_window > 0
+
+    async def submit(self, params: Dict[str, Any]) -> str:
+        """
+        生成リクエストをバッチに追加し、上流タスク作成まで待機
+
+        Args:
+            params: release_task() に渡すパラメータ
+
+        Returns:
+            タスクID（他のリクエストとまとめられた場合は結果範囲付きID）
+        """
+        loop = asyncio.get_running_loop()
+        key = self._batch_key(params)
+        batch_size = params.get("batch_size", 1)
+
+        pending = self._pending.get(key)
+        if pending is not None and pending.total + batch_size > pending.limit:
+            self._flush(key)
+            pending = None
+
+        if pending is None:
+            pending = _PendingBatch(params, self._max_batch_size(params))
+            pending.timer = loop.call_later(settings.batch_window, self._flush, key)
+            self._pending[key] = pending
+
+        future = loop.create_future()
+        pending.members.append({
+            "offset": pending.total,
+            "batch_size": batch_size,
+            "seed": params.get("seed"),
+            "future": future,
+        })
+        pending.total += batch_size
+
+        if pending.total >= pending.limit:
+            self._flush(key)
+
+        return await future
+
+    def _batch_key(self, params: Dict[str, Any]) -> str:
+        """シード・バッチサイズ以外が一致するリクエストを同一キーにする"""
+        shared = {k: v for k, v in params.items() if k not in self._PER_MEMBER_KEYS}
+        return json.dumps(shared, sort_keys=True, ensure_ascii=False, default=str)
+
+    def _max_batch_size(self, params: Dict[str, Any]) -> int:
+        """上流が1パスで生成できる最大数（LMを使わない場合は大きくできる）"""
+        if params.get("thinking", True):
+            return settings.batch_max_size
+        return settings.batch_max_size_no_lm
+
+    def _flush(self, key: str) -> None:
+        """保持中のバッチを送信"""
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        if pending.timer is not None:
+            pending.timer.cancel()
+        task = asyncio.create_task(self._send(pending))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, pending: _PendingBatch) -> None:
+        """バッチを1つの上流タスクとして投入し、各メンバーにタスクIDを返す"""
+        members = pending.members
+        params = dict(pending.params)
+
+        if len(members) > 1:
+            params["batch_size"] = pending.total
+            params.pop("seed", None)
+            if any(m["seed"] is not None for m in members):
+                # 指定シードを保つため、バッチ内の全出力のシードを明示する
+                seeds: List[int] = []
+                for m in members:
+                    count = m["batch_size"]
+                    if m["seed"] is not None:
+                        seeds.append(m["seed"])
+                        count -= 1
+                    seeds.extend(random.randint(0, 2**32 - 1) for _ in range(count))
+                params["seed"] = ",".join(str(s) for s in seeds)
+                params["use_random_seed"] = False
+
+        try:
+            result = await self._client.release_task(**params)
+            task_id = result.get("data", {}).get("task_id", "")
+            if not task_id:
+                raise Exception("Failed to create task")
+        except Exception as e:
+            for m in members:
+                if not m["future"].done():
+                    m["future"].set_exception(e)
+            return
+
+        for m in members:
+            if m["future"].done():
+                continue
+            if len(members) == 1:
+                m["future"].set_result(task_id)
+            else:
+                m["future"].set_result(
+                    make_batched_task_id(task_id, m["offset"], m["batch_size"])
+                )
+
+
+# シングルトンインスタンス
+generation_batcher = GenerationBatcher()
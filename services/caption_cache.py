@@ -0,0 +1,109 @@
+"""
+Caption Cache - LMで強化したcaption/lyricsの再利用
+
+thinking=true の生成では、上流の5Hz LMが毎回caption/lyricsを書き換えてから
+音声を生成する。同じプロンプトでシードだけ変えて何度も生成する場合、
+この書き換えは毎回同じ作業の繰り返しになる。
+
+有効時（caption_cache_enabled）は (prompt, lyrics, model) ごとに一度だけ
+/format_input を呼んで強化結果を共有ストアに保存し、以降の生成では
+強化済みのcaption/lyricsを渡して use_cot_caption / use_cot_language を無効にする。
+音声コード生成（thinking）自体はそのまま行う。
+"""
+import asyncio
+import hashlib
+import logging
+from typing import Optional, Dict, Any
+
+from config import settings
+from services.ace_step_client import ace_step_client
+from services.shared_state import shared_state
+
+
+logger = logging.getLogger(__name__)
+
+
+class CaptionCache:
+    """強化済みcaption/lyricsのキャッシュ"""
+
+    def __init__(self):
+        # 同じキーの同時リクエストでは /format_input を1回だけ呼ぶ
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def key(prompt: str, lyrics: str, model: str) -> str:
+        digest = hashlib.sha256("\0".join((prompt, lyrics, model)).encode("utf-8")).hexdigest()
+        return f"caption:{digest}"
+
+    @staticmethod
+    def applicable(params: Dict[str, Any]) -> bool:
+        """キャッシュを使える生成か（テキストからの通常生成で thinking=true のみ）"""
+        return (
+            settings.caption_cache_enabled
+            and params.get("thinking", True)
+            and params.get("task_type", "text2music") == "text2music"
+            and bool(params.get("prompt"))
+        )
+
+    async def enhance(self, prompt: str, lyrics: str, model: str = "") -> Optional[Dict[str, Any]]:
+        """
+        強化済みのcaption/lyricsとメタ情報を返す（未取得なら /format_input を呼ぶ）
+
+        Returns:
+            /format_input の data 要素（失敗時はNone）
+        """
+        key = self.key(prompt, lyrics, model)
+        cached = await shared_state.get(key)
+        if cached is not None:
+            return cached
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key, prompt, lyrics))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: str, prompt: str, lyrics: str) -> Optional[Dict[str, Any]]:
+        try:
+            result = await ace_step_client.format_input(
+                prompt, lyrics, temperature=settings.caption_cache_temperature
+            )
+        except Exception as e:
+            logger.warning("format_input failed, submitting without cached caption: %s", e)
+            return None
+        data = result.get("data") or {}
+        if not data.get("caption"):
+            return None
+        await shared_state.set(key, data, ttl=settings.caption_cache_ttl)
+        return data
+
+    async def apply(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        release_task() のパラメータを強化済みの入力に置き換える
+
+        ユーザーが指定したBPM・調は上書きしない。キャッシュを使えない場合は元のまま返す
+        """
+        if not self.applicable(params):
+            return params
+
+        data = await self.enhance(params["prompt"], params.get("lyrics", ""), params.get("model", ""))
+        if data is None:
+            return params
+
+        enhanced = {
+            **params,
+            "prompt": data["caption"],
+            "lyrics": data.get("lyrics") or params.get("lyrics", ""),
+            "use_cot_caption": False,
+            "use_cot_language": False,
+        }
+        if params.get("bpm") is None and isinstance(data.get("bpm"), int):
+            enhanced["bpm"] = data["bpm"]
+        if params.get("key_scale") is None and data.get("key_scale"):
+            enhanced["key_scale"] = data["key_scale"]
+        return enhanced
+
+
+# シングルトンインスタンス
+caption_cache = CaptionCache()
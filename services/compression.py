@@ -0,0 +1,102 @@
+"""
+Response Compression - APIレスポンスの gzip / brotli 圧縮
+
+歌詞やプロンプトを含むステータス・検索結果のJSONは数十KBになるため、
+Accept-Encoding に応じて brotli（任意依存）または gzip で圧縮する。
+圧縮するのは、ボディが1回で送られる（ストリーミングでない）テキスト系レスポンスのうち
+settings.compress_min_size 以上のものだけ。NDJSON・音声・ZIPのストリーミングや
+事前圧縮済みの静的ファイル（Content-Encoding 付き）はそのまま通す。
+"""
+import gzip
+from typing import Dict, List, Tuple
+
+from config import settings
+from services.static_assets import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # 任意依存
+    brotli = None
+
+
+_COMPRESSIBLE_TYPES = (b"application/json", b"text/", b"application/javascript")
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.compress_brotli_quality)
+    return gzip.compress(body, compresslevel=settings.compress_gzip_level, mtime=0)
+
+
+def choose_encoding(accept_encoding: str) -> str:
+    """使用するエンコーディング（圧縮しない場合は空文字）"""
+    accepted = accepted_encodings(accept_encoding)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return ""
+
+
+class CompressionMiddleware:
+    """ネゴシエーション付きのレスポンス圧縮ASGIミドルウェア"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = dict(scope.get("headers") or [])
+        encoding = choose_encoding(request_headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Dict = {}
+        state = {"passthrough": False}
+
+        async def send_wrapper(message):
+            if state["passthrough"]:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                # ボディを見るまで送信を保留する
+                start_message.update(message)
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            headers: List[Tuple[bytes, bytes]] = list(start_message.get("headers") or [])
+            header_map = {k.lower(): v for k, v in headers}
+            body = message.get("body", b"")
+            if (
+                message.get("more_body", False)
+                or b"content-encoding" in header_map
+                or len(body) < settings.compress_min_size
+                or not header_map.get(b"content-type", b"").startswith(_COMPRESSIBLE_TYPES)
+            ):
+                state["passthrough"] = True
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = compress(body, encoding)
+            headers = [(k, v) for k, v in headers if k.lower() not in (b"content-length", b"vary")]
+            vary = header_map.get(b"vary")
+            headers.append((b"content-encoding", encoding.encode("ascii")))
+            headers.append((b"content-length", str(len(compressed)).encode("ascii")))
+            if not vary:
+                vary = b"Accept-Encoding"
+            elif b"accept-encoding" not in vary.lower():
+                vary += b", Accept-Encoding"
+            headers.append((b"vary", vary))
+            await send({**start_message, "headers": headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,51 @@
+"""
+Fast JSON - orjson があれば使うJSONエンコード/デコード
+
+ステータスのポーリングでは上流レスポンスのパースとAPIレスポンスの
+シリアライズがCPU時間の大半を占めるため、orjson（任意依存）が
+インストールされていればそちらを使う。未インストールまたは
+settings.fast_json=false の場合は標準の json モジュールにフォールバックする。
+"""
+import json
+from typing import Any, Union
+
+from fastapi.responses import JSONResponse
+
+from config import settings
+
+try:
+    import orjson
+except ImportError:  # 任意依存
+    orjson = None
+
+
+def enabled() -> bool:
+    """orjson を使うか"""
+    return orjson is not None and settings.fast_json
+
+
+def loads(data: Union[str, bytes, bytearray]) -> Any:
+    """JSONをデコード"""
+    if enabled():
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(value: Any) -> bytes:
+    """JSONをUTF-8のバイト列にエンコード（JSONResponse と同じ書式）"""
+    if enabled():
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        value,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """orjson でシリアライズする JSONResponse（アプリのデフォルトレスポンスクラス）"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
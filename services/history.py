@@ -0,0 +1,359 @@
+"""
+Generation History - 生成履歴と全文検索
+
+完了した生成結果（prompt・歌詞・ジャンル・BPM・キー・モデル等）をSQLiteに保存し、
+FTS5インデックスで検索できるようにする。書き込みはキュー経由で非同期に
+まとめて行い、リクエスト処理をブロックしない。
+"""
+import asyncio
+import base64
+import json
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Tuple
+
+from config import settings
+
+
+logger = logging.getLogger("uvicorn.error")
+
+_BASE_DIR = Path(__file__).resolve().parent.parent
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+    id INTEGER PRIMARY KEY,
+    task_id TEXT NOT NULL,
+    file TEXT NOT NULL,
+    url TEXT,
+    prompt TEXT NOT NULL DEFAULT '',
+    lyrics TEXT NOT NULL DEFAULT '',
+    genres TEXT NOT NULL DEFAULT '',
+    bpm INTEGER,
+    keyscale TEXT,
+    duration REAL,
+    model TEXT,
+    seed TEXT,
+    create_time INTEGER NOT NULL DEFAULT 0,
+    UNIQUE(task_id, file)
+);
+CREATE INDEX IF NOT EXISTS songs_create_time ON songs(create_time DESC, id DESC);
+CREATE INDEX IF NOT EXISTS songs_model ON songs(model);
+CREATE INDEX IF NOT EXISTS songs_keyscale ON songs(keyscale);
+CREATE INDEX IF NOT EXISTS songs_bpm ON songs(bpm);
+
+-- 日本語の歌詞も部分一致で検索できるよう trigram トークナイザを使う
+CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5(
+    prompt, lyrics, genres,
+    content='songs', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS songs_ai AFTER INSERT ON songs BEGIN
+    INSERT INTO songs_fts(rowid, prompt, lyrics, genres)
+    VALUES (new.id, new.prompt, new.lyrics, new.genres);
+END;
+CREATE TRIGGER IF NOT EXISTS songs_ad AFTER DELETE ON songs BEGIN
+    INSERT INTO songs_fts(songs_fts, rowid, prompt, lyrics, genres)
+    VALUES ('delete', old.id, old.prompt, old.lyrics, old.genres);
+END;
+CREATE TRIGGER IF NOT EXISTS songs_au AFTER UPDATE ON songs BEGIN
+    INSERT INTO songs_fts(songs_fts, rowid, prompt, lyrics, genres)
+    VALUES ('delete', old.id, old.prompt, old.lyrics, old.genres);
+    INSERT INTO songs_fts(rowid, prompt, lyrics, genres)
+    VALUES (new.id, new.prompt, new.lyrics, new.genres);
+END;
+"""
+
+_COLUMNS = (
+    "id", "task_id", "file", "url", "prompt", "lyrics", "genres",
+    "bpm", "keyscale", "duration", "model", "seed", "create_time",
+)
+
+
+def _encode_cursor(values: List[Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> List[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+# trigram トークナイザは3文字未満の語にマッチしない
+_MIN_FTS_TERM = 3
+
+
+def _fts_query(text: str) -> str:
+    """ユーザー入力をFTS5クエリに変換（3文字以上の各語をフレーズとしてAND検索）"""
+    terms = [t.replace('"', '""') for t in text.split() if len(t) >= _MIN_FTS_TERM]
+    return " ".join(f'"{t}"' for t in terms)
+
+
+def _short_terms(text: str) -> List[str]:
+    """FTSで検索できない3文字未満の語（「恋」「夏空」など）"""
+    return [t for t in text.split() if len(t) < _MIN_FTS_TERM]
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class GenerationHistory:
+    """生成履歴ストア"""
+
+    def __init__(self, db_path: Optional[Path] = None):
+        self._db_path = db_path
+        self._writer: Optional[sqlite3.Connection] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def db_path(self) -> Path:
+        path = self._db_path or Path(settings.history_db_path)
+        return path if path.is_absolute() else _BASE_DIR / path
+
+    def _connect(self) -> sqlite3.Connection:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # -------------------------------------------------------------------------
+    # Indexing
+    # -------------------------------------------------------------------------
+
+    def record(self, task_id: str, results: List[Dict[str, Any]]) -> None:
+        """
+        完了した生成結果をインデックス待ちキューに追加（ノンブロッキング）
+
+        同じ (task_id, file) は何度記録しても1件として保存される。
+        後から記録した結果に値があれば、空の列（作成時刻・モデル・ジャンル等）を埋める
+        """
+        if not settings.history_enabled or not results:
+            return
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=settings.history_queue_size)
+            self._task = asyncio.create_task(self._index_loop())
+        for r in results:
+            if not r.get("file"):
+                continue
+            try:
+                self._queue.put_nowait(self._to_row(task_id, r))
+            except asyncio.QueueFull:
+                logger.warning("History queue full, dropping result of task %s", task_id)
+                return
+
+    def _to_row(self, task_id: str, r: Dict[str, Any]) -> Tuple:
+        metas = r.get("metas") or {}
+        bpm = metas.get("bpm")
+        return (
+            task_id,
+            r.get("file"),
+            r.get("url"),
+            r.get("prompt") or metas.get("prompt") or "",
+            r.get("lyrics") or metas.get("lyrics") or "",
+            metas.get("genres") or "",
+            bpm if isinstance(bpm, int) else None,
+            metas.get("keyscale"),
+            metas.get("duration"),
+            r.get("dit_model"),
+            r.get("seed_value") or r.get("seed"),
+            r.get("create_time") or 0,
+        )
+
+    async def _index_loop(self) -> None:
+        """キューを一定件数ずつまとめて書き込む（None を受け取ったら書き込んで終了）"""
+        stopping = False
+        while not stopping:
+            rows = []
+            item = await self._queue.get()
+            while True:
+                if item is None:
+                    stopping = True
+                    break
+                rows.append(item)
+                if len(rows) >= 500 or self._queue.empty():
+                    break
+                item = self._queue.get_nowait()
+            if not rows:
+                continue
+            try:
+                await asyncio.to_thread(self._write, rows)
+            except Exception as e:
+                logger.warning("History indexing failed: %s", e)
+
+    def _write(self, rows: List[Tuple]) -> None:
+        if self._writer is None:
+            self._writer = self._connect()
+            self._writer.executescript(_SCHEMA)
+        with self._writer:
+            self._writer.executemany(
+                "INSERT INTO songs (task_id, file, url, prompt, lyrics, genres, "
+                "bpm, keyscale, duration, model, seed, create_time) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(task_id, file) DO UPDATE SET "
+                "url = COALESCE(excluded.url, url), "
+                "prompt = CASE WHEN excluded.prompt != '' THEN excluded.prompt ELSE prompt END, "
+                "lyrics = CASE WHEN excluded.lyrics != '' THEN excluded.lyrics ELSE lyrics END, "
+                "genres = CASE WHEN excluded.genres != '' THEN excluded.genres ELSE genres END, "
+                "bpm = COALESCE(excluded.bpm, bpm), "
+                "keyscale = COALESCE(excluded.keyscale, keyscale), "
+                "duration = COALESCE(excluded.duration, duration), "
+                "model = COALESCE(excluded.model, model), "
+                "seed = COALESCE(excluded.seed, seed), "
+                "create_time = MAX(excluded.create_time, create_time)",
+                rows
+            )
+
+    async def flush(self) -> None:
+        """キュー内の未書き込み分を書き込む（インデックス処理の停止後に呼ぶ）"""
+        if self._queue is None:
+            return
+        rows = []
+        while not self._queue.empty():
+            rows.append(self._queue.get_nowait())
+        if rows:
+            await asyncio.to_thread(self._write, rows)
+
+    async def stop(self) -> None:
+        """
+        インデックス処理を停止（未書き込み分は書き込む）
+
+        キャンセルでは実行中の書き込みスレッドは止まらないため、終了の合図をキューに入れ、
+        書き込み中のバッチが終わるのを待ってから接続を閉じる
+        """
+        if self._task is not None:
+            await self._queue.put(None)
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    # -------------------------------------------------------------------------
+    # Search
+    # -------------------------------------------------------------------------
+
+    async def search(
+        self,
+        query: str = "",
+        model: Optional[str] = None,
+        keyscale: Optional[str] = None,
+        bpm_min: Optional[int] = None,
+        bpm_max: Optional[int] = None,
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        履歴を検索
+
+        Args:
+            query: 検索語（空白区切りでAND。prompt・歌詞・ジャンルが対象。
+                3文字未満の語は部分一致で絞り込む）
+            model: DiTモデル名で絞り込み
+            keyscale: キーで絞り込み
+            bpm_min: BPM下限
+            bpm_max: BPM上限
+            limit: 件数
+            cursor: 前回結果の next_cursor
+
+        Returns:
+            {"items": [...], "next_cursor": str | None}
+            3文字以上の語を含むquery: 関連度順、それ以外: 新しい順
+
+        Raises:
+            ValueError: cursorが不正
+        """
+        return await asyncio.to_thread(
+            self._search_sync, query, model, keyscale, bpm_min, bpm_max, limit, cursor
+        )
+
+    def _search_sync(
+        self,
+        query: str,
+        model: Optional[str],
+        keyscale: Optional[str],
+        bpm_min: Optional[int],
+        bpm_max: Optional[int],
+        limit: int,
+        cursor: Optional[str]
+    ) -> Dict[str, Any]:
+        if not self.db_path.exists():
+            return {"items": [], "next_cursor": None}
+
+        where: List[str] = []
+        params: List[Any] = []
+        if model:
+            where.append("s.model = ?")
+            params.append(model)
+        if keyscale:
+            where.append("s.keyscale = ?")
+            params.append(keyscale)
+        if bpm_min is not None:
+            where.append("s.bpm >= ?")
+            params.append(bpm_min)
+        if bpm_max is not None:
+            where.append("s.bpm <= ?")
+            params.append(bpm_max)
+        for term in _short_terms(query):
+            # 短い語は prompt・歌詞・ジャンルの部分一致で絞り込む
+            where.append(
+                "(s.prompt LIKE ? ESCAPE '\\' OR s.lyrics LIKE ? ESCAPE '\\' "
+                "OR s.genres LIKE ? ESCAPE '\\')"
+            )
+            params.extend([_like_pattern(term)] * 3)
+
+        columns = ", ".join(f"s.{c}" for c in _COLUMNS)
+        match = _fts_query(query)
+        if match:
+            sql = (
+                f"SELECT {columns}, bm25(songs_fts) AS score, "
+                "snippet(songs_fts, 1, '[', ']', '…', 12) AS snippet "
+                "FROM songs_fts JOIN songs s ON s.id = songs_fts.rowid "
+                "WHERE songs_fts MATCH ?"
+            )
+            params.insert(0, match)
+            if cursor:
+                score, last_id = _decode_cursor(cursor)
+                where.append("(bm25(songs_fts) > ? OR (bm25(songs_fts) = ? AND s.id > ?))")
+                params.extend([score, score, last_id])
+            order = "ORDER BY score, s.id"
+        else:
+            sql = f"SELECT {columns}, NULL AS score, NULL AS snippet FROM songs s WHERE 1"
+            if cursor:
+                create_time, last_id = _decode_cursor(cursor)
+                where.append("(s.create_time < ? OR (s.create_time = ? AND s.id < ?))")
+                params.extend([create_time, create_time, last_id])
+            order = "ORDER BY s.create_time DESC, s.id DESC"
+
+        for clause in where:
+            sql += f" AND {clause}"
+        sql += f" {order} LIMIT ?"
+        params.append(limit + 1)
+
+        conn = self._connect()
+        try:
+            rows = [dict(row) for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            key = last["score"] if match else last["create_time"]
+            next_cursor = _encode_cursor([key, last["id"]])
+
+        return {"items": rows, "next_cursor": next_cursor}
+
+
+# シングルトンインスタンス
+generation_history = GenerationHistory()
@@ -0,0 +1,137 @@
+"""
+Idempotency - Idempotency-Key によるタスク作成の重複防止
+
+クライアントがネットワーク層のタイムアウトで同じリクエストを再送すると、
+release_task が二重に呼ばれてGPUが同じ曲を2回生成する。Idempotency-Key ヘッダー付きの
+リクエストでは、作成したタスクIDを共有ストアに保存し（idempotency_ttl 秒で失効）、
+同じキーの再送には元のタスクIDを返す。
+
+- 同じキーで内容の異なるリクエスト: IdempotencyConflict（422）
+- 同じキーのリクエストがまだ処理中: IdempotencyInProgress（409）
+
+キーはエンドポイントごとに区別し、ハッシュ化して保存する。
+作成中の目印は create() が終わるまで定期的に延長するため、LM呼び出しや上流の再試行で
+作成が idempotency_lock_ttl より長引いても、再送で二重に投入されない。
+
+保存件数: sqlite:// / redis:// では期限切れのキーはストア側で削除される。
+プロセス内の memory:// では、さらに idempotency_max_keys 件を超えた分を古い順に削除する。
+"""
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple, Callable, Awaitable
+
+from config import settings
+from services.shared_state import shared_state, MemoryState
+
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyConflict(Exception):
+    """同じキーが別の内容のリクエストに使われた"""
+    pass
+
+
+class IdempotencyInProgress(Exception):
+    """同じキーのリクエストが処理中"""
+    pass
+
+
+class IdempotencyStore:
+    """Idempotency-Key とタスクIDの対応"""
+
+    def __init__(self):
+        # memory:// のときだけ保存したキーを古い順に保持して件数を制限する
+        self._keys: "OrderedDict[str, None]" = OrderedDict()
+
+    @staticmethod
+    def _key(scope: str, key: str) -> str:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return f"idempotency:{scope}:{digest}"
+
+    @staticmethod
+    def fingerprint(payload: Dict[str, Any]) -> str:
+        """リクエスト内容のハッシュ（同じキーの再利用を検出する）"""
+        body = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+    async def run(
+        self,
+        scope: str,
+        key: Optional[str],
+        payload: Dict[str, Any],
+        create: Callable[[], Awaitable[str]],
+    ) -> Tuple[str, bool]:
+        """
+        キーに対応するタスクIDを返す（未作成なら create() で作成して保存）
+
+        Args:
+            scope: エンドポイント名
+            key: Idempotency-Key ヘッダーの値（Noneなら毎回作成）
+            payload: リクエスト内容
+            create: タスクを作成してIDを返す関数
+
+        Returns:
+            (タスクID, 既存のタスクを返した場合True)
+
+        Raises:
+            ValueError: キーが空・長すぎる
+            IdempotencyConflict: 同じキーで内容が異なる
+            IdempotencyInProgress: 同じキーのリクエストが処理中
+        """
+        if key is None:
+            return await create(), False
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise ValueError(f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+
+        storage_key = self._key(scope, key)
+        fingerprint = self.fingerprint(payload)
+        pending = {"fingerprint": fingerprint, "task_id": None}
+        # 作成中の目印はタスク作成にかかる時間だけ保持する（ワーカーが落ちても残らない）
+        if not await shared_state.set_if_absent(storage_key, pending, ttl=settings.idempotency_lock_ttl):
+            entry = await shared_state.get(storage_key)
+            if entry is not None:
+                if entry.get("fingerprint") != fingerprint:
+                    raise IdempotencyConflict("Idempotency-Key was used for a different request")
+                if entry.get("task_id"):
+                    return entry["task_id"], True
+            raise IdempotencyInProgress("A request with this Idempotency-Key is in progress")
+
+        try:
+            async with shared_state.keep_alive(storage_key, pending, settings.idempotency_lock_ttl):
+                task_id = await create()
+        except BaseException:
+            await shared_state.delete(storage_key)
+            raise
+        if not task_id:
+            await shared_state.delete(storage_key)
+            return task_id, False
+        await shared_state.set(
+            storage_key,
+            {"fingerprint": fingerprint, "task_id": task_id},
+            ttl=settings.idempotency_ttl,
+        )
+        await self._track(storage_key)
+        return task_id, False
+
+    async def _track(self, storage_key: str) -> None:
+        """memory:// で保存件数が上限を超えたら古いキーから削除する"""
+        if not isinstance(shared_state, MemoryState):
+            return
+        self._keys[storage_key] = None
+        self._keys.move_to_end(storage_key)
+        while len(self._keys) > settings.idempotency_max_keys:
+            oldest, _ = self._keys.popitem(last=False)
+            await shared_state.delete(oldest)
+
+    async def forget(self, scope: str, key: Optional[str]) -> None:
+        """キーを削除（タスクを放棄した場合など、再送で作り直させる）"""
+        if key:
+            storage_key = self._key(scope, key)
+            self._keys.pop(storage_key, None)
+            await shared_state.delete(storage_key)
+
+
+# シングルトンインスタンス
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,219 @@
+"""
+LLM Pool - 複数のOpenAI互換バックエンドへの振り分け
+
+バックエンドごとに同時実行数ガバナー（LLMScheduler）と耐障害ポリシー
+（BackendGuard）を持ち、呼び出しは「実行中+待機数」と直近レイテンシ、
+重みから求めたスコアが最も低いバックエンドに送る。一時的なエラー・
+サーキットオープン・キュー満杯の場合は次のバックエンドにフェイルオーバーする。
+
+各バックエンドは担当（roles: "lyrics" / "tags"）を持てるため、
+タグ生成だけを小さく速いモデルに振り分けることができる。
+"""
+import json
+import time
+from typing import Optional, List, Dict, Any, Callable, Awaitable, TypeVar
+from urllib.parse import urlparse
+
+from openai import AsyncOpenAI
+
+from config import settings
+from services.resilience import BackendGuard, CircuitOpenError, is_transient_error
+from services.llm_scheduler import LLMScheduler, LLMQueueFull, Priority
+
+
+T = TypeVar("T")
+
+ROLES = ("lyrics", "tags")
+
+# レイテンシの指数移動平均の係数
+_EWMA_ALPHA = 0.3
+
+
+class LLMBackend:
+    """1つのOpenAI互換エンドポイント"""
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        api_key: str,
+        model: str,
+        weight: float = 1.0,
+        roles: Optional[List[str]] = None,
+        max_concurrency: Optional[int] = None,
+        max_queue: Optional[int] = None
+    ):
+        self.name = name
+        self.base_url = base_url
+        self.model = model
+        self.weight = max(weight, 0.01)
+        self.roles = tuple(roles or ROLES)
+        self.client = AsyncOpenAI(base_url=base_url, api_key=api_key)
+        self.guard = BackendGuard(name)
+        self.scheduler = LLMScheduler(name, max_concurrency=max_concurrency, max_queue=max_queue)
+        self.latency: Optional[float] = None
+
+    @property
+    def available(self) -> bool:
+        return self.guard.breaker.state != "open"
+
+    def score(self) -> float:
+        """小さいほど優先（未計測のバックエンドは1秒とみなして試す）"""
+        load = self.scheduler.in_flight + self.scheduler.queued + 1
+        return load * (self.latency or 1.0) / self.weight
+
+    def record_latency(self, seconds: float) -> None:
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency = _EWMA_ALPHA * seconds + (1 - _EWMA_ALPHA) * self.latency
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.scheduler.stats(),
+            "model": self.model,
+            "roles": list(self.roles),
+            "weight": self.weight,
+            "latency": round(self.latency, 2) if self.latency is not None else None,
+            "circuit": self.guard.breaker.state,
+        }
+
+
+class LLMPool:
+    """LLMバックエンドのプール"""
+
+    def __init__(self, base_url: str = None, api_key: str = None, model: str = None):
+        # LLMService と同様、設定はCLI引数等で後から変わり得るため、
+        # 設定が変わったらバックエンドを作り直す
+        self._base_url_override = base_url
+        self._api_key_override = api_key
+        self._model_override = model
+        self._backends: List[LLMBackend] = []
+        self._signature: Optional[str] = None
+
+    def _backend_configs(self) -> List[Dict[str, Any]]:
+        base_url = self._base_url_override or settings.openai_base_url
+        api_key = self._api_key_override or settings.openai_api_key
+        model = self._model_override or settings.openai_chat_model
+
+        if settings.llm_backends and not self._base_url_override:
+            return [
+                {"api_key": api_key, "model": model, **entry}
+                for entry in settings.llm_backends
+            ]
+
+        configs = [{"name": "LLM API", "base_url": base_url, "api_key": api_key, "model": model}]
+        if settings.openai_tags_model:
+            configs[0]["roles"] = ["lyrics"]
+            configs.append({
+                "name": "LLM API (tags)",
+                "base_url": base_url,
+                "api_key": api_key,
+                "model": settings.openai_tags_model,
+                "roles": ["tags"],
+            })
+        return configs
+
+    def backends(self) -> List[LLMBackend]:
+        configs = self._backend_configs()
+        signature = json.dumps(configs, sort_keys=True, default=str)
+        if signature != self._signature:
+            self._backends = [self._build(config) for config in configs]
+            self._signature = signature
+        return self._backends
+
+    @staticmethod
+    def _build(config: Dict[str, Any]) -> LLMBackend:
+        base_url = config["base_url"]
+        name = config.get("name") or f"{urlparse(base_url).netloc}/{config['model']}"
+        return LLMBackend(
+            name=name,
+            base_url=base_url,
+            api_key=config.get("api_key") or "",
+            model=config["model"],
+            weight=float(config.get("weight", 1.0)),
+            roles=config.get("roles"),
+            max_concurrency=config.get("max_concurrency"),
+            max_queue=config.get("max_queue")
+        )
+
+    def candidates(self, role: str) -> List[LLMBackend]:
+        """
+        呼び出し順に並べたバックエンド
+
+        担当バックエンド（スコア順）→ それ以外（最後の手段）の順。
+        サーキットが開いているものは末尾に回す
+        """
+        backends = self.backends()
+        assigned = [b for b in backends if role in b.roles]
+        others = [b for b in backends if role not in b.roles]
+        key = lambda b: (not b.available, b.score())
+        return sorted(assigned, key=key) + sorted(others, key=key)
+
+    async def run(
+        self,
+        role: str,
+        priority: Priority,
+        call: Callable[[LLMBackend], Awaitable[T]]
+    ) -> T:
+        """
+        最適なバックエンドで呼び出し、失敗したら次のバックエンドへフェイルオーバー
+
+        Raises:
+            LLMQueueFull: 全バックエンドのキューが満杯
+        """
+        error: Optional[BaseException] = None
+        for backend in self.candidates(role):
+            try:
+                return await self.run_on(backend, priority, call)
+            except (CircuitOpenError, LLMQueueFull) as e:
+                error = e
+            except Exception as e:
+                if not is_transient_error(e):
+                    raise
+                error = e
+        raise error
+
+    async def run_on(
+        self,
+        backend: LLMBackend,
+        priority: Priority,
+        call: Callable[[LLMBackend], Awaitable[T]]
+    ) -> T:
+        """指定バックエンドで呼び出す"""
+        async with backend.scheduler.slot(priority):
+            start = time.monotonic()
+            result = await backend.guard.call(
+                "chat.completions",
+                lambda: call(backend),
+                timeout=settings.llm_timeout,
+                retries=settings.llm_retries
+            )
+            backend.record_latency(time.monotonic() - start)
+            return result
+
+    def can_accept(self, count: int = 1, role: str = "lyrics") -> bool:
+        """count件を今投入しても担当バックエンド全体のキューが溢れないか"""
+        backends = [b for b in self.candidates(role) if b.available] or self.backends()
+        return count <= sum(b.scheduler.room() for b in backends)
+
+    def estimated_wait(self, priority: Priority) -> float:
+        """最も空いているバックエンドでの待ち時間の概算（秒）"""
+        return min(b.scheduler.estimated_wait(priority) for b in self.backends())
+
+    def position(self, priority: Priority) -> int:
+        """最も空いているバックエンドでの待ち順（0=即時実行）"""
+        return min(b.scheduler.position(priority) for b in self.backends())
+
+    def stats(self) -> Dict[str, Any]:
+        """全バックエンドのキュー状態"""
+        backends = [b.stats() for b in self.backends()]
+        return {
+            "in_flight": sum(b["in_flight"] for b in backends),
+            "queued": sum(b["queued"] for b in backends),
+            "max_concurrency": sum(b["max_concurrency"] for b in backends),
+            "max_queue": sum(b["max_queue"] for b in backends),
+            "position": {p.name.lower(): self.position(p) for p in Priority},
+            "estimated_wait": {p.name.lower(): round(self.estimated_wait(p), 2) for p in Priority},
+            "backends": backends,
+        }
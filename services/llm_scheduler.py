@@ -0,0 +1,156 @@
+"""
+LLM Scheduler - LLM呼び出しの同時実行数制御
+
+バックエンドごとに同時completion数を制限し、超過分を優先度付きキューで待たせる。
+キューが満杯の場合は LLMQueueFull で即時に拒否する（バックプレッシャー）。
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Optional, List, Dict, Any, Tuple, AsyncIterator
+
+from config import settings
+
+
+class Priority(IntEnum):
+    """LLMリクエストの優先度（小さいほど先に処理）"""
+    INTERACTIVE = 0  # タグ再生成など、ユーザーが待っている短い処理
+    NORMAL = 1  # 通常の作詞
+    BULK = 2  # 複数候補生成・一括処理
+
+
+class LLMQueueFull(Exception):
+    """LLMキューが満杯"""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMScheduler:
+    """1つのLLMバックエンドに対する同時実行数ガバナー"""
+
+    def __init__(self, name: str, max_concurrency: int = None, max_queue: int = None):
+        self.name = name
+        self._max_concurrency = max_concurrency
+        self._max_queue = max_queue
+        self._in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._durations: List[float] = []
+
+    @property
+    def max_concurrency(self) -> int:
+        return max(1, self._max_concurrency or settings.llm_max_concurrency)
+
+    @property
+    def max_queue(self) -> int:
+        return self._max_queue if self._max_queue is not None else settings.llm_queue_size
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def room(self) -> int:
+        """今すぐ受け付けられる件数（空き実行枠 + キューの空き）"""
+        free = max(0, self.max_concurrency - self._in_flight) if not self._waiters else 0
+        return free + max(0, self.max_queue - self.queued)
+
+    def can_accept(self, count: int = 1) -> bool:
+        """count件を今投入してもキューが溢れないか"""
+        return count <= self.room()
+
+    def position(self, priority: Priority) -> int:
+        """指定優先度で今投入した場合の待ち順（0=即時実行）"""
+        if self._in_flight < self.max_concurrency and not self._waiters:
+            return 0
+        return 1 + sum(1 for p, _, _ in self._waiters if p <= priority)
+
+    def estimated_wait(self, priority: Priority) -> float:
+        """待ち時間の概算（秒）"""
+        position = self.position(priority)
+        if position == 0 or not self._durations:
+            return 0.0
+        average = sum(self._durations) / len(self._durations)
+        return average * position / self.max_concurrency
+
+    def stats(self) -> Dict[str, Any]:
+        """現在のキュー状態"""
+        by_priority = {p.name.lower(): 0 for p in Priority}
+        for p, _, _ in self._waiters:
+            by_priority[Priority(p).name.lower()] += 1
+        return {
+            "backend": self.name,
+            "in_flight": self._in_flight,
+            "queued": self.queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queued_by_priority": by_priority,
+            "position": {p.name.lower(): self.position(p) for p in Priority},
+            "estimated_wait": {
+                p.name.lower(): round(self.estimated_wait(p), 2) for p in Priority
+            },
+        }
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = Priority.NORMAL) -> AsyncIterator[None]:
+        """
+        実行枠を確保する
+
+        Raises:
+            LLMQueueFull: キューが満杯
+        """
+        await self._acquire(priority)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._record_duration(time.monotonic() - start)
+            self._release()
+
+    async def _acquire(self, priority: Priority) -> None:
+        if self._in_flight < self.max_concurrency and not self._waiters:
+            self._in_flight += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            retry_after = max(1, int(self.estimated_wait(Priority.BULK)))
+            raise LLMQueueFull(
+                f"{self.name} queue is full ({self.queued} waiting)",
+                retry_after=retry_after
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (int(priority), next(self._counter), future)
+        heapq.heappush(self._waiters, entry)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 枠を割り当てられた直後にキャンセルされた
+                self._release()
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        while self._in_flight < self.max_concurrency and self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.cancelled():
+                continue
+            self._in_flight += 1
+            future.set_result(None)
+
+    def _record_duration(self, seconds: float) -> None:
+        self._durations.append(seconds)
+        if len(self._durations) > 50:
+            del self._durations[0]
@@ -3,36 +3,33 @@ LLM Service - 作詞・タグ生成サービス
 
 OpenAI互換APIを使用した歌詞生成とタグ推奨
 """
+import asyncio
 import json
 import re
-from typing import Optional, Dict, Any, Tuple
-from openai import AsyncOpenAI
+from typing import Optional, Dict, Any, Tuple, List, AsyncIterator, Callable, Awaitable
 
 from config import settings
+from services.llm_pool import LLMPool, LLMBackend
+from services.llm_scheduler import Priority
+from services.lyrics_analyzer import analyze_lyrics
 
 
 # システムプロンプト: 作詞
 LYRICS_GENERATE_SYSTEM_PROMPT = """You are a professional lyricist who creates song lyrics for AI music generation (ACE-Step).
 
 CRITICAL OUTPUT RULES:
-1. Start with a JSON metadata line, then output ONLY the lyrics with structure tags
+1. Output ONLY the lyrics with structure tags
 2. Use structure tags: [intro], [verse], [chorus], [bridge], [outro], [inst] (for instrumental)
 3. Do NOT include timestamps like (0:00-0:05) - ACE-Step does not use them
 4. Do NOT include romanization in parentheses - write in the requested language ONLY
 5. Write lyrics line by line, each line on its own
 
-REQUIRED FIRST LINE FORMAT (JSON):
-{"recommended_duration": 90, "parts": {"intro": 5, "verse1": 20, "chorus1": 25, "verse2": 20, "chorus2": 25, "outro": 5}}
-
-- recommended_duration: Total song length in seconds (typically 60-180)
-- parts: Estimated duration for each part in seconds
-
 STRUCTURE GUIDELINES:
-- [intro]: Keep short (1-2 lines) or use [inst] for instrumental (5-10 sec)
-- [verse]: 4-6 lines per verse (15-25 sec)
-- [chorus]: 4-6 lines, catchy and memorable (20-30 sec)
-- [bridge]: Optional, 2-4 lines (10-15 sec)
-- [outro]: Short ending, 1-2 lines or [inst] (5-10 sec)
+- [intro]: Keep short (1-2 lines) or leave empty for instrumental
+- [verse]: 4-6 lines per verse
+- [chorus]: 4-6 lines, catchy and memorable
+- [bridge]: Optional, 2-4 lines
+- [outro]: Short ending, 1-2 lines or leave empty
 
 STYLE GUIDELINES:
 - Match the mood and genre specified
@@ -68,6 +65,14 @@ GUIDELINES:
 - BPM range: 60-180
 """
 
+# システムプロンプト: 先行生成タグの見直し
+TAGS_REFINE_SYSTEM_PROMPT = """You are a music metadata expert. You are given draft music tags that were generated from the song's theme before the lyrics were written, and the finished lyrics.
+
+If the draft tags fit the lyrics, reply with exactly: OK
+Otherwise reply with corrected tags as a single JSON object in the same format:
+{"genre": "...", "tags": "...", "bpm": 120, "key_scale": "C major"}
+"""
+
 
 class LLMService:
     """LLMサービス - 作詞・タグ生成"""
@@ -82,43 +87,18 @@ class LLMService:
         # `llm_service` is instantiated at import time. CLI args / .env may be
         # applied later (e.g., when running via uvicorn which re-imports
         # `main:app`). Therefore, we keep only optional overrides here and
-        # lazily create (or recreate) the client per-request based on the
+        # lazily create (or recreate) the backends per-request based on the
         # latest `settings`.
-        self._base_url_override = base_url
-        self._api_key_override = api_key
-        self._model_override = model
-
-        self._client: Optional[AsyncOpenAI] = None
-        self._client_base_url: Optional[str] = None
-        self._client_api_key: Optional[str] = None
-
-    def _effective_base_url(self) -> str:
-        return self._base_url_override or settings.openai_base_url
-
-    def _effective_api_key(self) -> str:
-        return self._api_key_override or settings.openai_api_key
-
-    def _effective_model(self) -> str:
-        return self._model_override or settings.openai_chat_model
-
-    def _ensure_client(self) -> None:
-        base_url = self._effective_base_url()
-        api_key = self._effective_api_key()
-        if (
-            self._client is None
-            or self._client_base_url != base_url
-            or self._client_api_key != api_key
-        ):
-            self._client = AsyncOpenAI(base_url=base_url, api_key=api_key)
-            self._client_base_url = base_url
-            self._client_api_key = api_key
+        self.pool = LLMPool(base_url=base_url, api_key=api_key, model=model)
     
     async def chat(
         self,
         user_message: str,
         system_prompt: str,
         max_tokens: int = 2000,
-        temperature: float = 0.8
+        temperature: float = 0.8,
+        priority: Priority = Priority.NORMAL,
+        role: str = "lyrics"
     ) -> str:
         """
         LLMにチャットリクエストを送信
@@ -128,32 +108,120 @@ class LLMService:
             system_prompt: システムプロンプト
             max_tokens: 最大トークン数
             temperature: 温度
+            priority: スケジューラーでの優先度
+            role: 振り分け先バックエンドの担当（"lyrics" / "tags"）
         
         Returns:
             LLMの応答
+        
+        Raises:
+            LLMQueueFull: LLMキューが満杯
+        """
+        choices = await self._complete(
+            user_message=user_message,
+            system_prompt=system_prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            priority=priority,
+            role=role
+        )
+        return choices[0]
+    
+    async def chat_choices(
+        self,
+        user_message: str,
+        system_prompt: str,
+        n: int,
+        max_tokens: int = 2000,
+        temperature: float = 0.8,
+        priority: Priority = Priority.BULK
+    ) -> List[str]:
+        """
+        1回のリクエストでn件の応答候補を取得（`n`パラメータ対応バックエンド向け）
+        
+        Returns:
+            LLMの応答リスト
+        """
+        return await self._complete(
+            user_message=user_message,
+            system_prompt=system_prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            n=n,
+            priority=priority
+        )
+    
+    async def _complete(
+        self,
+        user_message: str,
+        system_prompt: str,
+        max_tokens: int,
+        temperature: float,
+        n: int = 1,
+        priority: Priority = Priority.NORMAL,
+        role: str = "lyrics",
+        backend: Optional[LLMBackend] = None
+    ) -> List[str]:
         """
-        self._ensure_client()
+        chat completions APIを呼び出し、全choiceの本文を返す
 
+        backend 未指定時はプールが担当バックエンドを選び、失敗時は他へフェイルオーバーする
+        """
         messages = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_message}
         ]
         
-        completion = await self._client.chat.completions.create(
-            model=self._effective_model(),
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature
-        )
+        params: Dict[str, Any] = {}
+        if n > 1:
+            params["n"] = n
+        if settings.llm_keep_alive:
+            # Ollama: モデルをメモリに保持する時間
+            params["extra_body"] = {"keep_alive": settings.llm_keep_alive}
+        
+        def call(target: LLMBackend) -> Awaitable[Any]:
+            return target.client.chat.completions.create(
+                model=target.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                **params
+            )
+        
+        if backend is not None:
+            completion = await self.pool.run_on(backend, priority, call)
+        else:
+            completion = await self.pool.run(role, priority, call)
         
-        return completion.choices[0].message.content
+        return [choice.message.content or "" for choice in completion.choices]
+    
+    async def warm_up(self) -> None:
+        """全バックエンドにモデルをロードさせる最小リクエスト（起動時・定期実行用）"""
+        results = await asyncio.gather(
+            *(
+                self._complete(
+                    user_message="ping",
+                    system_prompt="Reply with OK.",
+                    max_tokens=1,
+                    temperature=0.0,
+                    priority=Priority.BULK,
+                    backend=backend
+                )
+                for backend in self.pool.backends()
+            ),
+            return_exceptions=True
+        )
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors and len(errors) == len(results):
+            raise errors[0]
     
     async def generate_lyrics(
         self,
         theme: str,
         genre: str = "",
         language: str = "Japanese",
-        mood: str = ""
+        mood: str = "",
+        priority: Priority = Priority.NORMAL
     ) -> Dict[str, Any]:
         """
         歌詞を生成
@@ -163,6 +231,7 @@ class LLMService:
             genre: ジャンル
             language: 言語
             mood: ムード
+            priority: スケジューラーでの優先度
         
         Returns:
             {
@@ -171,57 +240,63 @@ class LLMService:
                 "parts": dict  # パート別秒数
             }
         """
-        prompt = f"""Create lyrics for the following:
+        response = await self.chat(
+            user_message=self._build_lyrics_prompt(theme, genre, language, mood),
+            system_prompt=LYRICS_GENERATE_SYSTEM_PROMPT,
+            temperature=0.85,
+            priority=priority
+        )
+        
+        return self._parse_lyrics_response(response)
+    
+    def _build_lyrics_prompt(self, theme: str, genre: str, language: str, mood: str) -> str:
+        """作詞用ユーザーメッセージを構築"""
+        return f"""Create lyrics for the following:
 Theme: {theme}
 Genre: {genre or 'any'}
 Language: {language}
 Mood: {mood or 'match the theme'}
 
 Generate complete song lyrics with structure tags."""
-        
-        response = await self.chat(
-            user_message=prompt,
-            system_prompt=LYRICS_GENERATE_SYSTEM_PROMPT,
-            temperature=0.85
-        )
-        
-        return self._parse_lyrics_response(response)
     
     def _parse_lyrics_response(self, response: str) -> Dict[str, Any]:
-        """歌詞レスポンスをパース"""
+        """
+        歌詞レスポンスをパース
+        
+        秒数は歌詞構造からローカルで見積もる（BPM未定のため既定テンポ）。
+        モデルが従来形式のJSONメタデータ行を出力した場合は読み飛ばす
+        """
         lines = response.strip().split("\n")
         
-        # 最初の行からJSONメタデータを抽出
-        metadata = {
-            "recommended_duration": 90,
-            "parts": {}
-        }
         lyrics_start = 0
-        
         for i, line in enumerate(lines):
             line = line.strip()
             if line.startswith("{") and "recommended_duration" in line:
-                try:
-                    metadata = json.loads(line)
-                    lyrics_start = i + 1
-                    break
-                except json.JSONDecodeError:
-                    pass
+                lyrics_start = i + 1
+                break
         
         # 歌詞部分を抽出
         lyrics = "\n".join(lines[lyrics_start:]).strip()
         
+        return {"lyrics": lyrics, **self._durations(lyrics)}
+    
+    @staticmethod
+    def _durations(lyrics: str, bpm: Optional[int] = None) -> Dict[str, Any]:
+        """歌詞構造から推奨秒数とパート別秒数を求める"""
+        analysis = analyze_lyrics(lyrics, bpm)
         return {
-            "lyrics": lyrics,
-            "recommended_duration": metadata.get("recommended_duration", 90),
-            "parts": metadata.get("parts", {})
+            "recommended_duration": analysis["recommended_duration"],
+            "parts": analysis["parts"]
         }
     
     async def generate_tags(
         self,
         lyrics: str = "",
         theme: str = "",
-        language: str = "Japanese"
+        language: str = "Japanese",
+        genre: str = "",
+        mood: str = "",
+        priority: Priority = Priority.INTERACTIVE
     ) -> Dict[str, Any]:
         """
         歌詞/テーマからタグを生成
@@ -230,6 +305,9 @@ Generate complete song lyrics with structure tags."""
             lyrics: 歌詞
             theme: テーマ
             language: 言語
+            genre: ジャンルのヒント
+            mood: ムードのヒント
+            priority: スケジューラーでの優先度
         
         Returns:
             {
@@ -242,6 +320,10 @@ Generate complete song lyrics with structure tags."""
         content = []
         if theme:
             content.append(f"Theme: {theme}")
+        if genre:
+            content.append(f"Genre: {genre}")
+        if mood:
+            content.append(f"Mood: {mood}")
         if lyrics:
             content.append(f"Lyrics:\n{lyrics[:1000]}")  # 長すぎる場合は切り詰め
         content.append(f"Language: {language}")
@@ -251,7 +333,9 @@ Generate complete song lyrics with structure tags."""
         response = await self.chat(
             user_message=prompt,
             system_prompt=TAGS_GENERATE_SYSTEM_PROMPT,
-            temperature=0.7
+            temperature=0.7,
+            priority=priority,
+            role="tags"
         )
         
         return self._parse_tags_response(response)
@@ -286,7 +370,9 @@ Generate complete song lyrics with structure tags."""
         theme: str,
         genre: str = "",
         language: str = "Japanese",
-        mood: str = ""
+        mood: str = "",
+        speculative: bool = False,
+        priority: Priority = Priority.NORMAL
     ) -> Dict[str, Any]:
         """
         歌詞とタグを一括生成
@@ -296,29 +382,234 @@ Generate complete song lyrics with structure tags."""
             genre: ジャンル
             language: 言語
             mood: ムード
+            speculative: True=歌詞生成と並行してテーマからタグを先行生成
+            priority: スケジューラーでの優先度
         
         Returns:
-            歌詞とタグの両方を含む辞書
+            歌詞とタグの両方を含む辞書。tag_pathにタグの取得経路
+            （sequential / speculative / refined）を含む
         """
+        if speculative:
+            return await self._generate_full_speculative(
+                theme=theme,
+                genre=genre,
+                language=language,
+                mood=mood,
+                priority=priority
+            )
+        
         # 歌詞生成
         lyrics_result = await self.generate_lyrics(
             theme=theme,
             genre=genre,
             language=language,
-            mood=mood
+            mood=mood,
+            priority=priority
         )
         
         # タグ生成
         tags_result = await self.generate_tags(
             lyrics=lyrics_result["lyrics"],
             theme=theme,
-            language=language
+            language=language,
+            priority=priority
         )
         
-        return {
-            **lyrics_result,
-            **tags_result
-        }
+        return self._merge_full(lyrics_result, tags_result, "sequential")
+    
+    async def _generate_full_speculative(
+        self,
+        theme: str,
+        genre: str,
+        language: str,
+        mood: str,
+        priority: Priority
+    ) -> Dict[str, Any]:
+        """歌詞とタグを並行生成し、歌詞完成後に必要ならタグを見直す"""
+        tags_task = asyncio.create_task(self.generate_tags(
+            theme=theme,
+            language=language,
+            genre=genre,
+            mood=mood,
+            priority=priority
+        ))
+        try:
+            lyrics_result = await self.generate_lyrics(
+                theme=theme,
+                genre=genre,
+                language=language,
+                mood=mood,
+                priority=priority
+            )
+        except BaseException:
+            tags_task.cancel()
+            raise
+        
+        try:
+            tags_result = await tags_task
+        except Exception:
+            # 先行生成に失敗した場合は通常の順次生成にフォールバック
+            tags_result = await self.generate_tags(
+                lyrics=lyrics_result["lyrics"],
+                theme=theme,
+                language=language,
+                priority=priority
+            )
+            return self._merge_full(lyrics_result, tags_result, "sequential")
+        
+        tag_path = "speculative"
+        if settings.llm_speculative_refine:
+            refined = await self._refine_tags(tags_result, lyrics_result["lyrics"], priority)
+            if refined is not None:
+                tags_result = refined
+                tag_path = "refined"
+        
+        return self._merge_full(lyrics_result, tags_result, tag_path)
+    
+    def _merge_full(
+        self,
+        lyrics_result: Dict[str, Any],
+        tags_result: Dict[str, Any],
+        tag_path: str
+    ) -> Dict[str, Any]:
+        """歌詞とタグの結果をまとめ、タグのBPMで秒数を見積もり直す"""
+        bpm = tags_result.get("bpm")
+        durations = self._durations(lyrics_result["lyrics"], bpm if isinstance(bpm, int) else None)
+        return {**lyrics_result, **tags_result, **durations, "tag_path": tag_path}
+    
+    async def _refine_tags(
+        self,
+        draft: Dict[str, Any],
+        lyrics: str,
+        priority: Priority
+    ) -> Optional[Dict[str, Any]]:
+        """
+        先行生成したタグを歌詞と照合（短い出力のみの軽量パス）
+        
+        Returns:
+            修正後のタグ。先行タグがそのまま使える場合や見直しに失敗した場合はNone
+        """
+        prompt = (
+            f"Draft tags:\n{json.dumps(draft, ensure_ascii=False)}\n\n"
+            f"Lyrics:\n{lyrics[:1000]}"
+        )
+        try:
+            response = await self.chat(
+                user_message=prompt,
+                system_prompt=TAGS_REFINE_SYSTEM_PROMPT,
+                max_tokens=200,
+                temperature=0.3,
+                priority=priority,
+                role="tags"
+            )
+        except Exception:
+            return None
+        
+        if not re.search(r'\{[^{}]*\}', response):
+            return None
+        
+        refined = self._parse_tags_response(response)
+        if refined == draft:
+            return None
+        return refined
+    
+    async def iter_lyrics_candidates(
+        self,
+        theme: str,
+        genre: str = "",
+        language: str = "Japanese",
+        mood: str = "",
+        n: int = 1
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        歌詞候補をn件生成し、完了した順に返す
+        
+        バックエンドが`n`パラメータに対応している場合（settings.llm_supports_n）は
+        1回のリクエストでまとめて取得し、それ以外は並列数を制限して個別に生成する。
+        
+        Yields:
+            generate_lyrics()の結果、または失敗時は {"error": str}
+        """
+        if n > 1 and settings.llm_supports_n:
+            try:
+                responses = await self.chat_choices(
+                    user_message=self._build_lyrics_prompt(theme, genre, language, mood),
+                    system_prompt=LYRICS_GENERATE_SYSTEM_PROMPT,
+                    n=n,
+                    temperature=0.85
+                )
+            except Exception as e:
+                yield {"error": str(e)}
+                return
+            for response in responses:
+                yield self._parse_lyrics_response(response)
+            return
+        
+        priority = Priority.BULK if n > 1 else Priority.NORMAL
+        async for result in self._as_completed(
+            lambda: self.generate_lyrics(
+                theme=theme,
+                genre=genre,
+                language=language,
+                mood=mood,
+                priority=priority
+            ),
+            n
+        ):
+            yield result
+    
+    async def iter_full_candidates(
+        self,
+        theme: str,
+        genre: str = "",
+        language: str = "Japanese",
+        mood: str = "",
+        n: int = 1,
+        speculative: bool = False
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        歌詞+タグの候補をn件生成し、完了した順に返す
+        
+        Yields:
+            generate_full()の結果、または失敗時は {"error": str}
+        """
+        priority = Priority.BULK if n > 1 else Priority.NORMAL
+        async for result in self._as_completed(
+            lambda: self.generate_full(
+                theme=theme,
+                genre=genre,
+                language=language,
+                mood=mood,
+                speculative=speculative,
+                priority=priority
+            ),
+            n
+        ):
+            yield result
+    
+    async def _as_completed(
+        self,
+        factory: Callable[[], Awaitable[Dict[str, Any]]],
+        n: int
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """factoryをn回、最大settings.llm_candidate_concurrency並列で実行し完了順に返す"""
+        semaphore = asyncio.Semaphore(max(1, settings.llm_candidate_concurrency))
+        
+        async def run_one() -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    return await factory()
+                except Exception as e:
+                    return {"error": str(e)}
+        
+        tasks = [asyncio.create_task(run_one()) for _ in range(n)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # 呼び出し側が途中で離脱した場合、残りのLLM呼び出しを止める
+            for task in tasks:
+                task.cancel()
 
 
 # シングルトンインスタンス
@@ -0,0 +1,246 @@
+"""
+Longform Renderer - セクション並列生成による長尺曲
+
+構造タグ付き歌詞をセクション単位で longform_chunk_seconds 以下のチャンクにまとめ、
+全チャンクを同じシード・タグ・BPM・調で同時に上流へ投入する。上流の複数ワーカーで
+並列に生成されるため、全体の所要時間は最も長いチャンクの生成時間に近づく。
+完了後、各チャンクのWAVをプロセスプールでクロスフェード連結し、
+アップロードストアに保存する（つなぎ目は /api/generate の repaint で整えられる）。
+
+ジョブの状態は共有ストアに保存するため、どのワーカーからでも参照できる。
+"""
+import asyncio
+import logging
+import random
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional, List, Dict, Any, AsyncIterator
+
+from config import settings
+from services.ace_step_client import ace_step_client, upstream_audio_path
+from services.audio_stitch import stitch_wav
+from services.caption_cache import caption_cache
+from services.lyrics_analyzer import parse_sections, analyze_lyrics, DEFAULT_BPM
+from services.shared_state import shared_state
+from services.upload_store import upload_store
+
+
+logger = logging.getLogger(__name__)
+
+_CHUNK_SIZE = 64 * 1024
+
+_DEFAULT_KEY_SCALE = "C major"
+
+
+def plan_chunks(lyrics: str, bpm: Optional[int], max_seconds: float) -> List[Dict[str, Any]]:
+    """
+    歌詞をチャンクに分割
+
+    セクションの途中では分割せず、見積もり秒数が max_seconds を超えない範囲で
+    連続するセクションをまとめる（1セクションで超える場合はそのまま1チャンク）
+
+    Returns:
+        [{"sections": [パート名], "lyrics": str, "seconds": float}]
+    """
+    sections = parse_sections(lyrics)
+    estimates = analyze_lyrics(lyrics, bpm)["sections"]
+    chunks: List[Dict[str, Any]] = []
+    current: Optional[Dict[str, Any]] = None
+    for section, estimate in zip(sections, estimates):
+        text = "\n".join([f"[{section['tag']}]", *section["lines"]])
+        if current is None or current["seconds"] + estimate["seconds"] > max_seconds:
+            current = {"sections": [], "lyrics": [], "seconds": 0.0}
+            chunks.append(current)
+        current["sections"].append(estimate["name"])
+        current["lyrics"].append(text)
+        current["seconds"] += estimate["seconds"]
+    return [{**chunk, "lyrics": "\n\n".join(chunk["lyrics"])} for chunk in chunks]
+
+
+async def _read_file(path: Path) -> AsyncIterator[bytes]:
+    with path.open("rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, 1024 * 1024)
+            if not chunk:
+                return
+            yield chunk
+
+
+class LongformRenderer:
+    """長尺生成ジョブの実行"""
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: set = set()  # 実行中のジョブ（GC防止のため保持）
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=settings.longform_stitch_workers)
+        return self._executor
+
+    @staticmethod
+    def _key(job_id: str) -> str:
+        return f"longform:{job_id}"
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """ジョブの状態（存在しない・期限切れの場合はNone）"""
+        return await shared_state.get(self._key(job_id))
+
+    async def _save(self, job: Dict[str, Any]) -> None:
+        await shared_state.set(self._key(job["job_id"]), job, ttl=settings.longform_ttl)
+
+    async def start(self, params: Dict[str, Any], crossfade: float) -> Dict[str, Any]:
+        """
+        チャンクを全て上流に投入し、完了待ちと連結をバックグラウンドで開始
+
+        Args:
+            params: release_task() の共通パラメータ（lyrics を含む）
+            crossfade: つなぎ目のクロスフェード秒数
+
+        Returns:
+            ジョブの状態
+
+        Raises:
+            ValueError: 歌詞にセクションがない・長すぎる
+        """
+        # 全チャンクでタグ・BPM・調を揃えるため、LMによるcaptionの強化は一度だけ行い、
+        # チャンクごとの書き換え（use_cot_caption / use_cot_language）は無効にする
+        enhanced = await caption_cache.enhance(
+            params.get("prompt", ""), params["lyrics"], params.get("model", "")
+        ) or {}
+        prompt = enhanced.get("caption") or params.get("prompt", "")
+        bpm, key_scale = params.get("bpm"), params.get("key_scale")
+        if bpm is None:
+            bpm = enhanced.get("bpm") if isinstance(enhanced.get("bpm"), int) else DEFAULT_BPM
+        if key_scale is None:
+            key_scale = enhanced.get("key_scale") or _DEFAULT_KEY_SCALE
+        chunks = plan_chunks(params["lyrics"], bpm, settings.longform_chunk_seconds)
+        if not chunks:
+            raise ValueError("Lyrics have no sections")
+        total = sum(c["seconds"] for c in chunks)
+        if total > settings.longform_max_duration:
+            raise ValueError(
+                f"Estimated duration {total:.0f}s exceeds {settings.longform_max_duration}s"
+            )
+
+        shared = {
+            **params,
+            "prompt": prompt,
+            "use_cot_caption": False,
+            "use_cot_language": False,
+            "bpm": bpm,
+            "key_scale": key_scale,
+            "seed": params.get("seed") if params.get("seed") is not None else random.randint(0, 2**31 - 1),
+            "use_random_seed": False,
+            # 連結はWAVで行う
+            "audio_format": "wav",
+            "batch_size": 1,
+        }
+
+        async def release(chunk: Dict[str, Any]) -> str:
+            # 後ろのチャンクと重ねる分だけ長めに生成する
+            duration = int(min(300, max(10, round(chunk["seconds"] + crossfade))))
+            result = await ace_step_client.release_task(
+                **{**shared, "lyrics": chunk["lyrics"], "audio_duration": duration}
+            )
+            task_id = result.get("data", {}).get("task_id", "")
+            if not task_id:
+                raise RuntimeError("Failed to create section task")
+            return task_id
+
+        released = await asyncio.gather(*(release(c) for c in chunks), return_exceptions=True)
+        errors = [r for r in released if isinstance(r, BaseException)]
+        if errors:
+            # 投入できたチャンクは追跡するジョブがないため放棄する
+            await asyncio.gather(*(
+                self._abandon(task_id) for task_id in released if isinstance(task_id, str)
+            ))
+            raise errors[0]
+        task_ids = released
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": "rendering",
+            "seed": shared["seed"],
+            "bpm": bpm,
+            "key_scale": key_scale,
+            "chunks": [
+                {"task_id": task_id, "sections": c["sections"], "seconds": round(c["seconds"], 1)}
+                for task_id, c in zip(task_ids, chunks)
+            ],
+            "audio_id": None,
+            "duration": None,
+            "seams": [],
+            "error": None,
+        }
+        await self._save(job)
+
+        task = asyncio.create_task(self._finish(job, crossfade))
+        self._jobs.add(task)
+        task.add_done_callback(self._jobs.discard)
+        return job
+
+    async def _finish(self, job: Dict[str, Any], crossfade: float) -> None:
+        """全チャンクの完了を待ち、ダウンロードして連結する"""
+        try:
+            results = await asyncio.gather(*(
+                ace_step_client.wait_for_completion(c["task_id"], timeout=settings.longform_timeout)
+                for c in job["chunks"]
+            ))
+            job["status"] = "stitching"
+            await self._save(job)
+
+            with tempfile.TemporaryDirectory(prefix="longform-") as tmp:
+                directory = Path(tmp)
+                paths = await asyncio.gather(*(
+                    self._download(upstream_audio_path(r[0].file), directory / f"{i}.wav")
+                    for i, r in enumerate(results)
+                ))
+                out_path = directory / "longform.wav"
+                loop = asyncio.get_running_loop()
+                stitched = await loop.run_in_executor(
+                    self._pool(), stitch_wav, [str(p) for p in paths], str(out_path), crossfade
+                )
+                saved = await upload_store.save(_read_file(out_path), "longform.wav")
+
+            job.update(
+                status="succeeded",
+                audio_id=saved["audio_id"],
+                duration=stitched["duration"],
+                seams=stitched["seams"],
+            )
+        except Exception as e:
+            logger.warning("Longform job %s failed: %s", job["job_id"], e)
+            job.update(status="failed", error=str(e) or type(e).__name__)
+        await self._save(job)
+
+    @staticmethod
+    async def _abandon(task_id: str) -> None:
+        """上流にキャンセルを転送（対応時）し、タスクを放棄済みにする"""
+        try:
+            await ace_step_client.cancel_task(task_id)
+        except Exception as e:
+            logger.debug("Cancel of section task %s failed: %s", task_id, e)
+        await ace_step_client.abandon(task_id)
+
+    async def _download(self, path: str, target: Path) -> Path:
+        """上流の音声をストリーミングでファイルに保存"""
+        with target.open("wb") as f:
+            async with ace_step_client.stream_audio(path) as response:
+                async for chunk in response.aiter_bytes(_CHUNK_SIZE):
+                    await asyncio.to_thread(f.write, chunk)
+        return target
+
+    async def stop(self) -> None:
+        """実行中のジョブを中断し、プロセスプールを閉じる"""
+        for task in list(self._jobs):
+            task.cancel()
+        await asyncio.gather(*self._jobs, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# シングルトンインスタンス
+longform_renderer = LongformRenderer()
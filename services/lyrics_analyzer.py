@@ -0,0 +1,195 @@
+"""
+Lyrics Analyzer - 歌詞構造から曲の長さを見積もる
+
+[verse] / [chorus] / [inst] などの構造タグで歌詞をセクションに分け、
+各行の音節数（日本語はモーラ、英語は母音グループによる概算）から
+BPMに応じたセクション別・全体の秒数を求める。LLMを使わない決定的な処理なので、
+ユーザーが書いた歌詞にもそのまま使える。
+
+見積もりの前提:
+    - 1音節（モーラ）= 8分音符
+    - 各行の後に1拍の休符を置き、行は小節単位（4拍）に切り上げる
+    - 歌詞のないセクションは種類ごとの既定小節数
+"""
+import math
+import re
+from typing import Optional, List, Dict, Any
+
+
+DEFAULT_BPM = 120
+
+# 生成時間の範囲（GenerateRequest.audio_duration と同じ）
+MIN_DURATION = 10
+MAX_DURATION = 300
+
+BEATS_PER_BAR = 4
+BEATS_PER_SYLLABLE = 0.5
+REST_BEATS_PER_LINE = 1
+
+# 歌詞のないセクションの小節数
+_INSTRUMENTAL_BARS = {
+    "intro": 4,
+    "outro": 4,
+    "inst": 8,
+    "instrumental": 8,
+    "interlude": 8,
+    "solo": 8,
+    "break": 4,
+}
+_DEFAULT_INSTRUMENTAL_BARS = 4
+
+_TAG_RE = re.compile(r"^\s*\[([^\]]+)\]\s*$")
+_SECTION_NAME_RE = re.compile(r"^([a-z\-]+?)[\s\-_]*(\d*)(?::.*)?$")
+
+# モーラに数えない小書き文字（直前の文字と合わせて1モーラ）
+_SMALL_KANA = set("ゃゅょぁぃぅぇぉゎャュョァィゥェォヮ")
+_KANA_RE = re.compile(r"[ぁ-ゖァ-ヺー]")
+_KANJI_RE = re.compile(r"[㐀-䶿一-鿿々]")
+# 漢字1文字あたりの平均モーラ数（音読み・訓読みの平均的な長さ）
+_MORAE_PER_KANJI = 1.7
+
+_WORD_RE = re.compile(r"[a-z']+")
+_VOWEL_GROUP_RE = re.compile(r"[aeiouy]+")
+
+
+def count_morae(text: str) -> float:
+    """日本語のモーラ数（漢字は読みの平均長で概算）"""
+    kana = sum(1 for ch in _KANA_RE.findall(text) if ch not in _SMALL_KANA)
+    return kana + len(_KANJI_RE.findall(text)) * _MORAE_PER_KANJI
+
+
+def count_english_syllables(word: str) -> int:
+    """英単語の音節数（母音グループによる概算）"""
+    word = word.lower().strip("'")
+    if not word:
+        return 0
+    groups = len(_VOWEL_GROUP_RE.findall(word))
+    # 語末の黙字e（make, love）。ただし -le（little）は音節になる
+    if word.endswith("e") and not word.endswith(("le", "ee", "ye")) and groups > 1:
+        groups -= 1
+    # 過去形の -ed は t/d の後以外では音節にならない（played, loved）
+    if word.endswith("ed") and len(word) > 3 and word[-3] not in "td" and groups > 1:
+        groups -= 1
+    return max(1, groups)
+
+
+def count_syllables(line: str) -> float:
+    """1行の音節数（日本語と英語の混在に対応）"""
+    morae = count_morae(line)
+    english = sum(count_english_syllables(w) for w in _WORD_RE.findall(line.lower()))
+    # 数字は1桁を1音節とみなす
+    digits = len(re.findall(r"\d", line))
+    return morae + english + digits
+
+
+def _section_kind(tag: str) -> tuple:
+    """構造タグを（種類, パート名）に分解（"Verse 1" → ("verse", "verse1")）"""
+    normalized = tag.strip().lower()
+    match = _SECTION_NAME_RE.match(normalized)
+    if not match:
+        return normalized, normalized.replace(" ", "_")
+    kind, number = match.group(1).rstrip("-"), match.group(2)
+    return kind, f"{kind}{number}"
+
+
+def _line_beats(syllables: float) -> int:
+    """1行の拍数（小節単位に切り上げ）"""
+    beats = syllables * BEATS_PER_SYLLABLE + REST_BEATS_PER_LINE
+    return max(1, math.ceil(beats / BEATS_PER_BAR)) * BEATS_PER_BAR
+
+
+def parse_sections(lyrics: str) -> List[Dict[str, Any]]:
+    """
+    歌詞を構造タグでセクションに分割
+
+    Returns:
+        [{"tag": "verse", "name": "verse1", "lines": [...]}]
+        タグより前の歌詞は "verse" として扱う
+    """
+    sections: List[Dict[str, Any]] = []
+    current: Optional[Dict[str, Any]] = None
+    for raw in lyrics.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        match = _TAG_RE.match(line)
+        if match:
+            kind, name = _section_kind(match.group(1))
+            current = {"tag": kind, "name": name, "lines": []}
+            sections.append(current)
+            continue
+        if current is None:
+            current = {"tag": "verse", "name": "verse", "lines": []}
+            sections.append(current)
+        current["lines"].append(line)
+
+    # 番号なしの同名パート（[chorus] が2回など）に連番を振る
+    counts: Dict[str, int] = {}
+    for section in sections:
+        counts[section["name"]] = counts.get(section["name"], 0) + 1
+    seen: Dict[str, int] = {}
+    for section in sections:
+        name = section["name"]
+        if counts[name] > 1:
+            seen[name] = seen.get(name, 0) + 1
+            section["name"] = f"{name}{seen[name]}" if not name[-1].isdigit() else f"{name}_{seen[name]}"
+    return sections
+
+
+def analyze_lyrics(lyrics: str, bpm: Optional[int] = None) -> Dict[str, Any]:
+    """
+    歌詞の構造を解析し、セクション別・全体の秒数を見積もる
+
+    Args:
+        lyrics: 構造タグ付き歌詞
+        bpm: テンポ（省略時は120）
+
+    Returns:
+        {
+            "bpm": int,
+            "recommended_duration": int,  # 生成時間の範囲に収めた推奨秒数
+            "total_seconds": float,  # 見積もりそのもの（範囲外もあり得る）
+            "parts": {"verse1": 16, ...},  # パート別秒数（LLMの parts と同じ形式）
+            "sections": [{"name", "tag", "lines", "syllables", "bars", "seconds"}]
+        }
+    """
+    bpm = bpm if bpm and bpm > 0 else DEFAULT_BPM
+    seconds_per_beat = 60.0 / bpm
+
+    sections = []
+    total_beats = 0
+    for section in parse_sections(lyrics):
+        lines = section["lines"]
+        if lines:
+            syllables = [count_syllables(line) for line in lines]
+            beats = sum(_line_beats(s) for s in syllables)
+        else:
+            syllables = []
+            beats = _INSTRUMENTAL_BARS.get(section["tag"], _DEFAULT_INSTRUMENTAL_BARS) * BEATS_PER_BAR
+        total_beats += beats
+        sections.append({
+            "name": section["name"],
+            "tag": section["tag"],
+            "lines": len(lines),
+            "syllables": round(sum(syllables)),
+            "bars": beats // BEATS_PER_BAR,
+            "seconds": round(beats * seconds_per_beat, 1),
+        })
+
+    total_seconds = total_beats * seconds_per_beat
+    return {
+        "bpm": bpm,
+        "recommended_duration": _clamp_duration(total_seconds),
+        "total_seconds": round(total_seconds, 1),
+        "parts": {s["name"]: int(round(s["seconds"])) for s in sections},
+        "sections": sections,
+    }
+
+
+def _clamp_duration(seconds: float) -> int:
+    return int(min(MAX_DURATION, max(MIN_DURATION, math.ceil(seconds))))
+
+
+def estimate_duration(lyrics: str, bpm: Optional[int] = None) -> int:
+    """生成時間（audio_duration）に使う推奨秒数"""
+    return analyze_lyrics(lyrics, bpm)["recommended_duration"]
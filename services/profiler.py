@@ -0,0 +1,242 @@
+"""
+Profiler - 稼働中プロセスのオンデマンドプロファイリング
+
+/api/admin/profile と /api/admin/memory から呼ばれる。どちらも要求された秒数だけ
+動作して停止するため、要求がない間のコストはない（サンプリングスレッドも
+tracemalloc も動いていない）。
+
+- サンプリングプロファイラ: インターバルタイマーのシグナルで全スレッドのスタックを読み、
+  flamegraph.pl / speedscope で読める collapsed 形式で返す。イベントループの
+  スレッドでは実行中の asyncio タスク（コルーチン名）をスタックの根に付ける。
+  wall モードは ITIMER_REAL で待機中のスタックも数え、cpu モードは ITIMER_PROF
+  （プロセスのCPU時間）で記録して待機中とみなせるスタック
+  （selectors の epoll 待ち、ロック・キュー待ち）を除く。
+- メモリ: tracemalloc の開始時と終了時のスナップショットを比較し、
+  増加量の大きい確保箇所を返す。
+
+uvicornワーカーが複数の場合は、リクエストを受けたワーカーのみが対象。
+"""
+import asyncio
+import linecache
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Optional, Dict, Any
+
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# cpu モードで待機中とみなす最上位フレーム（ファイル名の末尾, 関数名）
+_IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+class ProfilerBusy(Exception):
+    """別のプロファイルが実行中"""
+    pass
+
+
+def _short_path(filename: str) -> str:
+    """アプリ内は相対パス、site-packages / 標準ライブラリはパッケージ以下だけ残す"""
+    if filename.startswith(_APP_DIR + os.sep):
+        return os.path.relpath(filename, _APP_DIR)
+    parts = filename.split(os.sep)
+    for marker in ("site-packages", "dist-packages"):
+        if marker in parts:
+            return "/".join(parts[parts.index(marker) + 1:])
+    return parts[-1]
+
+
+def _frame_label(code) -> str:
+    """collapsed 形式のフレーム名（区切り文字の ; は含めない）"""
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES
+
+
+def _task_label(loop: asyncio.AbstractEventLoop) -> Optional[str]:
+    """イベントループで実行中のタスク"""
+    task = asyncio.current_task(loop)
+    if task is None:
+        return None
+    coro = task.get_coro()
+    name = getattr(coro, "__qualname__", None) or task.get_name()
+    return f"task:{name}".replace(";", ":")
+
+
+class _Sampler:
+    """
+    タイマーシグナルごとにスタックを記録する
+
+    ハンドラはメインスレッド（イベントループ）で割り込まれたフレームを受け取るため、
+    GILを手放している epoll 待ちに偏らずに実行中のコードを記録できる。
+    他のスレッドは同じタイミングで sys._current_frames() から読む
+    """
+
+    def __init__(self, mode: str, loop: asyncio.AbstractEventLoop):
+        self.mode = mode
+        self.loop = loop
+        self.main_thread = threading.get_ident()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.idle = 0
+        self._names: Dict[int, str] = {}
+
+    def handle(self, signum, frame) -> None:
+        self._record(self.main_thread, frame)
+        for ident, other in sys._current_frames().items():
+            if ident != self.main_thread:
+                self._record(ident, other)
+
+    def _record(self, ident: int, frame) -> None:
+        if frame is None:
+            return
+        if self.mode == "cpu" and _is_idle(frame):
+            self.idle += 1
+            return
+        labels = []
+        while frame is not None:
+            labels.append(_frame_label(frame.f_code))
+            frame = frame.f_back
+        if ident not in self._names:
+            self._names = {t.ident: t.name for t in threading.enumerate()}
+        root = [f"thread:{self._names.get(ident, ident)}".replace(";", ":")]
+        if ident == self.main_thread:
+            task = _task_label(self.loop)
+            if task:
+                root.append(task)
+        self.stacks[";".join(root + labels[::-1])] += 1
+        self.samples += 1
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+class Profiler:
+    """サンプリングプロファイラと tracemalloc の差分（同時に1つずつ）"""
+
+    def __init__(self):
+        self._cpu_lock = asyncio.Lock()
+        self._memory_lock = asyncio.Lock()
+
+    async def profile(self, seconds: float, interval: float, mode: str = "wall") -> Dict[str, Any]:
+        """
+        seconds 秒間サンプリング
+
+        Args:
+            seconds: サンプリング時間
+            interval: サンプリング間隔（秒）
+            mode: "wall"（経過時間で記録）/ "cpu"（CPU時間で記録し、待機中のスタックを除く）
+
+        Returns:
+            {"collapsed": str, "samples": int, "idle_samples": int, "seconds": float}
+
+        Raises:
+            ProfilerBusy: 別のプロファイルが実行中
+            RuntimeError: この環境ではサンプリングできない
+        """
+        if not hasattr(signal, "setitimer"):
+            raise RuntimeError("Sampling profiler requires signal.setitimer (not available on this platform)")
+        if threading.current_thread() is not threading.main_thread():
+            raise RuntimeError("Sampling profiler requires the event loop to run in the main thread")
+        if self._cpu_lock.locked():
+            raise ProfilerBusy("Another profile is running")
+
+        async with self._cpu_lock:
+            sampler = _Sampler(mode, asyncio.get_running_loop())
+            timer, signum = (
+                (signal.ITIMER_PROF, signal.SIGPROF) if mode == "cpu"
+                else (signal.ITIMER_REAL, signal.SIGALRM)
+            )
+            previous = signal.signal(signum, sampler.handle)
+            started = time.perf_counter()
+            try:
+                signal.setitimer(timer, interval, interval)
+                await asyncio.sleep(seconds)
+            finally:
+                signal.setitimer(timer, 0)
+                signal.signal(signum, previous)
+
+        return {
+            "collapsed": sampler.collapsed(),
+            "samples": sampler.samples,
+            "idle_samples": sampler.idle,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+
+    async def memory_diff(
+        self,
+        seconds: float,
+        limit: int = 20,
+        group_by: str = "lineno",
+        frames: int = 1,
+    ) -> Dict[str, Any]:
+        """
+        seconds 秒間の確保量の差分（増加量の大きい順）
+
+        既に tracemalloc が動いている場合はそのまま使い、終了後も止めない
+
+        Args:
+            seconds: 計測時間
+            limit: 返す確保箇所の数
+            group_by: "lineno" / "filename" / "traceback"
+            frames: 保存するスタックの深さ（traceback 用）
+
+        Raises:
+            ProfilerBusy: 別の計測が実行中
+        """
+        if self._memory_lock.locked():
+            raise ProfilerBusy("Another memory snapshot is running")
+        async with self._memory_lock:
+            started_here = not tracemalloc.is_tracing()
+            if started_here:
+                tracemalloc.start(frames)
+            try:
+                before = await asyncio.to_thread(tracemalloc.take_snapshot)
+                await asyncio.sleep(seconds)
+                after = await asyncio.to_thread(tracemalloc.take_snapshot)
+                traced, peak = tracemalloc.get_traced_memory()
+            finally:
+                if started_here:
+                    tracemalloc.stop()
+
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            tracemalloc.Filter(False, linecache.__file__),
+        ]
+        stats = await asyncio.to_thread(
+            after.filter_traces(filters).compare_to, before.filter_traces(filters), group_by
+        )
+        return {
+            "seconds": seconds,
+            "traced_bytes": traced,
+            "peak_bytes": peak,
+            "size_diff": sum(s.size_diff for s in stats),
+            "top": [
+                {
+                    "location": [f"{_short_path(f.filename)}:{f.lineno}" for f in s.traceback],
+                    "size_diff": s.size_diff,
+                    "size": s.size,
+                    "count_diff": s.count_diff,
+                    "count": s.count,
+                }
+                for s in stats[:limit]
+            ],
+        }
+
+
+# シングルトンインスタンス
+profiler = Profiler()
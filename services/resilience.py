@@ -0,0 +1,214 @@
+"""
+Resilience - 上流呼び出しの耐障害レイヤー
+
+ACE-Step API / LLM API への呼び出しに、エンドポイント別のデッドライン、
+冪等な呼び出しのジッター付き再試行、p95ベースのヘッジ（重複リクエスト）、
+サーキットブレーカーを適用する。
+"""
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Optional, Dict, Callable, Awaitable, TypeVar, Deque
+
+import httpx
+import openai
+
+from config import settings
+
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """サーキットブレーカーが開いている（バックエンド不調のため即時失敗）"""
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """バックエンド不調を示す一時的なエラーか"""
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, httpx.TransportError)):
+        return True
+    if isinstance(exc, openai.APIConnectionError):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """
+    サーキットブレーカー
+
+    連続失敗が閾値に達すると open になり、reset_timeout 経過後に
+    1件だけ試行（half-open）して成功すれば closed に戻る。
+    """
+
+    def __init__(self, name: str, failure_threshold: int = None, reset_timeout: float = None):
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def failure_threshold(self) -> int:
+        return self._failure_threshold or settings.breaker_failure_threshold
+
+    @property
+    def reset_timeout(self) -> float:
+        return self._reset_timeout or settings.breaker_reset_timeout
+
+    @property
+    def state(self) -> str:
+        """closed / open / half_open"""
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> bool:
+        """
+        呼び出し前チェック。open中は CircuitOpenError
+
+        Returns:
+            half-open の試行枠を取った場合True（結果を記録しない場合は release_trial() で返す）
+        """
+        state = self.state
+        if state == "open" or (state == "half_open" and self._trial_in_flight):
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+        if state == "half_open":
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def release_trial(self) -> None:
+        """試行が中断された（キャンセル等）場合に、成否を数えずに試行枠を返す"""
+        self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._trial_in_flight = False
+        if self._opened_at is not None or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """直近のレイテンシからパーセンタイルを推定"""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, q: float, min_samples: int = 20) -> Optional[float]:
+        """サンプル不足の場合はNone"""
+        if len(self._samples) < min_samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * q))
+        return ordered[index]
+
+
+class BackendGuard:
+    """1つのバックエンドに対する耐障害ポリシー"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.breaker = CircuitBreaker(name)
+        self._latencies: Dict[str, LatencyTracker] = {}
+
+    def _tracker(self, endpoint: str) -> LatencyTracker:
+        if endpoint not in self._latencies:
+            self._latencies[endpoint] = LatencyTracker()
+        return self._latencies[endpoint]
+
+    def hedge_delay(self, endpoint: str) -> float:
+        """ヘッジ送信までの待機（p95、サンプル不足時は最小値）"""
+        p95 = self._tracker(endpoint).percentile(0.95)
+        return max(settings.hedge_min_delay, p95 or 0.0)
+
+    async def call(
+        self,
+        endpoint: str,
+        fn: Callable[[], Awaitable[T]],
+        timeout: float,
+        retries: int = 0,
+        hedge: bool = False
+    ) -> T:
+        """
+        耐障害ポリシーを適用して呼び出す
+
+        Args:
+            endpoint: レイテンシ統計のキー
+            fn: 呼び出し（再試行・ヘッジのため何度でも呼べること）
+            timeout: 1試行あたりのデッドライン（秒）
+            retries: 一時的エラー時の再試行回数（冪等な呼び出しのみ）
+            hedge: p95を超えたら重複リクエストを送る（冪等な呼び出しのみ）
+        """
+        attempt = 0
+        while True:
+            trial = self.breaker.before_call()
+            start = time.monotonic()
+            try:
+                if hedge and settings.hedge_enabled:
+                    result = await asyncio.wait_for(self._hedged(endpoint, fn), timeout)
+                else:
+                    result = await asyncio.wait_for(fn(), timeout)
+            except Exception as e:
+                if not is_transient_error(e):
+                    # 4xx等はバックエンド自体は正常
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt >= retries:
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise TimeoutError(
+                            f"{self.name} {endpoint} timed out after {timeout} seconds"
+                        ) from e
+                    raise
+                backoff = settings.retry_backoff_base * (2 ** attempt)
+                await asyncio.sleep(backoff * random.uniform(0.5, 1.5))
+                attempt += 1
+                continue
+            except BaseException:
+                # キャンセルされた試行はバックエンドの成否が分からないため数えない
+                if trial:
+                    self.breaker.release_trial()
+                raise
+
+            self.breaker.record_success()
+            self._tracker(endpoint).record(time.monotonic() - start)
+            return result
+
+    async def _hedged(self, endpoint: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """一定時間応答がなければ同じ呼び出しをもう1本送り、先に成功した方を返す"""
+        first = asyncio.ensure_future(fn())
+        pending = {first}
+        error: Optional[BaseException] = None
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_delay(endpoint))
+            if done:
+                pending = set()
+                return first.result()
+
+            pending.add(asyncio.ensure_future(fn()))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,108 @@
+"""
+Sample Pool - ランダムサンプルの先行取得プール
+
+上流の /create_random_sample はGPUホストのLMを呼ぶため、UIの「ランダム」ボタンが遅い。
+sample_type ごとにサンプルを sample_pool_size 件まで先に取得しておき、
+リクエストにはプールから即座に返す。補充は上流の /v1/stats でキューが
+空いているときだけ行い、ピーク時の本番生成からGPU時間を奪わない。
+
+プールはワーカープロセスごとに持つ。デフォルトは無効で、SAMPLE_POOL_SIZE を
+1以上（5程度）にすると有効になる。無効時は毎回上流から取得する。
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Optional, Dict, Any, Deque
+
+from config import settings
+from services.ace_step_client import ace_step_client
+
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class SamplePool:
+    """sample_type 別のランダムサンプルプール"""
+
+    def __init__(self):
+        self._pools: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.sample_pool_size > 0 and bool(settings.sample_pool_types)
+
+    def _pool(self, sample_type: str) -> Deque[Dict[str, Any]]:
+        return self._pools.setdefault(sample_type, deque())
+
+    def start(self) -> None:
+        """バックグラウンドで補充を開始"""
+        if not self.enabled or self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """バックグラウンドタスクを停止"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def pop(self, sample_type: str) -> Optional[Dict[str, Any]]:
+        """プールからサンプルを取り出す（空ならNone）"""
+        pool = self._pools.get(sample_type)
+        sample = pool.popleft() if pool else None
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return sample
+
+    def stats(self) -> Dict[str, int]:
+        """sample_type 別の在庫数"""
+        return {t: len(self._pool(t)) for t in settings.sample_pool_types}
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._refill()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug("Sample pool refill skipped: %s", e)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.sample_pool_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _refill(self) -> None:
+        """上流がアイドルの間、不足しているプールを1件ずつ補充"""
+        while True:
+            short = [
+                t for t in settings.sample_pool_types
+                if len(self._pool(t)) < settings.sample_pool_size
+            ]
+            if not short or not await self._upstream_idle():
+                return
+            # 最も在庫の少ないタイプから補充
+            sample_type = min(short, key=lambda t: len(self._pool(t)))
+            result = await ace_step_client.get_random_sample(sample_type)
+            data = result.get("data")
+            if result.get("code", 200) != 200 or not data:
+                return
+            self._pool(sample_type).append(data)
+
+    async def _upstream_idle(self) -> bool:
+        """上流のキューに待ちがなく、実行中のジョブが閾値以下か"""
+        result = await ace_step_client.get_stats()
+        data = result.get("data", {})
+        jobs = data.get("jobs", {})
+        return (
+            jobs.get("queued", data.get("queue_size", 0)) == 0
+            and jobs.get("running", 0) <= settings.sample_pool_max_running
+        )
+
+
+# シングルトンインスタンス
+sample_pool = SamplePool()
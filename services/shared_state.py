@@ -0,0 +1,255 @@
+"""
+Shared State - ワーカープロセス間で共有する状態ストア
+
+`uvicorn --workers N` で複数プロセスを起動した場合に、タスク状態・キャッシュ・
+Idempotency-Key・ロックなどを共有するためのキーバリューストア。
+
+バックエンドは settings.shared_state_url で選択する:
+- memory://                  プロセス内のみ（単一ワーカー向け、デフォルト）
+- sqlite:///data/state.db    同一ホストの複数ワーカーで共有
+- redis://host:6379/0        複数ホストで共有（redis パッケージが必要）
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Optional, Dict, Any, Tuple, AsyncIterator
+from urllib.parse import urlparse
+
+from config import settings
+
+
+_BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+class SharedState(ABC):
+    """共有状態ストアのインターフェース（値はJSONシリアライズ可能なもの）"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        """値を取得（存在しない・期限切れの場合はNone）"""
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """値を保存（ttl秒後に失効）"""
+
+    @abstractmethod
+    async def set_if_absent(self, key: str, value: Any, ttl: float) -> bool:
+        """キーが存在しない場合のみ保存（リース/ロック用）。保存できたらTrue"""
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """キーを削除"""
+
+    async def close(self) -> None:
+        pass
+
+    @asynccontextmanager
+    async def keep_alive(self, key: str, value: Any, ttl: float) -> AsyncIterator[None]:
+        """
+        ブロックの実行中、key を value のまま ttl 秒ずつ延長し続ける（リース/ロック用）
+
+        抜けるときは延長の書き込みが終わるまで待つため、その後の set / delete が
+        遅れて届いた延長で上書きされることはない
+        """
+        stop = asyncio.Event()
+
+        async def refresh() -> None:
+            while not stop.is_set():
+                try:
+                    await asyncio.wait_for(stop.wait(), ttl / 3)
+                except asyncio.TimeoutError:
+                    await self.set(key, value, ttl=ttl)
+
+        refresher = asyncio.create_task(refresh())
+        try:
+            yield
+        finally:
+            stop.set()
+            await asyncio.gather(refresher, return_exceptions=True)
+
+
+class MemoryState(SharedState):
+    """プロセス内のみの状態ストア"""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self._last_purge = 0.0
+
+    def _purge(self) -> None:
+        """読まれないまま期限切れになったキーを定期的に削除する"""
+        now = time.time()
+        if now - self._last_purge > 60:
+            expired = [
+                key for key, (_, expires_at) in self._data.items()
+                if expires_at is not None and expires_at <= now
+            ]
+            for key in expired:
+                del self._data[key]
+            self._last_purge = now
+
+    def _live(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._live(key)
+        return entry[0] if entry else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._purge()
+        self._data[key] = (value, time.time() + ttl if ttl else None)
+
+    async def set_if_absent(self, key: str, value: Any, ttl: float) -> bool:
+        if self._live(key) is not None:
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+
+class SQLiteState(SharedState):
+    """SQLiteファイルを使った同一ホスト内の共有ストア"""
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS kv ("
+        "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+    )
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self._path, timeout=10.0, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(self._SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _run(self, fn, *args):
+        with self._lock:
+            conn = self._connection()
+            now = time.time()
+            if now - self._last_purge > 60:
+                conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+                self._last_purge = now
+            return fn(conn, now, *args)
+
+    async def _call(self, fn, *args):
+        return await asyncio.to_thread(self._run, fn, *args)
+
+    @staticmethod
+    def _get(conn: sqlite3.Connection, now: float, key: str) -> Optional[Any]:
+        row = conn.execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, now)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    @staticmethod
+    def _set(conn: sqlite3.Connection, now: float, key: str, value: Any, ttl: Optional[float]) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), now + ttl if ttl else None)
+        )
+
+    @staticmethod
+    def _set_if_absent(conn: sqlite3.Connection, now: float, key: str, value: Any, ttl: float) -> bool:
+        cursor = conn.execute(
+            "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+            "WHERE kv.expires_at IS NOT NULL AND kv.expires_at <= ?",
+            (key, json.dumps(value, ensure_ascii=False), now + ttl, now)
+        )
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, now: float, key: str) -> None:
+        conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    async def get(self, key: str) -> Optional[Any]:
+        return await self._call(self._get, key)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await self._call(self._set, key, value, ttl)
+
+    async def set_if_absent(self, key: str, value: Any, ttl: float) -> bool:
+        return await self._call(self._set_if_absent, key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await self._call(self._delete, key)
+
+    async def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class RedisState(SharedState):
+    """Redisを使った複数ホスト間の共有ストア"""
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("redis package is required for redis:// shared state") from e
+        self._redis = redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self._redis.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        px = int(ttl * 1000) if ttl else None
+        await self._redis.set(key, json.dumps(value, ensure_ascii=False), px=px)
+
+    async def set_if_absent(self, key: str, value: Any, ttl: float) -> bool:
+        result = await self._redis.set(
+            key, json.dumps(value, ensure_ascii=False), px=int(ttl * 1000), nx=True
+        )
+        return bool(result)
+
+    async def delete(self, key: str) -> None:
+        await self._redis.delete(key)
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+def create_shared_state(url: str) -> SharedState:
+    """
+    URLから共有状態ストアを生成
+
+    Raises:
+        ValueError: 未対応のスキーム
+    """
+    parsed = urlparse(url)
+    if parsed.scheme in ("", "memory"):
+        return MemoryState()
+    if parsed.scheme == "sqlite":
+        # sqlite:///相対パス または sqlite:////絶対パス
+        path = Path(parsed.path[1:])
+        return SQLiteState(path if path.is_absolute() else _BASE_DIR / path)
+    if parsed.scheme in ("redis", "rediss"):
+        return RedisState(url)
+    raise ValueError(f"Unsupported shared state URL: {url}")
+
+
+# シングルトンインスタンス
+shared_state = create_shared_state(settings.shared_state_url)
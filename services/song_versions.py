@@ -0,0 +1,157 @@
+"""
+Song Versions - 部分再生成（repaint）による曲のバージョン管理
+
+生成結果を起点（バージョン1）として、区間リペイントで派生した結果を
+同じ曲の新しいバージョンとして記録する。各バージョンは生成結果
+（タスクID + 結果インデックス）と、どのバージョンのどの区間を
+作り直したかを持つ。保存先は生成履歴と同じSQLiteファイル。
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional, List, Dict, Any
+
+from services.history import generation_history
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS song_versions (
+    song_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    task_id TEXT NOT NULL,
+    result_index INTEGER NOT NULL DEFAULT 0,
+    parent_version INTEGER,
+    edit TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (song_id, version)
+);
+CREATE INDEX IF NOT EXISTS song_versions_task ON song_versions(task_id, result_index);
+"""
+
+
+class SongVersions:
+    """曲のバージョン履歴ストア"""
+
+    def __init__(self):
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            path = generation_history.db_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _run(self, fn, *args):
+        with self._lock:
+            return fn(self._connection(), *args)
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        item = dict(row)
+        item["edit"] = json.loads(item["edit"]) if item["edit"] else None
+        return item
+
+    async def find(self, task_id: str, result_index: int = 0) -> Optional[Dict[str, Any]]:
+        """生成結果に対応するバージョン（未登録ならNone）"""
+        return await asyncio.to_thread(self._run, self._find, task_id, result_index)
+
+    def _find(self, conn: sqlite3.Connection, task_id: str, result_index: int) -> Optional[Dict[str, Any]]:
+        row = conn.execute(
+            "SELECT * FROM song_versions WHERE task_id = ? AND result_index = ? "
+            "ORDER BY created_at LIMIT 1",
+            (task_id, result_index)
+        ).fetchone()
+        return self._to_dict(row) if row else None
+
+    async def add_edit(
+        self,
+        source_task_id: str,
+        source_index: int,
+        task_id: str,
+        edit: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        編集結果を新しいバージョンとして記録
+
+        元の生成結果が未登録の場合は、それをバージョン1として新しい曲を作る
+
+        Returns:
+            追加したバージョン
+        """
+        return await asyncio.to_thread(
+            self._run, self._add_edit, source_task_id, source_index, task_id, edit
+        )
+
+    def _add_edit(
+        self,
+        conn: sqlite3.Connection,
+        source_task_id: str,
+        source_index: int,
+        task_id: str,
+        edit: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            parent = self._find(conn, source_task_id, source_index)
+            if parent is None:
+                parent = {"song_id": uuid.uuid4().hex[:16], "version": 1}
+                conn.execute(
+                    "INSERT INTO song_versions (song_id, version, task_id, result_index, created_at) "
+                    "VALUES (?, 1, ?, ?, ?)",
+                    (parent["song_id"], source_task_id, source_index, now)
+                )
+            (latest,) = conn.execute(
+                "SELECT MAX(version) FROM song_versions WHERE song_id = ?", (parent["song_id"],)
+            ).fetchone()
+            version = {
+                "song_id": parent["song_id"],
+                "version": latest + 1,
+                "task_id": task_id,
+                "result_index": 0,
+                "parent_version": parent["version"],
+                "edit": edit,
+                "created_at": now,
+            }
+            conn.execute(
+                "INSERT INTO song_versions (song_id, version, task_id, result_index, parent_version, edit, created_at) "
+                "VALUES (?, ?, ?, 0, ?, ?, ?)",
+                (
+                    version["song_id"], version["version"], task_id,
+                    version["parent_version"], json.dumps(edit, ensure_ascii=False), now
+                )
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return version
+
+    async def list(self, song_id: str) -> List[Dict[str, Any]]:
+        """曲の全バージョン（古い順）"""
+        return await asyncio.to_thread(self._run, self._list, song_id)
+
+    def _list(self, conn: sqlite3.Connection, song_id: str) -> List[Dict[str, Any]]:
+        rows = conn.execute(
+            "SELECT * FROM song_versions WHERE song_id = ? ORDER BY version", (song_id,)
+        ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    async def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# シングルトンインスタンス
+song_versions = SongVersions()
@@ -0,0 +1,201 @@
+"""
+Static Assets - フィンガープリント付き静的ファイル配信
+
+起動時に static/ 配下のファイルの内容ハッシュを計算し、
+`/static/app.<hash>.js` のようなURLで `Cache-Control: immutable` 付きで配信する。
+gzip / brotli 版は事前に圧縮してメモリに保持し、Accept-Encoding に応じて返す。
+index.html も一度だけレンダリングしてキャッシュする。
+"""
+import gzip
+import hashlib
+import mimetypes
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Dict, Mapping
+
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # 任意依存
+    brotli = None
+
+
+# フィンガープリント付きURLのキャッシュ期間（1年）
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# フィンガープリントなしURL・HTMLは毎回再検証
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# これより小さいファイルは圧縮しない
+_MIN_COMPRESS_SIZE = 512
+
+# auto_reload時に static/ を再走査する間隔（秒）
+_RESCAN_INTERVAL = 1.0
+
+
+@dataclass
+class CompressedBody:
+    """圧縮済みバリアントを持つレスポンスボディ"""
+    raw: bytes
+    media_type: str
+    etag: str = ""
+    variants: Dict[str, bytes] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, raw: bytes, media_type: str) -> "CompressedBody":
+        body = cls(raw=raw, media_type=media_type)
+        body.etag = '"' + hashlib.sha256(raw).hexdigest()[:16] + '"'
+        if len(raw) >= _MIN_COMPRESS_SIZE:
+            if brotli is not None:
+                body.variants["br"] = brotli.compress(raw, quality=11)
+            body.variants["gzip"] = gzip.compress(raw, compresslevel=9, mtime=0)
+        return body
+
+    def response(self, request_headers: Mapping[str, str], cache_control: str) -> Response:
+        """Accept-Encoding / If-None-Match に応じたレスポンスを返す"""
+        headers = {
+            "Cache-Control": cache_control,
+            "ETag": self.etag,
+            "Vary": "Accept-Encoding",
+        }
+        if etag_matches(request_headers.get("if-none-match", ""), self.etag):
+            return Response(status_code=304, headers=headers)
+
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and encoding in accepted:
+                headers["Content-Encoding"] = encoding
+                return Response(self.variants[encoding], media_type=self.media_type, headers=headers)
+        return Response(self.raw, media_type=self.media_type, headers=headers)
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match がETagに一致するか（カンマ区切りのリスト・W/ 付き・* に対応した弱い比較）"""
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate and candidate == etag:
+            return True
+    return False
+
+
+def accepted_encodings(header: str) -> set:
+    """Accept-Encoding から受理されるエンコーディングを取り出す（q=0は除外）"""
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        quality = 1.0
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                pass
+        if name and quality > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+class StaticAssets:
+    """static/ 配下のファイルのフィンガープリントと事前圧縮"""
+
+    def __init__(self, directory: Path, auto_reload: bool = False):
+        self.directory = directory
+        self.auto_reload = auto_reload
+        self._assets: Dict[str, CompressedBody] = {}
+        self._fingerprinted: Dict[str, str] = {}  # 配信名 -> 元ファイル名
+        self._urls: Dict[str, str] = {}  # 元ファイル名 -> URL
+        self._mtimes: Dict[str, float] = {}
+        self._last_scan = 0.0
+
+    def build(self) -> None:
+        """全ファイルのハッシュを計算し、圧縮版を生成"""
+        assets: Dict[str, CompressedBody] = {}
+        fingerprinted: Dict[str, str] = {}
+        urls: Dict[str, str] = {}
+        mtimes: Dict[str, float] = {}
+
+        for path in sorted(self.directory.rglob("*")):
+            if not path.is_file():
+                continue
+            name = path.relative_to(self.directory).as_posix()
+            raw = path.read_bytes()
+            media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            if media_type.startswith("text/") or media_type in ("application/javascript", "image/svg+xml"):
+                media_type += "; charset=utf-8"
+
+            digest = hashlib.sha256(raw).hexdigest()[:12]
+            stem, dot, suffix = name.rpartition(".")
+            served_name = f"{stem}.{digest}.{suffix}" if dot else f"{name}.{digest}"
+
+            assets[name] = CompressedBody.build(raw, media_type)
+            fingerprinted[served_name] = name
+            urls[name] = f"/static/{served_name}"
+            mtimes[name] = path.stat().st_mtime
+
+        self._assets = assets
+        self._fingerprinted = fingerprinted
+        self._urls = urls
+        self._mtimes = mtimes
+
+    def _changed(self) -> bool:
+        """開発時用: ファイルの追加・更新を検出"""
+        current = {
+            path.relative_to(self.directory).as_posix(): path.stat().st_mtime
+            for path in self.directory.rglob("*") if path.is_file()
+        }
+        return current != self._mtimes
+
+    def refresh(self) -> bool:
+        """
+        auto_reload時、変更があれば再構築する。再構築した場合はTrue
+
+        リクエストごとにディレクトリ全体を走査しないよう、走査は _RESCAN_INTERVAL 秒に1回
+        """
+        if not self.auto_reload:
+            return False
+        now = time.monotonic()
+        if now - self._last_scan < _RESCAN_INTERVAL:
+            return False
+        self._last_scan = now
+        if self._changed():
+            self.build()
+            return True
+        return False
+
+    def url(self, name: str) -> str:
+        """テンプレート用: 元ファイル名からフィンガープリント付きURLを返す"""
+        return self._urls.get(name, f"/static/{name}")
+
+    def response(self, path: str, request_headers: Mapping[str, str]) -> Response:
+        """/static/{path} のレスポンス"""
+        self.refresh()
+        name = self._fingerprinted.get(path)
+        if name is not None:
+            return self._assets[name].response(request_headers, IMMUTABLE_CACHE_CONTROL)
+        # フィンガープリントなしの旧URLも配信する（再検証必須）
+        asset = self._assets.get(path)
+        if asset is not None:
+            return asset.response(request_headers, REVALIDATE_CACHE_CONTROL)
+        return Response(status_code=404)
+
+
+class CachedPage:
+    """一度だけレンダリングしてキャッシュするHTMLページ"""
+
+    def __init__(self, render):
+        self._render = render
+        self._body: Optional[CompressedBody] = None
+
+    def invalidate(self) -> None:
+        self._body = None
+
+    def response(self, request_headers: Mapping[str, str]) -> Response:
+        if self._body is None:
+            html = self._render()
+            self._body = CompressedBody.build(html.encode("utf-8"), "text/html; charset=utf-8")
+        return self._body.response(request_headers, REVALIDATE_CACHE_CONTROL)
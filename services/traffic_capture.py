@@ -0,0 +1,198 @@
+"""
+Traffic Capture - 本番トラフィックの記録
+
+/api へのリクエストを、ルート・パラメータ・所要時間・クライアントIDとともに
+ローテーションするJSONLファイルへ記録する。記録したトレースは
+scripts/replay_traffic.py で別インスタンスに対して再生できる。
+
+シークレット類は伏せ字にし、クライアントIDはIPアドレスとUser-Agentの
+ハッシュのみを記録する。ファイル書き込みは専用スレッドで行い、
+リクエスト処理をブロックしない。
+"""
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any
+from urllib.parse import parse_qsl
+
+from config import settings
+
+
+_BASE_DIR = Path(__file__).resolve().parent.parent
+
+# 伏せ字にするパラメータ名（部分一致）
+SENSITIVE_KEYS = ("secret", "password", "token", "api_key", "apikey", "authorization")
+
+# 記録するリクエストボディの上限（これを超える・JSON以外は記録しない）
+_MAX_BODY_SIZE = 256 * 1024
+# タスクIDを取り出すために読むレスポンスボディの上限
+_MAX_RESPONSE_SIZE = 64 * 1024
+
+
+def sanitize(value: Any, max_length: int) -> Any:
+    """シークレットを伏せ字にし、長い文字列を切り詰める"""
+    if isinstance(value, dict):
+        return {
+            k: "***" if any(s in k.lower() for s in SENSITIVE_KEYS) else sanitize(v, max_length)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [sanitize(v, max_length) for v in value]
+    if isinstance(value, str) and len(value) > max_length:
+        return value[:max_length]
+    return value
+
+
+def client_id(scope: Dict[str, Any]) -> str:
+    """クライアントの匿名ID（IP + User-Agent のハッシュ）"""
+    headers = dict(scope.get("headers") or [])
+    forwarded = headers.get(b"x-forwarded-for", b"").split(b",")[0].strip()
+    host = forwarded or (scope.get("client") or ("", 0))[0].encode()
+    digest = hashlib.sha256(host + b"|" + headers.get(b"user-agent", b""))
+    return digest.hexdigest()[:12]
+
+
+class TraceWriter:
+    """トレースをローテーションするJSONLファイルへ書き込む"""
+
+    def __init__(self, path: Optional[Path] = None):
+        self._path = path
+        self._queue: Optional[queue.Queue] = None
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        self._logger = logging.getLogger("ace_step.traffic")
+        self._logger.propagate = False
+
+    @property
+    def path(self) -> Path:
+        path = self._path or Path(settings.capture_path)
+        path = path if path.is_absolute() else _BASE_DIR / path
+        if settings.workers > 1:
+            # 複数ワーカーが同じファイルをローテーションしないようプロセス別に分ける
+            path = path.with_name(f"{path.stem}.{os.getpid()}{path.suffix}")
+        return path
+
+    def _start(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            self.path,
+            maxBytes=settings.capture_max_bytes,
+            backupCount=settings.capture_backup_count,
+            encoding="utf-8"
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self._queue = queue.Queue(maxsize=10000)
+        self._listener = logging.handlers.QueueListener(self._queue, handler)
+        self._listener.start()
+        self._logger.addHandler(logging.handlers.QueueHandler(self._queue))
+        self._logger.setLevel(logging.INFO)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        if self._listener is None:
+            self._start()
+        if self._queue.full():
+            return  # 記録が追いつかない場合は捨てる
+        self._logger.info(json.dumps(record, ensure_ascii=False))
+
+    def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.stop()
+            for handler in list(self._logger.handlers):
+                self._logger.removeHandler(handler)
+            self._listener.handlers[0].close()
+            self._listener = None
+
+
+class TrafficCaptureMiddleware:
+    """/api へのリクエストをトレースとして記録するASGIミドルウェア"""
+
+    def __init__(self, app, writer: Optional[TraceWriter] = None, prefix: str = "/api"):
+        self.app = app
+        self.writer = writer or trace_writer
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not scope["path"].startswith(self.prefix)
+            or random.random() >= settings.capture_sample_rate
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        capture_body = headers.get(b"content-type", b"").startswith(b"application/json")
+        body = bytearray()
+        response: Dict[str, Any] = {"status": 0, "body": bytearray(), "json": False}
+        start = time.monotonic()
+
+        async def receive_wrapper():
+            message = await receive()
+            if capture_body and message["type"] == "http.request":
+                body.extend(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                content_type = dict(message.get("headers") or []).get(b"content-type", b"")
+                response["json"] = content_type.startswith(b"application/json")
+            elif message["type"] == "http.response.body" and response["json"]:
+                if len(response["body"]) < _MAX_RESPONSE_SIZE:
+                    response["body"].extend(message.get("body", b""))
+            await send(message)
+
+        error = None
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self._record(scope, bytes(body), response, time.monotonic() - start, error)
+
+    def _record(
+        self,
+        scope: Dict[str, Any],
+        body: bytes,
+        response: Dict[str, Any],
+        duration: float,
+        error: Optional[str]
+    ) -> None:
+        route = scope.get("route")
+        max_length = settings.capture_max_field_length
+        record: Dict[str, Any] = {
+            "ts": round(time.time() - duration, 3),
+            "method": scope["method"],
+            "route": getattr(route, "path", None) or scope["path"],
+            "path": scope["path"],
+            "query": sanitize(dict(parse_qsl(scope.get("query_string", b"").decode("latin-1"))), max_length),
+            "client": client_id(scope),
+            "status": response["status"],
+            "duration_ms": round(duration * 1000, 1),
+        }
+        if body and len(body) <= _MAX_BODY_SIZE:
+            try:
+                record["body"] = sanitize(json.loads(body), max_length)
+            except ValueError:
+                pass
+        if scope["method"] == "POST" and response["json"] and response["body"]:
+            # 再生時に元のタスクIDを新しいタスクIDへ対応付けるため
+            try:
+                data = json.loads(bytes(response["body"]))
+                if isinstance(data, dict) and data.get("task_id"):
+                    record["task_id"] = data["task_id"]
+            except ValueError:
+                pass
+        if error:
+            record["error"] = error
+        self.writer.write(record)
+
+
+# シングルトンインスタンス
+trace_writer = TraceWriter()
@@ -0,0 +1,144 @@
+"""
+Upload Store - 内容アドレス方式の音声アップロード保存
+
+cover / repaint などで使うソース音声を、SHA-256 をファイル名として保存する。
+同じ内容のファイルは一度しか保存されず、クライアントは事前にハッシュで
+存在確認することで再送を省略できる。受信データは逐次ファイルへ書き込み、
+ファイル全体をメモリに載せない。
+"""
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Optional, Dict, Any, AsyncIterator
+
+from config import settings
+
+
+_BASE_DIR = Path(__file__).resolve().parent.parent
+
+# 受け付ける拡張子
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".m4a", ".aac", ".opus")
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# この量がたまったらまとめて書き込む
+_WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+class UploadTooLarge(ValueError):
+    """アップロードサイズが上限を超えた"""
+
+
+class UploadStore:
+    """SHA-256 をキーにした音声ファイルストア"""
+
+    def __init__(self, directory: Optional[Path] = None):
+        self._directory = directory
+
+    @property
+    def directory(self) -> Path:
+        path = self._directory or Path(settings.upload_dir)
+        return path if path.is_absolute() else _BASE_DIR / path
+
+    @staticmethod
+    def is_valid_id(digest: str) -> bool:
+        return bool(_SHA256_RE.match(digest))
+
+    def find(self, digest: str) -> Optional[Path]:
+        """保存済みファイルのパス（なければNone）"""
+        if not self.is_valid_id(digest) or not self.directory.exists():
+            return None
+        for path in self.directory.glob(f"{digest}.*"):
+            return path
+        return None
+
+    def info(self, path: Path) -> Dict[str, Any]:
+        return {
+            "audio_id": path.stem,
+            "size": path.stat().st_size,
+            "format": path.suffix.lstrip("."),
+        }
+
+    def upstream_path(self, digest: str) -> Optional[str]:
+        """
+        release_task の src_audio_path / reference_audio_path に渡すパス
+
+        ACE-Step APIサーバーからは upload_upstream_dir で見える前提
+        （未設定の場合は同一ホストとみなしてローカルの絶対パス）
+        """
+        path = self.find(digest)
+        if path is None:
+            return None
+        if settings.upload_upstream_dir:
+            return f"{settings.upload_upstream_dir.rstrip('/')}/{path.name}"
+        return str(path.resolve())
+
+    async def save(
+        self,
+        chunks: AsyncIterator[bytes],
+        filename: str,
+        expected_sha256: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        ストリームを保存
+
+        Args:
+            chunks: 受信データ
+            filename: 元のファイル名（拡張子の判定に使う）
+            expected_sha256: クライアントが計算したハッシュ（不一致ならエラー）
+
+        Returns:
+            info() に deduplicated（既存ファイルと同一だったか）を加えた辞書
+
+        Raises:
+            ValueError: 未対応の拡張子・ハッシュ不一致
+            UploadTooLarge: サイズ上限超過
+        """
+        suffix = Path(filename).suffix.lower()
+        if suffix not in AUDIO_EXTENSIONS:
+            raise ValueError(f"Unsupported audio format: {suffix or filename}")
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        temp_path = Path(temp_name)
+        hasher = hashlib.sha256()
+        size = 0
+        buffer = bytearray()
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > settings.upload_max_bytes:
+                        raise UploadTooLarge(
+                            f"Upload exceeds {settings.upload_max_bytes} bytes"
+                        )
+                    hasher.update(chunk)
+                    buffer.extend(chunk)
+                    if len(buffer) >= _WRITE_BUFFER_SIZE:
+                        await asyncio.to_thread(f.write, bytes(buffer))
+                        buffer.clear()
+                if buffer:
+                    await asyncio.to_thread(f.write, bytes(buffer))
+
+            digest = hasher.hexdigest()
+            if expected_sha256 and expected_sha256.lower() != digest:
+                raise ValueError("SHA-256 mismatch")
+
+            existing = self.find(digest)
+            if existing is not None:
+                temp_path.unlink()
+                return {**self.info(existing), "deduplicated": True}
+
+            target = self.directory / f"{digest}{suffix}"
+            os.replace(temp_path, target)
+            return {**self.info(target), "deduplicated": False}
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+
+
+# シングルトンインスタンス
+upload_store = UploadStore()
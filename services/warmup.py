@@ -0,0 +1,104 @@
+"""
+Warm-up Service - 起動時・定期的なウォームアップ
+
+LLMモデルのロード、ACE-Step APIへの接続プール確立、/v1/models・/v1/stats の
+事前取得を行い、初回リクエストのコールドスタートをユーザーに負わせない。
+readiness は全コンポーネントのウォームアップ完了後にのみ true になる。
+"""
+import asyncio
+import logging
+import time
+from typing import Optional, Dict, Any, Awaitable, Callable
+
+from config import settings
+from services.ace_step_client import ace_step_client
+from services.llm_service import llm_service
+
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class WarmupService:
+    """ウォームアップとreadiness管理"""
+
+    def __init__(self):
+        self._components: Dict[str, Dict[str, Any]] = {
+            "llm": {"ok": False, "last_run": None, "duration": None, "error": None},
+            "ace_step": {"ok": False, "last_run": None, "duration": None, "error": None},
+        }
+        self._ready = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        """初回ウォームアップが完了しているか（無効時は常にtrue）"""
+        return self._ready or not settings.warmup_enabled
+
+    def status(self) -> Dict[str, Any]:
+        """readinessとコンポーネント別の状態"""
+        return {"ready": self.ready, "components": self._components}
+
+    def start(self) -> None:
+        """バックグラウンドでウォームアップを開始"""
+        if not settings.warmup_enabled or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """バックグラウンドタスクを停止"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        # 初回: 全コンポーネントが成功するまで短い間隔で再試行
+        while not await self.warm_up():
+            await asyncio.sleep(settings.warmup_retry_interval)
+        self._ready = True
+        logger.info("Warm-up completed, ready to serve")
+
+        # 以降: アイドルアンロードを防ぐため定期実行
+        if settings.warmup_interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(settings.warmup_interval)
+            await self.warm_up()
+
+    async def warm_up(self) -> bool:
+        """
+        全コンポーネントを並行してウォームアップ
+
+        Returns:
+            全て成功したか
+        """
+        results = await asyncio.gather(
+            self._warm("llm", llm_service.warm_up),
+            self._warm("ace_step", self._warm_ace_step),
+        )
+        return all(results)
+
+    async def _warm_ace_step(self) -> None:
+        """接続プールを確立し、モデル一覧・統計を事前取得"""
+        await ace_step_client.health_check()
+        await asyncio.gather(
+            ace_step_client.get_models(use_cache=False),
+            ace_step_client.get_stats(),
+        )
+
+    async def _warm(self, name: str, fn: Callable[[], Awaitable[None]]) -> bool:
+        component = self._components[name]
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(fn(), settings.warmup_timeout)
+            component.update(ok=True, error=None)
+        except Exception as e:
+            component.update(ok=False, error=str(e) or type(e).__name__)
+            logger.warning("Warm-up of %s failed: %s", name, component["error"])
+        component["last_run"] = time.time()
+        component["duration"] = round(time.monotonic() - start, 3)
+        return component["ok"]
+
+
+# シングルトンインスタンス
+warmup_service = WarmupService()
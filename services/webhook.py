@@ -0,0 +1,277 @@
+"""
+Webhook Dispatcher - タスク完了時のコールバック通知
+
+登録されたタスクを1つのポーリングループでまとめて監視し、完了したら
+コールバックURLへ結果をPOSTする。配信は上限付きキューで行い、失敗時は
+指数バックオフで再試行する。
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Any, Set
+
+import httpx
+
+from config import settings
+from services.ace_step_client import ace_step_client, AceStepClient, TaskStatus, parse_task_id
+from services.history import generation_history
+
+
+logger = logging.getLogger("uvicorn.error")
+
+# 署名ヘッダー
+SIGNATURE_HEADER = "X-AceStep-Signature"
+TIMESTAMP_HEADER = "X-AceStep-Timestamp"
+DELIVERY_HEADER = "X-AceStep-Delivery"
+
+
+class WebhookQueueFull(Exception):
+    """監視中タスク数が上限に達している"""
+
+
+@dataclass
+class _Subscription:
+    """コールバック登録"""
+    task_id: str
+    url: str
+    secret: Optional[str]
+    registered_at: float = field(default_factory=time.time)
+
+
+@dataclass
+class _Delivery:
+    """配信ジョブ"""
+    subscription: _Subscription
+    payload: Dict[str, Any]
+    delivery_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    attempt: int = 0
+
+
+def sign_payload(secret: str, timestamp: str, body: bytes) -> str:
+    """
+    ペイロードのHMAC-SHA256署名を計算
+
+    署名対象は "{timestamp}.{body}"。受信側は同じ計算で検証できる。
+    """
+    message = timestamp.encode("utf-8") + b"." + body
+    digest = hmac.new(secret.encode("utf-8"), message, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+
+class WebhookDispatcher:
+    """タスク完了を監視してWebhookを配信する"""
+
+    def __init__(self, client: AceStepClient = None):
+        self._client = client or ace_step_client
+        self._subscriptions: Dict[str, _Subscription] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._retries: Set[asyncio.Task] = set()
+        self._http: Optional[httpx.AsyncClient] = None
+
+    @property
+    def is_full(self) -> bool:
+        """監視中タスク数が上限に達しているか"""
+        return len(self._subscriptions) >= settings.webhook_max_pending
+
+    def watch(self, task_id: str, url: str, secret: Optional[str] = None) -> None:
+        """
+        タスクをWebhook監視に登録
+
+        Raises:
+            ValueError: URLがhttp(s)でない
+            WebhookQueueFull: 監視中タスク数が上限に達している
+        """
+        if not url.startswith(("http://", "https://")):
+            raise ValueError("callback_url must be an http(s) URL")
+        if self.is_full:
+            raise WebhookQueueFull("Too many pending webhook tasks")
+
+        self._ensure_started()
+        self._subscriptions[task_id] = _Subscription(task_id=task_id, url=url, secret=secret)
+
+    def _ensure_started(self) -> None:
+        """ポーリングループと配信ワーカーを起動（初回のみ）"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=settings.webhook_queue_size)
+        self._http = httpx.AsyncClient(timeout=settings.webhook_timeout)
+        self._tasks.append(asyncio.create_task(self._poll_loop()))
+        for _ in range(max(1, settings.webhook_workers)):
+            self._tasks.append(asyncio.create_task(self._delivery_worker()))
+
+    async def stop(self) -> None:
+        """バックグラウンドタスクを停止"""
+        for task in [*self._tasks, *self._retries]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._retries, return_exceptions=True)
+        self._tasks.clear()
+        self._retries.clear()
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    # -------------------------------------------------------------------------
+    # Polling
+    # -------------------------------------------------------------------------
+
+    async def _poll_loop(self) -> None:
+        """監視中タスクの状態をまとめてクエリ"""
+        while True:
+            await asyncio.sleep(settings.poll_interval)
+            if not self._subscriptions:
+                continue
+            try:
+                await self._poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Webhook poll failed: %s", e)
+
+    async def _poll_once(self) -> None:
+        """1回分のポーリング"""
+        now = time.time()
+        by_upstream: Dict[str, List[_Subscription]] = {}
+        for sub in list(self._subscriptions.values()):
+            if now - sub.registered_at > settings.poll_timeout:
+                self._complete(sub, {
+                    "task_id": sub.task_id,
+                    "status": TaskStatus.FAILED.value,
+                    "status_text": "failed",
+                    "results": None,
+                    "error": f"Task {sub.task_id} timed out after {settings.poll_timeout} seconds",
+                })
+                continue
+            if await self._client.is_abandoned(sub.task_id):
+                self._complete(sub, {
+                    "task_id": sub.task_id,
+                    "status": TaskStatus.FAILED.value,
+                    "status_text": "cancelled",
+                    "results": None,
+                    "error": "Task was cancelled",
+                })
+                continue
+            upstream_task_id, _ = parse_task_id(sub.task_id)
+            by_upstream.setdefault(upstream_task_id, []).append(sub)
+
+        if not by_upstream:
+            return
+
+        result = await self._client.query_result(list(by_upstream))
+        if result.get("code") != 200:
+            raise Exception(f"API error: {result.get('error')}")
+
+        for task_data in result.get("data", []):
+            status = task_data.get("status", 0)
+            if status == TaskStatus.PROCESSING.value:
+                continue
+            for sub in by_upstream.get(task_data.get("task_id"), []):
+                self._complete(sub, self._build_payload(sub, task_data))
+
+    def _build_payload(self, sub: _Subscription, task_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Webhookペイロードを構築（/api/status と同じ形式）"""
+        status = task_data.get("status", 0)
+        if status == TaskStatus.SUCCEEDED.value:
+            _, result_slice = parse_task_id(sub.task_id)
+            results = self._client.parse_results(task_data, result_slice)
+            generation_history.record(sub.task_id, results)
+            return {
+                "task_id": sub.task_id,
+                "status": status,
+                "status_text": "succeeded",
+                "results": results,
+                "error": None,
+            }
+        return {
+            "task_id": sub.task_id,
+            "status": status,
+            "status_text": "failed",
+            "results": None,
+            "error": task_data.get("result", "Unknown error"),
+        }
+
+    def _complete(self, sub: _Subscription, payload: Dict[str, Any]) -> None:
+        """監視を終了し配信キューへ投入"""
+        self._subscriptions.pop(sub.task_id, None)
+        self._enqueue(_Delivery(subscription=sub, payload=payload))
+
+    def _enqueue(self, delivery: _Delivery) -> None:
+        """配信キューへ投入（満杯の場合は破棄）"""
+        try:
+            self._queue.put_nowait(delivery)
+        except asyncio.QueueFull:
+            logger.warning(
+                "Webhook queue full, dropping delivery for task %s",
+                delivery.subscription.task_id,
+            )
+
+    # -------------------------------------------------------------------------
+    # Delivery
+    # -------------------------------------------------------------------------
+
+    async def _delivery_worker(self) -> None:
+        """配信キューを処理"""
+        while True:
+            delivery = await self._queue.get()
+            try:
+                await self._deliver(delivery)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Webhook delivery error: %s", e)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, delivery: _Delivery) -> None:
+        """1回分の配信。失敗時は再試行をスケジュール"""
+        sub = delivery.subscription
+        delivery.attempt += 1
+
+        body = json.dumps(delivery.payload, ensure_ascii=False).encode("utf-8")
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            TIMESTAMP_HEADER: timestamp,
+            DELIVERY_HEADER: delivery.delivery_id,
+        }
+        if sub.secret:
+            headers[SIGNATURE_HEADER] = sign_payload(sub.secret, timestamp, body)
+
+        retryable = True
+        try:
+            response = await self._http.post(sub.url, content=body, headers=headers)
+            if response.is_success:
+                return
+            # 4xxはリクエストタイムアウト/レート制限以外は再試行しない
+            retryable = response.status_code >= 500 or response.status_code in (408, 429)
+            error = f"HTTP {response.status_code}"
+        except httpx.HTTPError as e:
+            error = str(e)
+
+        if not retryable or delivery.attempt >= settings.webhook_max_attempts:
+            logger.warning(
+                "Webhook delivery to %s for task %s failed after %d attempt(s): %s",
+                sub.url, sub.task_id, delivery.attempt, error,
+            )
+            return
+
+        delay = settings.webhook_backoff_base * (2 ** (delivery.attempt - 1))
+        delay *= random.uniform(0.5, 1.5)
+        task = asyncio.create_task(self._retry_later(delivery, delay))
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _retry_later(self, delivery: _Delivery, delay: float) -> None:
+        """バックオフ後に再投入"""
+        await asyncio.sleep(delay)
+        self._enqueue(delivery)
+
+
+# シングルトンインスタンス
+webhook_dispatcher = WebhookDispatcher()
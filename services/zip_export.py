@@ -0,0 +1,162 @@
+"""
+ZIP Export - 生成結果をZIPアーカイブとしてストリーミング出力
+
+音声は無圧縮（ZIP_STORED）で格納し、上流から受信したチャンクをそのまま
+アーカイブのバイト列として送り出す。ファイル全体やアーカイブ全体をメモリに
+保持しないため、アーカイブのサイズにかかわらずメモリ使用量は一定。
+
+回線を遊ばせないよう、書き出し中のファイルの後ろで最大 export_concurrency 件の
+取得を先行させる。先行分は件数あたり export_buffer_chunks チャンクまでしか
+ためないため、メモリの上限は concurrency × buffer_chunks × chunk_size になる。
+"""
+import asyncio
+import io
+import time
+import zipfile
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Any, AsyncIterator, Deque
+from collections import deque
+
+import httpx
+
+from config import settings
+from services import fast_json
+from services.ace_step_client import ace_step_client
+
+
+_CHUNK_SIZE = 64 * 1024
+
+_END = object()
+
+
+@dataclass
+class ExportEntry:
+    """アーカイブに格納する1ファイル"""
+    name: str  # アーカイブ内のファイル名
+    path: str  # 上流サーバー上のファイルパス
+    metadata: Dict[str, Any] = field(default_factory=dict)  # マニフェストに載せる情報
+
+
+class _Sink(io.RawIOBase):
+    """zipfile の出力先（書き込まれたバイト列を取り出すまで保持する）"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class _Fetch:
+    """1ファイルの先行取得（有界キューにチャンクをためる）"""
+
+    def __init__(self, entry: ExportEntry):
+        self.entry = entry
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.export_buffer_chunks)
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        try:
+            async with ace_step_client.stream_audio(self.entry.path) as response:
+                async for chunk in response.aiter_bytes(_CHUNK_SIZE):
+                    await self.queue.put(chunk)
+            await self.queue.put(_END)
+        except Exception as e:
+            await self.queue.put(e)
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """受信したチャンク（取得失敗時は例外）"""
+        while True:
+            item = await self.queue.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+def _describe(error: Exception) -> str:
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"upstream returned {error.response.status_code}"
+    return str(error) or type(error).__name__
+
+
+async def stream_zip(
+    entries: List[ExportEntry],
+    manifest: Dict[str, Any]
+) -> AsyncIterator[bytes]:
+    """
+    ZIPアーカイブのバイト列を生成
+
+    最後に manifest.json を格納する。各ファイルの size / error はマニフェストの
+    files に追記される（取得に失敗したファイルはアーカイブに含まれない）
+
+    Args:
+        entries: 格納するファイル
+        manifest: マニフェストの内容（files 以外）
+    """
+    sink = _Sink()
+    archive = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED)
+    pending: Deque[_Fetch] = deque()
+    remaining = deque(entries)
+    files: List[Dict[str, Any]] = []
+
+    def fill() -> None:
+        while remaining and len(pending) < settings.export_concurrency:
+            pending.append(_Fetch(remaining.popleft()))
+
+    current: Optional[_Fetch] = None
+    try:
+        fill()
+        while pending:
+            current = fetch = pending.popleft()
+            fill()
+            record = {"name": fetch.entry.name, **fetch.entry.metadata}
+            size = 0
+            chunks = fetch.chunks()
+            try:
+                # 最初のチャンクが届くまでエントリを作らない（取得失敗時に空ファイルを残さない）
+                first = await chunks.__anext__()
+            except StopAsyncIteration:
+                first = b""
+            except Exception as e:
+                record["error"] = _describe(e)
+                files.append(record)
+                continue
+
+            info = zipfile.ZipInfo(fetch.entry.name, date_time=time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            with archive.open(info, mode="w") as f:
+                f.write(first)
+                size += len(first)
+                yield sink.drain()
+                try:
+                    async for chunk in chunks:
+                        f.write(chunk)
+                        size += len(chunk)
+                        # 格納形式は無圧縮なので、書いた分がそのまま出力される
+                        yield sink.drain()
+                except Exception as e:
+                    # 途中で切れた場合は受信済みの分だけ格納し、マニフェストに記録する
+                    record["error"] = f"truncated: {_describe(e)}"
+            record["size"] = size
+            files.append(record)
+            yield sink.drain()
+
+        manifest = {**manifest, "files": files}
+        archive.writestr("manifest.json", fast_json.dumps(manifest))
+        archive.close()
+        yield sink.drain()
+    finally:
+        for fetch in (current, *pending):
+            if fetch is not None:
+                fetch.task.cancel()